@@ -1,4 +1,4 @@
-from django.contrib.admin import register
+from django.contrib.admin import register, StackedInline
 
 from helper.admin import BaseAdminModel
 from .models import *
@@ -6,18 +6,50 @@ from .models import *
 
 @register(RSSFeed)
 class RSSFeedAdmin(BaseAdminModel):
-    list_display = ('title', 'feed_url')
+    list_display = ('title', 'feed_url', 'retention_days')
     list_filter = ('is_active',)
 
 
+@register(RSSFeedAlias)
+class RSSFeedAliasAdmin(BaseAdminModel):
+    list_display = ('feed_url', 'feed')
+
+
+@register(RSSFeedRegistration)
+class RSSFeedRegistrationAdmin(BaseAdminModel):
+    list_display = ('feed_url', 'status', 'rss_feed')
+    list_filter = ('status',)
+
+
+@register(WebSubSubscription)
+class WebSubSubscriptionAdmin(BaseAdminModel):
+    list_display = ('feed', 'hub_url', 'is_verified', 'lease_expires', 'last_push')
+    list_filter = ('is_verified',)
+
+
 @register(RSSFeedFollower)
 class RSSFeedFollowerAdmin(BaseAdminModel):
     list_display = ('user', 'feed')
 
 
+class EntryContentInline(StackedInline):
+    model = EntryContent
+
+
 @register(Entry)
 class EntryAdmin(BaseAdminModel):
     list_display = ('title', 'url')
+    inlines = (EntryContentInline,)
+
+
+@register(ArchivedEntry)
+class ArchivedEntryAdmin(BaseAdminModel):
+    list_display = ('title', 'feed', 'publish_date')
+
+
+@register(TimelineInbox)
+class TimelineInboxAdmin(BaseAdminModel):
+    list_display = ('user', 'max_length')
 
 
 @register(SeenEntry)
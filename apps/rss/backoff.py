@@ -0,0 +1,78 @@
+import random
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+SUCCESS = "success"
+TRANSIENT = "transient"  # the host may answer next time: no response, timeouts, throttling and server errors
+PERMANENT = "permanent"  # the feed is broken: client errors and documents that are not feeds
+GONE = "gone"  # the feed was removed on purpose
+
+
+def classify(feed_parser) -> str:
+    """
+    Classify the result of fetching a feed, `status` is missing when no response was received
+    """
+    status = getattr(feed_parser, 'status', None)
+    if status is None:
+        return TRANSIENT
+    if status == 410:
+        return GONE
+    if 400 <= status < 500 and status not in (408, 429):
+        return PERMANENT
+    if status != 200 and not 300 <= status < 400:  # feedparser follows redirects and keeps their status
+        return TRANSIENT
+    if not feed_parser.get('version'):
+        return PERMANENT  # the document could not be parsed as a feed
+    return SUCCESS
+
+
+def calculate_delay(number_of_errors) -> timedelta:
+    """
+    Exponential backoff with jitter, the base delay doubles with every error up to FEED_BACKOFF_MAX_HOURS.
+    Half of the delay is random so feeds which fail together are not retried together
+    """
+    hours = min(2 ** max(number_of_errors - 1, 0), settings.FEED_BACKOFF_MAX_HOURS)
+    return timedelta(hours=hours / 2 + random.uniform(0, hours / 2))
+
+
+class HostCircuitBreaker:
+    """
+    Stops fetching feeds of a host for a cooldown once its feeds fail with transient errors one after another,
+    so a host which is down does not cost a request per feed. State is kept in the cache, shared by workers
+    """
+    FAILURES_KEY = 'rss:circuit-breaker:{host}:failures'
+    OPEN_UNTIL_KEY = 'rss:circuit-breaker:{host}:open-until'
+
+    def __init__(self, feed_url):
+        self.host = urlparse(feed_url).hostname or ''
+
+    def open_until(self):
+        """
+        Returns the time fetching is allowed again while the breaker is open, otherwise None
+        """
+        open_until = cache.get(self.OPEN_UNTIL_KEY.format(host=self.host))
+        if open_until and open_until > timezone.now():
+            return open_until
+        return None
+
+    def record_failure(self):
+        failures_key = self.FAILURES_KEY.format(host=self.host)
+        cache.add(failures_key, 0, settings.HOST_CIRCUIT_BREAKER_COOLDOWN)
+        try:
+            failures = cache.incr(failures_key)
+        except ValueError:  # expired between add and incr
+            failures = 1
+            cache.set(failures_key, failures, settings.HOST_CIRCUIT_BREAKER_COOLDOWN)
+        if failures >= settings.HOST_CIRCUIT_BREAKER_THRESHOLD:
+            cooldown = settings.HOST_CIRCUIT_BREAKER_COOLDOWN
+            cache.set(
+                self.OPEN_UNTIL_KEY.format(host=self.host), timezone.now() + timedelta(seconds=cooldown), cooldown
+            )
+            cache.delete(failures_key)
+
+    def record_success(self):
+        cache.delete(self.FAILURES_KEY.format(host=self.host))
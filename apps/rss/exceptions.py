@@ -3,3 +3,10 @@ class InvalidFeedURL(Exception):
 
     def __init__(self, message=None, *args, **kwargs):
         self.message = message if message else self.default_message
+
+
+class InvalidOPML(Exception):
+    default_message = 'OPML file is invalid'
+
+    def __init__(self, message=None, *args, **kwargs):
+        self.message = message if message else self.default_message
@@ -1,6 +1,7 @@
 import django_filters
+from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import RSSFeed, RSSFeedFollower, Entry, BookmarkedEntry, FavouritedEntry, SeenEntry
+from .models import RSSFeed, RSSFeedFollower, Entry, InboxEntry, BookmarkedEntry, FavouritedEntry, SeenEntry
 
 
 class RSSFeedFilter(django_filters.FilterSet):
@@ -14,14 +15,23 @@ class RSSFeedFilter(django_filters.FilterSet):
         return queryset.filter(id__in=RSSFeedFollower.objects.filter(user=self.request.user).values_list('feed_id', flat=True))
 
 
-class EntryFilter(django_filters.FilterSet):
+class CollapseDuplicatesFilterMixin(django_filters.FilterSet):
+    collapse_duplicates = django_filters.BooleanFilter(method='get_collapse_duplicates')
+
+    def get_collapse_duplicates(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.exclude(canonical__in=queryset.values('id'))
+
+
+class EntryFilter(CollapseDuplicatesFilterMixin):
     is_bookmarked = django_filters.BooleanFilter(method='get_is_bookmarked')
     is_favourited = django_filters.BooleanFilter(method='get_is_favourited')
     is_seen = django_filters.BooleanFilter(method='get_is_seen')
 
     class Meta:
         model = Entry
-        fields = ('is_bookmarked', 'is_favourited', 'is_seen', 'feed_id')
+        fields = ('is_bookmarked', 'is_favourited', 'is_seen', 'feed_id', 'collapse_duplicates')
 
     def get_is_bookmarked(self, queryset, name, value):
         return queryset.filter(id__in=BookmarkedEntry.objects.filter(user=self.request.user).values_list('entry_id', flat=True))
@@ -31,3 +41,41 @@ class EntryFilter(django_filters.FilterSet):
 
     def get_is_seen(self, queryset, name, value):
         return queryset.filter(id__in=SeenEntry.objects.filter(user=self.request.user).values_list('entry_id', flat=True))
+
+
+class TimelineFilter(CollapseDuplicatesFilterMixin):
+    exclude_seen = django_filters.BooleanFilter(method='get_exclude_seen')
+    entry_id_field = 'id'
+
+    class Meta:
+        model = Entry
+        fields = ('exclude_seen', 'collapse_duplicates')
+
+    def get_exclude_seen(self, queryset, name, value):
+        if not value:
+            return queryset
+        seen_entry_ids = SeenEntry.objects.filter(user=self.request.user).values_list('entry_id', flat=True)
+        return queryset.exclude(**{f'{self.entry_id_field}__in': seen_entry_ids})
+
+
+class InboxTimelineFilter(TimelineFilter):
+    """
+    Timeline filters for users with an inbox, their timeline is a queryset of InboxEntry
+    """
+    entry_id_field = 'entry_id'
+
+    class Meta:
+        model = InboxEntry
+        fields = ('exclude_seen', 'collapse_duplicates')
+
+    def get_collapse_duplicates(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.exclude(entry__canonical__in=queryset.values('entry_id'))
+
+
+class TimelineFilterBackend(DjangoFilterBackend):
+    def get_filterset_class(self, view, queryset=None):
+        if queryset is not None and queryset.model is InboxEntry:
+            return InboxTimelineFilter
+        return super().get_filterset_class(view, queryset)
@@ -0,0 +1,42 @@
+import hashlib
+import re
+
+from django.utils.html import strip_tags
+
+from helper.url import canonicalize_url
+
+HASH_BITS = 64
+SHINGLE_SIZE = 3  # words
+WORD_RE = re.compile(r'\w+')
+
+
+def url_fingerprint(url) -> str:
+    """
+    Fingerprint of the canonical form of an entry URL, copies of an article share it even when the URLs differ
+    in scheme, trailing slash or tracking params
+    """
+    if not url:
+        return ''
+    return hashlib.sha1(canonicalize_url(url).encode()).hexdigest()
+
+
+def simhash(content):
+    """
+    64 bit SimHash of the words of the content, near-duplicate texts get hashes a few bits apart.
+    The hash is signed so it fits a bigint column, None when the content has no words
+    """
+    words = WORD_RE.findall(strip_tags(content).lower())
+    if not words:
+        return None
+    weights = [0] * HASH_BITS
+    for index in range(max(len(words) - SHINGLE_SIZE + 1, 1)):
+        shingle = ' '.join(words[index:index + SHINGLE_SIZE])
+        shingle_hash = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=HASH_BITS // 8).digest(), 'big')
+        for bit in range(HASH_BITS):
+            weights[bit] += 1 if shingle_hash >> bit & 1 else -1
+    value = sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def hamming_distance(first_hash, second_hash) -> int:
+    return bin((first_hash ^ second_hash) & ((1 << HASH_BITS) - 1)).count('1')
@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate
+
+from django.core.management.base import BaseCommand
+
+from apps.rss.parsing import parse
+
+HEADERS = {'content-type': 'application/rss+xml; charset=utf-8'}
+
+
+class Command(BaseCommand):
+    help = "Compare parsing a synthetic corpus of feeds in one process with parsing it in a pool of processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--feeds', type=int, default=500, help="number of feeds of the corpus")
+        parser.add_argument('--entries', type=int, default=50, help="number of entries of each feed")
+        parser.add_argument('--pool-size', type=int, default=os.cpu_count(), help="number of parse processes")
+
+    def handle(self, *args, **options):
+        corpus = [self.generate_feed(index, options['entries']) for index in range(options['feeds'])]
+        size = sum(len(body) for body in corpus) / 1024 / 1024
+        self.stdout.write(f"{options['feeds']} feeds, {options['entries']} entries each, {size:.1f} MB")
+
+        hrefs = [f'https://example.com/{index}.xml' for index in range(len(corpus))]
+        headers = [HEADERS] * len(corpus)
+
+        started = time.perf_counter()
+        for body, href in zip(corpus, hrefs):
+            parse(body, HEADERS, href)
+        single_process = time.perf_counter() - started
+        self.stdout.write(f"single process: {single_process:.2f}s")
+
+        pool_size = options['pool_size']
+        with ProcessPoolExecutor(pool_size, mp_context=multiprocessing.get_context('spawn')) as executor:
+            list(executor.map(parse, corpus[:pool_size], headers, hrefs))  # start the processes before timing
+            started = time.perf_counter()
+            list(executor.map(parse, corpus, headers, hrefs, chunksize=max(len(corpus) // (pool_size * 4), 1)))
+            pool = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"{pool_size} processes: {pool:.2f}s, {single_process / pool:.1f}x faster")
+        )
+
+    @staticmethod
+    def generate_feed(index, number_of_entries) -> bytes:
+        items = ''.join(
+            f'''
+            <item>
+                <title>Entry {entry} of feed {index}</title>
+                <link>https://example.com/{index}/entries/{entry}</link>
+                <guid>https://example.com/{index}/entries/{entry}</guid>
+                <pubDate>{formatdate(1600000000 + entry * 3600, usegmt=True)}</pubDate>
+                <description>&lt;p&gt;{'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 20}&lt;/p&gt;
+                &lt;p&gt;&lt;a href="https://example.com/{index}/entries/{entry}"&gt;Read more&lt;/a&gt;&lt;/p&gt;
+                </description>
+            </item>'''
+            for entry in range(number_of_entries)
+        )
+        return f'''<?xml version="1.0" encoding="utf-8"?>
+        <rss version="2.0">
+        <channel>
+            <title>Feed {index}</title>
+            <link>https://example.com/{index}</link>
+            <description>Synthetic feed {index}</description>{items}
+        </channel>
+        </rss>'''.encode()
@@ -0,0 +1,51 @@
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# what a process of each profile imports before it serves its first request or task
+ENTRY_POINTS = {
+    'web': "import rss_reader.wsgi; from django.urls import get_resolver; get_resolver().url_patterns",
+    'worker': "from rss_reader.celery import app; app.loader.import_default_modules()",
+}
+API_MODULES = ('drf_yasg', 'rest_framework', 'django_filters', 'rest_framework_simplejwt', 'apps.rss.views')
+PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "{entry_point}\n"
+    "print(time.perf_counter() - started, len(sys.modules), ','.join(m for m in {api_modules} if m in sys.modules))\n"
+)
+
+
+def measure_startup(profile):
+    """
+    Import the entry point of the profile in a fresh interpreter, returns the seconds it took, the number of
+    loaded modules and the API modules which were loaded
+    """
+    env = {**os.environ, 'DJANGO_PROCESS_PROFILE': profile}
+    env.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+    code = PROBE.format(entry_point=ENTRY_POINTS[profile], api_modules=API_MODULES)
+    output = subprocess.run(
+        [sys.executable, '-c', code], env=env, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+    ).stdout.split()
+    seconds, modules = float(output[0]), int(output[1])
+    return seconds, modules, output[2].split(',') if len(output) > 2 else []
+
+
+class Command(BaseCommand):
+    help = "Compare the import time of the web and the worker entry points, each run starts a new interpreter"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="runs of each entry point, the median is reported")
+
+    def handle(self, *args, **options):
+        for profile in ENTRY_POINTS:
+            results = [measure_startup(profile) for _ in range(options['runs'])]
+            seconds = statistics.median(result[0] for result in results)
+            _, modules, api_modules = results[-1]
+            self.stdout.write(
+                f"{profile}: {seconds:.3f}s, {modules} modules, API modules: {', '.join(api_modules) or 'none'}"
+            )
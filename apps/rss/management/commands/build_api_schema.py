@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from rss_reader.urls import schema_view
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema and store it in the cache, run it on every deploy so the docs match the code"
+
+    def handle(self, *args, **options):
+        documents = schema_view.get_generator().build()
+        for codec, (etag, content) in documents.items():
+            self.stdout.write(self.style.SUCCESS(f"{codec}: {len(content)} bytes, ETag {etag}"))
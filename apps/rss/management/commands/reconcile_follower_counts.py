@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.rss.services import RSSFeedFollowService
+
+
+class Command(BaseCommand):
+    help = "Recount the followers of feeds whose follower count drifted, e.g. after users were deleted"
+
+    def handle(self, *args, **options):
+        fixed = RSSFeedFollowService().reconcile_follower_counts()
+        self.stdout.write(self.style.SUCCESS(f"Follower counts of {fixed} feeds fixed"))
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:09
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebSubSubscription',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('create_time', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('modify_time', models.DateTimeField(auto_now=True)),
+                ('hub_url', models.TextField(help_text='Hub that the feed advertises', validators=[django.core.validators.URLValidator()])),
+                ('topic_url', models.TextField(help_text='Topic URL that the hub publishes', validators=[django.core.validators.URLValidator()])),
+                ('secret', models.CharField(help_text='Shared secret the hub signs pushed content with', max_length=64)),
+                ('is_verified', models.BooleanField(default=False, help_text='The hub has verified the subscription')),
+                ('lease_expires', models.DateTimeField(blank=True, help_text='When the hub will drop the subscription', null=True)),
+                ('last_push', models.DateTimeField(blank=True, help_text='Last time the hub pushed content', null=True)),
+                ('feed', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='websub_subscription', to='rss.rssfeed')),
+            ],
+            options={
+                'verbose_name': 'WebSub subscription',
+                'verbose_name_plural': 'WebSub subscriptions',
+                'ordering': ('-create_time',),
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:10
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0002_websub_subscription'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RSSFeedRegistration',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('create_time', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('modify_time', models.DateTimeField(auto_now=True)),
+                ('feed_url', models.TextField(help_text='Requested link of the feed', unique=True, validators=[django.core.validators.URLValidator()])),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('created', 'Created'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('message', models.TextField(blank=True, help_text='Reason of failure')),
+                ('rss_feed', models.ForeignKey(blank=True, help_text='Created feed', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='registrations', to='rss.rssfeed')),
+            ],
+            options={
+                'verbose_name': 'RSS Feed registration',
+                'verbose_name_plural': 'RSS Feed registrations',
+                'ordering': ('-create_time',),
+            },
+        ),
+    ]
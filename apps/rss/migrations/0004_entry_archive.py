@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0003_rss_feed_registration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rssfeed',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, help_text='Days entries are kept before archiving, ENTRY_RETENTION_DAYS setting when empty', null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('create_time', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('modify_time', models.DateTimeField(auto_now=True)),
+                ('title', models.CharField(help_text='Title of the feed', max_length=150)),
+                ('url', models.TextField(blank=True, help_text='URL for the HTML for this entry', null=True)),
+                ('guid', models.TextField(blank=True, help_text='GUID for the entry, according to the feed', null=True)),
+                ('compressed_content', models.BinaryField(help_text='zlib compressed description of entry')),
+                ('publish_date', models.DateTimeField(blank=True, db_index=True, help_text='when this entry says it was published', null=True)),
+                ('feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_entries', to='rss.rssfeed')),
+            ],
+            options={
+                'verbose_name': 'Archived entry',
+                'verbose_name_plural': 'Archived entries',
+                'ordering': ('-publish_date', '-create_time'),
+            },
+        ),
+    ]
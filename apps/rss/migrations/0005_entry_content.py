@@ -0,0 +1,56 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+BATCH_SIZE = 1000
+
+
+def move_content(apps, schema_editor):
+    Entry = apps.get_model('rss', 'Entry')
+    EntryContent = apps.get_model('rss', 'EntryContent')
+    entries = Entry.objects.filter(body__isnull=True).only('id', 'content').order_by()
+    while True:
+        batch = list(entries[:BATCH_SIZE])
+        if not batch:
+            break
+        for entry in batch:
+            entry.summary = Truncator(strip_tags(entry.content)).chars(300)
+        Entry.objects.bulk_update(batch, ['summary'])
+        EntryContent.objects.bulk_create([EntryContent(entry_id=entry.id, content=entry.content) for entry in batch])
+
+
+def restore_content(apps, schema_editor):
+    Entry = apps.get_model('rss', 'Entry')
+    EntryContent = apps.get_model('rss', 'EntryContent')
+    for entry_content in EntryContent.objects.iterator(chunk_size=BATCH_SIZE):
+        Entry.objects.filter(id=entry_content.entry_id).update(content=entry_content.content)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0004_entry_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntryContent',
+            fields=[
+                ('entry', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='body', serialize=False, to='rss.entry')),
+                ('content', models.TextField(blank=True, help_text='description of entry')),
+            ],
+            options={
+                'verbose_name': 'Entry content',
+                'verbose_name_plural': 'Entry contents',
+            },
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='summary',
+            field=models.CharField(blank=True, help_text='Truncated plain text description of entry', max_length=300),
+        ),
+        migrations.RunPython(move_content, restore_content),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0005_entry_content'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='entry',
+            name='content',
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:14
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_publish_date(apps, schema_editor):
+    Entry = apps.get_model('rss', 'Entry')
+    Entry.objects.filter(publish_date__isnull=True).update(publish_date=F('create_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0006_remove_entry_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_publish_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['feed', '-publish_date', '-id'], name='entry_feed_timeline_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rss', '0007_entry_timeline_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineInbox',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('create_time', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('modify_time', models.DateTimeField(auto_now=True)),
+                ('max_length', models.PositiveIntegerField(default=1000, help_text='Older entries are dropped from the inbox')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_inbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Timeline inbox',
+                'verbose_name_plural': 'Timeline inboxes',
+                'ordering': ('-create_time',),
+            },
+        ),
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('publish_date', models.DateTimeField(help_text='Copy of entry publish date, the timeline is read in this order')),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='rss.entry')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Inbox entry',
+                'verbose_name_plural': 'Inbox entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['user', '-publish_date', '-entry'], name='inbox_entry_timeline_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxentry',
+            constraint=models.UniqueConstraint(fields=('user', 'entry'), name='unique_inbox_entry'),
+        ),
+    ]
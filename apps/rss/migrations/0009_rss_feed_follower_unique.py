@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:19
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_followers(apps, schema_editor):
+    RSSFeedFollower = apps.get_model('rss', 'RSSFeedFollower')
+    duplicates = (
+        RSSFeedFollower.objects.values('user_id', 'feed_id')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        followers = RSSFeedFollower.objects.filter(user_id=duplicate['user_id'], feed_id=duplicate['feed_id'])
+        kept_id = followers.order_by('create_time', 'id').values_list('id', flat=True).first()
+        followers.exclude(id=kept_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rss', '0008_timeline_inbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_followers, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='rssfeedregistration',
+            name='followers',
+            field=models.ManyToManyField(blank=True, help_text='Users who follow the feed once it is created', related_name='feed_registrations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='rssfeedfollower',
+            constraint=models.UniqueConstraint(fields=('user', 'feed'), name='unique_rss_feed_follower'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicates(apps, schema_editor):
+    for model_name in ('SeenEntry', 'FavouritedEntry', 'BookmarkedEntry'):
+        model = apps.get_model('rss', model_name)
+        duplicates = (
+            model.objects.values('user_id', 'entry_id')
+            .annotate(count=Count('id'))
+            .filter(count__gt=1)
+        )
+        for duplicate in duplicates:
+            rows = model.objects.filter(user_id=duplicate['user_id'], entry_id=duplicate['entry_id'])
+            kept_id = rows.order_by('create_time', 'id').values_list('id', flat=True).first()
+            rows.exclude(id=kept_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0009_rss_feed_follower_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bookmarkedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'entry'), name='unique_bookmarked_entry'),
+        ),
+        migrations.AddConstraint(
+            model_name='favouritedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'entry'), name='unique_favourited_entry'),
+        ),
+        migrations.AddConstraint(
+            model_name='seenentry',
+            constraint=models.UniqueConstraint(fields=('user', 'entry'), name='unique_seen_entry'),
+        ),
+    ]
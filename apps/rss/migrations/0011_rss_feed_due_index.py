@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0010_entry_user_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rssfeed',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['next_check'], name='rss_feed_due_idx'),
+        ),
+    ]
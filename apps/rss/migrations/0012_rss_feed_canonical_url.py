@@ -0,0 +1,63 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:29
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+from helper.url import canonicalize_url
+
+
+def fill_canonical_url(apps, schema_editor):
+    """
+    Feeds which turn out to be URL variants of another feed are deactivated and their followers move to that feed
+    """
+    RSSFeed = apps.get_model('rss', 'RSSFeed')
+    RSSFeedFollower = apps.get_model('rss', 'RSSFeedFollower')
+    InboxEntry = apps.get_model('rss', 'InboxEntry')
+    kept_feed_ids = {}
+    for rss_feed in RSSFeed.objects.order_by('-is_active', 'create_time').iterator():
+        rss_feed.canonical_url = canonicalize_url(rss_feed.feed_url)
+        kept_feed_id = kept_feed_ids.setdefault(rss_feed.canonical_url, rss_feed.id)
+        if kept_feed_id != rss_feed.id:
+            rss_feed.is_active = False
+            user_ids = list(RSSFeedFollower.objects.filter(feed_id=rss_feed.id).values_list('user_id', flat=True))
+            RSSFeedFollower.objects.bulk_create(
+                [RSSFeedFollower(user_id=user_id, feed_id=kept_feed_id) for user_id in user_ids], ignore_conflicts=True
+            )
+            RSSFeedFollower.objects.filter(feed_id=rss_feed.id).delete()
+            InboxEntry.objects.filter(user_id__in=user_ids, entry__feed_id=rss_feed.id).delete()
+        rss_feed.save(update_fields=['canonical_url', 'is_active'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0011_rss_feed_due_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rssfeed',
+            name='canonical_url',
+            field=models.TextField(db_index=True, default='', editable=False, help_text='Feed URL without scheme, trailing slash, ... to find URL variants'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_canonical_url, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='RSSFeedAlias',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('create_time', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('modify_time', models.DateTimeField(auto_now=True)),
+                ('feed_url', models.TextField(help_text='Former link of the feed', validators=[django.core.validators.URLValidator()])),
+                ('canonical_url', models.TextField(editable=False, unique=True)),
+                ('feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='rss.rssfeed')),
+            ],
+            options={
+                'verbose_name': 'RSS Feed alias',
+                'verbose_name_plural': 'RSS Feed aliases',
+                'ordering': ('-create_time',),
+            },
+        ),
+    ]
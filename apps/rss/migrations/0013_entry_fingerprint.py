@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from apps.rss.fingerprint import simhash, url_fingerprint
+
+BATCH_SIZE = 1000
+
+
+def fill_fingerprints(apps, schema_editor):
+    """
+    Existing entries are fingerprinted so new copies are linked to them, they are not linked with each other
+    """
+    Entry = apps.get_model('rss', 'Entry')
+    entries = Entry.objects.select_related('body').only('id', 'url', 'body__content').order_by('id')
+    batch = []
+    for entry in entries.iterator(chunk_size=BATCH_SIZE):
+        entry.url_fingerprint = url_fingerprint(entry.url)
+        entry.content_hash = simhash(getattr(getattr(entry, 'body', None), 'content', ''))
+        batch.append(entry)
+        if len(batch) == BATCH_SIZE:
+            Entry.objects.bulk_update(batch, ['url_fingerprint', 'content_hash'])
+            batch = []
+    Entry.objects.bulk_update(batch, ['url_fingerprint', 'content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0012_rss_feed_canonical_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='canonical',
+            field=models.ForeignKey(blank=True, help_text='First stored copy of an entry syndicated by several feeds, duplicates read its content', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='rss.entry'),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='content_hash',
+            field=models.BigIntegerField(blank=True, help_text='SimHash of the description', null=True),
+        ),
+        migrations.AddField(
+            model_name='entry',
+            name='url_fingerprint',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of the canonical URL, shared by copies of an article', max_length=40),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+from helper.html import count_words, sanitize
+
+BATCH_SIZE = 1000
+SUMMARY_LENGTH = 300
+
+
+def sanitize_entries(apps, schema_editor):
+    """
+    Descriptions stored before sanitizing at ingest are sanitized, summaries and word counts are computed again.
+    Duplicates have no description of their own, they take the word count of their canonical entry
+    """
+    Entry = apps.get_model('rss', 'Entry')
+    EntryContent = apps.get_model('rss', 'EntryContent')
+    contents = EntryContent.objects.select_related('entry').order_by('entry_id')
+    entries, bodies = [], []
+    for body in contents.iterator(chunk_size=BATCH_SIZE):
+        body.content, text = sanitize(body.content)
+        body.entry.summary = Truncator(text).chars(SUMMARY_LENGTH)
+        body.entry.word_count = count_words(text)
+        bodies.append(body)
+        entries.append(body.entry)
+        if len(bodies) == BATCH_SIZE:
+            EntryContent.objects.bulk_update(bodies, ['content'])
+            Entry.objects.bulk_update(entries, ['summary', 'word_count'])
+            entries, bodies = [], []
+    EntryContent.objects.bulk_update(bodies, ['content'])
+    Entry.objects.bulk_update(entries, ['summary', 'word_count'])
+
+    duplicates = Entry.objects.filter(canonical__isnull=False).select_related('canonical').order_by('id')
+    batch = []
+    for entry in duplicates.iterator(chunk_size=BATCH_SIZE):
+        entry.summary = sanitize(entry.summary)[1]  # decodes entities left by strip_tags
+        entry.word_count = entry.canonical.word_count
+        batch.append(entry)
+        if len(batch) == BATCH_SIZE:
+            Entry.objects.bulk_update(batch, ['summary', 'word_count'])
+            batch = []
+    Entry.objects.bulk_update(batch, ['summary', 'word_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0013_entry_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of words of the description'),
+        ),
+        migrations.RunPython(sanitize_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:43
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_follower_counts(apps, schema_editor):
+    RSSFeed = apps.get_model('rss', 'RSSFeed')
+    RSSFeedFollower = apps.get_model('rss', 'RSSFeedFollower')
+    follower_count = (
+        RSSFeedFollower.objects.filter(feed=OuterRef('pk')).order_by().values('feed')
+        .annotate(count=Count('id')).values('count')
+    )
+    RSSFeed.objects.update(follower_count=Coalesce(Subquery(follower_count, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0014_entry_word_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rssfeed',
+            name='follower_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, help_text='Number of followers, changed only by follow and unfollow'),
+        ),
+        migrations.RunPython(fill_follower_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-19 13:45
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_comment_counts(apps, schema_editor):
+    Entry = apps.get_model('rss', 'Entry')
+    EntryComment = apps.get_model('rss', 'EntryComment')
+    comment_count = (
+        EntryComment.objects.filter(entry=OuterRef('pk')).order_by().values('entry')
+        .annotate(count=Count('id')).values('count')
+    )
+    Entry.objects.filter(id__in=EntryComment.objects.values('entry_id')).update(
+        comment_count=Coalesce(Subquery(comment_count, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0015_rss_feed_follower_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of comments, changed when a comment is saved or deleted'),
+        ),
+        migrations.RunPython(fill_comment_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='entrycomment',
+            index=models.Index(fields=['entry', '-create_time', '-id'], name='entry_comment_thread_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0016_entry_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['title', 'create_time'], name='entry_title_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:18
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def merge_feed_variants(apps, schema_editor):
+    """
+    Active URL variants of a feed created by concurrent requests are deactivated. Followers of deactivated variants
+    and of feeds which redirect to another feed were copied to the feed kept, they are moved to it
+    """
+    RSSFeed = apps.get_model('rss', 'RSSFeed')
+    RSSFeedAlias = apps.get_model('rss', 'RSSFeedAlias')
+    RSSFeedFollower = apps.get_model('rss', 'RSSFeedFollower')
+    InboxEntry = apps.get_model('rss', 'InboxEntry')
+    kept_feed_ids = {}
+    for feed_id, canonical_url in RSSFeed.objects.filter(is_active=True).order_by('create_time').values_list(
+        'id', 'canonical_url'
+    ):
+        if kept_feed_ids.setdefault(canonical_url, feed_id) != feed_id:
+            RSSFeed.objects.filter(id=feed_id).update(is_active=False)
+    for canonical_url, feed_id in RSSFeedAlias.objects.filter(feed__is_active=True).values_list('canonical_url', 'feed_id'):
+        kept_feed_ids.setdefault(canonical_url, feed_id)
+
+    changed_feed_ids = set()
+    followed_feeds = RSSFeed.objects.filter(is_active=False, id__in=RSSFeedFollower.objects.values('feed_id'))
+    for feed_id, canonical_url in followed_feeds.values_list('id', 'canonical_url'):
+        kept_feed_id = kept_feed_ids.get(canonical_url)
+        if kept_feed_id is None:  # feeds which are gone keep their followers
+            continue
+        user_ids = list(RSSFeedFollower.objects.filter(feed_id=feed_id).values_list('user_id', flat=True))
+        RSSFeedFollower.objects.bulk_create(
+            [RSSFeedFollower(user_id=user_id, feed_id=kept_feed_id) for user_id in user_ids], ignore_conflicts=True
+        )
+        RSSFeedFollower.objects.filter(feed_id=feed_id).delete()
+        InboxEntry.objects.filter(user_id__in=user_ids, entry__feed_id=feed_id).delete()
+        changed_feed_ids.update((feed_id, kept_feed_id))
+
+    follower_count = (
+        RSSFeedFollower.objects.filter(feed=OuterRef('pk')).order_by().values('feed')
+        .annotate(count=Count('id')).values('count')
+    )
+    RSSFeed.objects.filter(id__in=changed_feed_ids).update(
+        follower_count=Coalesce(Subquery(follower_count, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0017_entry_title_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_feed_variants, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rssfeed',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('canonical_url',), name='rss_feed_active_canonical_url_unique'),
+        ),
+    ]
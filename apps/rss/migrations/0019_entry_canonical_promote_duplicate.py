@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:21
+
+import apps.rss.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rss', '0018_rss_feed_active_canonical_url_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entry',
+            name='canonical',
+            field=models.ForeignKey(blank=True, help_text='First stored copy of an entry syndicated by several feeds, duplicates read its content', null=True, on_delete=apps.rss.models.promote_duplicate, related_name='duplicates', to='rss.entry'),
+        ),
+    ]
@@ -1,12 +1,20 @@
+import hashlib
+import hmac
 import textwrap
+import zlib
+from collections import defaultdict
 from datetime import timedelta
 
 from django.contrib.auth import get_user_model
 from django.core.validators import URLValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest
 from django.utils import timezone
+from django.utils.text import Truncator
 
 from helper.model import BaseModel
+from helper.url import canonicalize_url
+from .backoff import calculate_delay
 
 User = get_user_model()
 
@@ -17,18 +25,30 @@ class ActiveRSSFeedManager(models.Manager):
 
 
 class RSSFeed(BaseModel):
-    ERROR_LIMIT = 20
+    ERROR_LIMIT = 5  # permanent errors in a row before the feed is deactivated
+    TRANSIENT_ERROR_LIMIT = 20
+    # written after each refresh without touching the rest of the row, not even modify_time
+    STATUS_FIELDS = ("last_status", "last_checked", "next_check", "number_of_errors", "is_active")
 
     title = models.CharField(max_length=150, help_text="Title of the feed")
     feed_url = models.TextField(validators=[URLValidator()], unique=True, help_text="Link of the feed")
+    canonical_url = models.TextField(
+        db_index=True, editable=False, help_text="Feed URL without scheme, trailing slash, ... to find URL variants"
+    )
     description = models.TextField(help_text="Description of the feed")
     last_update = models.DateTimeField(blank=True, null=True, help_text="Last time the feed says it changed", )
     last_checked = models.DateTimeField(blank=True, null=True, help_text="Last time we checked the feed")
     next_check = models.DateTimeField(blank=True, null=True, help_text="Next time we need to update posts of feed")
     last_status = models.IntegerField(null=True, blank=True, help_text="Status code of last request")
     number_of_errors = models.IntegerField(default=0, help_text="Number of errors that have been occurred when updating posts")
+    retention_days = models.PositiveIntegerField(
+        blank=True, null=True, help_text="Days entries are kept before archiving, ENTRY_RETENTION_DAYS setting when empty"
+    )
     followers = models.ManyToManyField(
         to=User, related_name="feeds", through="RSSFeedFollower", help_text="Users who have followed RSS Feed")
+    follower_count = models.PositiveIntegerField(
+        default=0, db_index=True, editable=False, help_text="Number of followers, changed only by follow and unfollow"
+    )
     is_active = models.BooleanField(
         default=True, db_index=True, help_text="A feed will become inactive when a permanent error occurs"
     )
@@ -37,12 +57,43 @@ class RSSFeed(BaseModel):
 
     class Meta:
         ordering = ("-last_update", "-last_checked")
+        indexes = (
+            # the scheduler only looks for due active feeds
+            models.Index(fields=("next_check",), name="rss_feed_due_idx", condition=models.Q(is_active=True)),
+        )
+        constraints = (
+            # URL variants of an active feed resolve to it, see `find_by_url`
+            models.UniqueConstraint(
+                fields=("canonical_url",), condition=models.Q(is_active=True), name="rss_feed_active_canonical_url_unique"
+            ),
+        )
         verbose_name = "RSS Feed"
         verbose_name_plural = "RSS Feeds"
 
     def __str__(self):
         return f"{self.title} - {self.feed_url}"
 
+    def save(self, *args, **kwargs):
+        self.canonical_url = canonicalize_url(self.feed_url)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # a stale instance must not overwrite the follower count, it is only changed by `change_follower_count`
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'follower_count'
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def find_by_url(cls, feed_url):
+        """
+        Find the feed of a URL variant or of a URL that permanently redirects to a feed, active feeds first
+        """
+        canonical_url = canonicalize_url(feed_url)
+        return (
+            cls.objects.filter(models.Q(canonical_url=canonical_url) | models.Q(aliases__canonical_url=canonical_url))
+            .order_by("-is_active", "create_time")
+            .first()
+        )
+
     @classmethod
     def calculate_next_check(cls, hours=1):
         return timezone.now() + timedelta(hours=hours)
@@ -53,30 +104,148 @@ class RSSFeed(BaseModel):
     def unseen_entries_count_for_user(self, user) -> int:
         return self.entries.count() - self.entries.filter(seenentry__user_id=user.id).count()
 
+    @classmethod
+    def change_follower_count(cls, rss_feed_ids, delta):
+        cls.objects.filter(id__in=rss_feed_ids).update(follower_count=Greatest(models.F("follower_count") + delta, 0))
+
     def follow(self, user):
-        if not self.is_followed_by_user(user):
-            self.followers.add(user)
+        _, created = RSSFeedFollower.objects.get_or_create(user=user, feed=self)
+        if created:
+            self.change_follower_count([self.id], 1)
 
     def unfollow(self, user):
-        if self.is_followed_by_user(user):
-            self.followers.remove(user)
+        deleted, _ = RSSFeedFollower.objects.filter(user=user, feed=self).delete()
+        if deleted:
+            self.change_follower_count([self.id], -deleted)
 
-    def deactivate(self):
+    def deactivate(self, commit=True):
         self.is_active = False
-        self.save()
+        if commit:
+            self.save(update_fields=self.STATUS_FIELDS)
 
-    def increase_number_of_error(self):
+    def increase_number_of_error(self, commit=True):
         self.number_of_errors = self.number_of_errors + 1
-        self.next_check = self.calculate_next_check(self.number_of_errors)
+        self.next_check = timezone.now() + calculate_delay(self.number_of_errors)
+        if commit:
+            self.save(update_fields=self.STATUS_FIELDS)
+
+    def reset_number_of_errors(self, commit=True):
+        self.number_of_errors = 0
+        self.next_check = self.calculate_next_check()
+        if commit:
+            self.save(update_fields=self.STATUS_FIELDS)
+
+
+class RSSFeedAlias(BaseModel):
+    """
+    Former URL of a feed, kept when the feed permanently redirects so the old URL still resolves to the feed
+    """
+    feed = models.ForeignKey(RSSFeed, on_delete=models.CASCADE, related_name="aliases")
+    feed_url = models.TextField(validators=[URLValidator()], help_text="Former link of the feed")
+    canonical_url = models.TextField(unique=True, editable=False)
+
+    class Meta:
+        ordering = ("-create_time",)
+        verbose_name = "RSS Feed alias"
+        verbose_name_plural = "RSS Feed aliases"
+
+    def __str__(self):
+        return f"{self.feed_url} -> {self.feed}"
+
+    def save(self, *args, **kwargs):
+        self.canonical_url = canonicalize_url(self.feed_url)
+        super().save(*args, **kwargs)
+
+
+class RSSFeedRegistration(BaseModel):
+    """
+    Asynchronous request to add a feed, clients poll it until the feed is fetched and its entries are ingested
+    """
+    PENDING = "pending"
+    CREATED = "created"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (CREATED, "Created"),
+        (FAILED, "Failed"),
+    )
+    PENDING_TIMEOUT = timedelta(minutes=10)
+
+    feed_url = models.TextField(validators=[URLValidator()], unique=True, help_text="Requested link of the feed")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    message = models.TextField(blank=True, help_text="Reason of failure")
+    rss_feed = models.ForeignKey(
+        RSSFeed, on_delete=models.SET_NULL, related_name="registrations", null=True, blank=True, help_text="Created feed"
+    )
+    followers = models.ManyToManyField(
+        to=User, related_name="feed_registrations", blank=True, help_text="Users who follow the feed once it is created"
+    )
+
+    class Meta:
+        ordering = ("-create_time",)
+        verbose_name = "RSS Feed registration"
+        verbose_name_plural = "RSS Feed registrations"
+
+    def __str__(self):
+        return f"{self.feed_url} - {self.status}"
+
+    def complete(self, rss_feed):
+        self.status = self.CREATED
+        self.rss_feed = rss_feed
+        self.message = ""
+        self.save()
+
+    def fail(self, message):
+        self.status = self.FAILED
+        self.message = message
         self.save()
 
 
+class WebSubSubscription(BaseModel):
+    """
+    Push subscription of a feed on the WebSub (PubSubHubbub) hub that the feed advertises
+    """
+    feed = models.OneToOneField(RSSFeed, on_delete=models.CASCADE, related_name="websub_subscription")
+    hub_url = models.TextField(validators=[URLValidator()], help_text="Hub that the feed advertises")
+    topic_url = models.TextField(validators=[URLValidator()], help_text="Topic URL that the hub publishes")
+    secret = models.CharField(max_length=64, help_text="Shared secret the hub signs pushed content with")
+    is_verified = models.BooleanField(default=False, help_text="The hub has verified the subscription")
+    lease_expires = models.DateTimeField(blank=True, null=True, help_text="When the hub will drop the subscription")
+    last_push = models.DateTimeField(blank=True, null=True, help_text="Last time the hub pushed content")
+
+    class Meta:
+        ordering = ("-create_time",)
+        verbose_name = "WebSub subscription"
+        verbose_name_plural = "WebSub subscriptions"
+
+    def __str__(self):
+        return f"{self.feed} - {self.hub_url}"
+
+    def verify(self, lease_seconds):
+        self.is_verified = True
+        self.lease_expires = timezone.now() + timedelta(seconds=lease_seconds)
+        self.save()
+
+    def is_valid_signature(self, body, signature) -> bool:
+        try:
+            method, digest = signature.split('=', 1)
+        except (AttributeError, ValueError):
+            return False
+        if method not in ('sha1', 'sha256', 'sha384', 'sha512'):
+            return False
+        expected = hmac.new(self.secret.encode(), body, getattr(hashlib, method)).hexdigest()
+        return hmac.compare_digest(expected, digest)
+
+
 class RSSFeedFollower(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     feed = models.ForeignKey(RSSFeed, on_delete=models.CASCADE)
 
     class Meta:
         ordering = ("-create_time",)
+        constraints = [
+            models.UniqueConstraint(fields=("user", "feed"), name="unique_rss_feed_follower"),
+        ]
         verbose_name = "RSS Feed follower"
         verbose_name_plural = "RSS Feed followers"
 
@@ -84,16 +253,59 @@ class RSSFeedFollower(BaseModel):
         return f"{self.user} {self.feed}"
 
 
+def promote_duplicate(collector, field, sub_objs, using):
+    """
+    on_delete of `Entry.canonical`, duplicates store no content of their own. The oldest duplicate of a deleted
+    canonical entry takes over its content and the other duplicates point to it
+    """
+    deleted_entry_ids = {entry.pk for entry in collector.data.get(Entry, ())}
+    deleted_feed_ids = {rss_feed.pk for rss_feed in collector.data.get(RSSFeed, ())}
+    duplicates = {duplicate.pk: duplicate for duplicate in sub_objs}
+    duplicates_by_canonical, deleted_duplicates = defaultdict(list), []
+    rows = Entry.objects.using(using).filter(pk__in=duplicates).order_by('create_time', 'id')
+    for entry_id, canonical_id, feed_id in rows.values_list('id', 'canonical_id', 'feed_id'):
+        if entry_id in deleted_entry_ids or feed_id in deleted_feed_ids:
+            deleted_duplicates.append(duplicates[entry_id])
+        else:
+            duplicates_by_canonical[canonical_id].append(duplicates[entry_id])
+
+    bodies = EntryContent.objects.using(using).in_bulk(list(duplicates_by_canonical))
+    new_bodies = []
+    for canonical_id, (promoted, *others) in duplicates_by_canonical.items():
+        collector.add_field_update(field, None, [promoted])
+        collector.add_field_update(field, promoted, others)
+        if canonical_id in bodies:
+            new_bodies.append(EntryContent(entry=promoted, content=bodies[canonical_id].content))
+    # the content is copied now, the body of the canonical entry is deleted before the field updates
+    EntryContent.objects.using(using).bulk_create(new_bodies, ignore_conflicts=True)
+    collector.add_field_update(field, None, deleted_duplicates)
+
+
 class Entry(BaseModel):
     """
-    Entries of feeds (Posts of feeds/Items of feeds)
+    Entries of feeds (Posts of feeds/Items of feeds), the full description is stored in EntryContent.
+    Copies of an entry in other feeds link to the first copy and have no EntryContent of their own
     """
+    SUMMARY_LENGTH = 300
+
     feed = models.ForeignKey(RSSFeed, on_delete=models.CASCADE, related_name="entries")
     title = models.CharField(max_length=150, help_text="Title of the feed")
     url = models.TextField(null=True, blank=True, validators=[URLValidator()], help_text="URL for the HTML for this entry", )
     guid = models.TextField(null=True, blank=True, help_text="GUID for the entry, according to the feed")
-    content = models.TextField(blank=True, help_text="description of entry")
+    summary = models.CharField(max_length=SUMMARY_LENGTH, blank=True, help_text="Truncated plain text description of entry")
+    word_count = models.PositiveIntegerField(default=0, help_text="Number of words of the description")
+    comment_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Number of comments, changed when a comment is saved or deleted"
+    )
     publish_date = models.DateTimeField(null=True, blank=True, help_text="when this entry says it was published", db_index=True)
+    url_fingerprint = models.CharField(
+        max_length=40, blank=True, db_index=True, help_text="Hash of the canonical URL, shared by copies of an article"
+    )
+    content_hash = models.BigIntegerField(null=True, blank=True, help_text="SimHash of the description")
+    canonical = models.ForeignKey(
+        "self", on_delete=promote_duplicate, related_name="duplicates", null=True, blank=True,
+        help_text="First stored copy of an entry syndicated by several feeds, duplicates read its content",
+    )
     seen_users = models.ManyToManyField(
         to=User, related_name="seen_entries", through="SeenEntry", help_text="Users who have seen the entry"
     )
@@ -106,31 +318,133 @@ class Entry(BaseModel):
 
     class Meta:
         ordering = ("-publish_date", "-create_time")
+        indexes = (
+            models.Index(fields=("feed", "-publish_date", "-id"), name="entry_feed_timeline_idx"),
+            models.Index(fields=("title", "create_time"), name="entry_title_idx"),
+        )
         verbose_name = "Entry"
         verbose_name_plural = "Entries"
 
     def __str__(self):
         return f"{self.title} - {self.url}"
 
+    @property
+    def content(self) -> str:
+        entry = self.canonical if self.canonical_id else self
+        try:
+            return entry.body.content
+        except EntryContent.DoesNotExist:
+            return ""
+
+    @classmethod
+    def summarize(cls, text) -> str:
+        return Truncator(text).chars(cls.SUMMARY_LENGTH)
+
     def seen(self, user):
-        if not self.seen_users.filter(id=user.id).exists():
-            self.seen_users.add(user)
+        SeenEntry.objects.bulk_create([SeenEntry(user=user, entry=self)], ignore_conflicts=True)
 
     def add_bookmark(self, user):
-        if not self.bookmark_users.filter(id=user.id).exists():
-            self.bookmark_users.add(user)
+        BookmarkedEntry.objects.bulk_create([BookmarkedEntry(user=user, entry=self)], ignore_conflicts=True)
 
     def add_favourite(self, user):
-        if not self.favourite_users.filter(id=user.id).exists():
-            self.favourite_users.add(user)
+        FavouritedEntry.objects.bulk_create([FavouritedEntry(user=user, entry=self)], ignore_conflicts=True)
 
     def remove_bookmark(self, user):
-        if self.bookmark_users.filter(id=user.id).exists():
-            self.bookmark_users.remove(user)
+        BookmarkedEntry.objects.filter(user=user, entry=self).delete()
 
     def remove_favourite(self, user):
-        if self.favourite_users.filter(id=user.id).exists():
-            self.favourite_users.remove(user)
+        FavouritedEntry.objects.filter(user=user, entry=self).delete()
+
+
+class EntryContent(models.Model):
+    """
+    Description of entries, kept out of the Entry table so queries over entries do not read it
+    """
+    entry = models.OneToOneField(Entry, on_delete=models.CASCADE, primary_key=True, related_name="body")
+    content = models.TextField(blank=True, help_text="description of entry")
+
+    class Meta:
+        verbose_name = "Entry content"
+        verbose_name_plural = "Entry contents"
+
+    def __str__(self):
+        return f"{self.entry_id}"
+
+
+class ArchivedEntry(BaseModel):
+    """
+    Entries moved out of the Entry table by the retention task, the content is stored compressed.
+    The id is kept from the original entry
+    """
+    feed = models.ForeignKey(RSSFeed, on_delete=models.CASCADE, related_name="archived_entries")
+    title = models.CharField(max_length=150, help_text="Title of the feed")
+    url = models.TextField(null=True, blank=True, help_text="URL for the HTML for this entry")
+    guid = models.TextField(null=True, blank=True, help_text="GUID for the entry, according to the feed")
+    compressed_content = models.BinaryField(help_text="zlib compressed description of entry")
+    publish_date = models.DateTimeField(null=True, blank=True, help_text="when this entry says it was published", db_index=True)
+
+    class Meta:
+        ordering = ("-publish_date", "-create_time")
+        verbose_name = "Archived entry"
+        verbose_name_plural = "Archived entries"
+
+    def __str__(self):
+        return f"{self.title} - {self.url}"
+
+    @property
+    def content(self) -> str:
+        return zlib.decompress(self.compressed_content).decode()
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(
+            id=entry.id,
+            feed_id=entry.feed_id,
+            title=entry.title,
+            url=entry.url,
+            guid=entry.guid,
+            compressed_content=zlib.compress(entry.content.encode()),
+            publish_date=entry.publish_date,
+        )
+
+
+class TimelineInbox(BaseModel):
+    """
+    Opt-in fan-out-on-write timeline, new entries of followed feeds are copied to the inbox of the user
+    so reading the timeline does not join followers with entries
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="timeline_inbox")
+    max_length = models.PositiveIntegerField(default=1000, help_text="Older entries are dropped from the inbox")
+
+    class Meta:
+        ordering = ("-create_time",)
+        verbose_name = "Timeline inbox"
+        verbose_name_plural = "Timeline inboxes"
+
+    def __str__(self):
+        return f"{self.user}"
+
+
+class InboxEntry(models.Model):
+    """
+    Entry of a followed feed in the timeline inbox of a user, kept narrow on purpose
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="inbox_entries")
+    entry = models.ForeignKey(Entry, on_delete=models.CASCADE, related_name="inbox_entries")
+    publish_date = models.DateTimeField(help_text="Copy of entry publish date, the timeline is read in this order")
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=("user", "entry"), name="unique_inbox_entry"),
+        )
+        indexes = (
+            models.Index(fields=("user", "-publish_date", "-entry"), name="inbox_entry_timeline_idx"),
+        )
+        verbose_name = "Inbox entry"
+        verbose_name_plural = "Inbox entries"
+
+    def __str__(self):
+        return f"{self.user} {self.entry_id}"
 
 
 class SeenEntry(BaseModel):
@@ -139,6 +453,9 @@ class SeenEntry(BaseModel):
 
     class Meta:
         ordering = ("-create_time",)
+        constraints = (
+            models.UniqueConstraint(fields=("user", "entry"), name="unique_seen_entry"),
+        )
         verbose_name = "Seen entry"
         verbose_name_plural = "Seen entries"
 
@@ -152,6 +469,9 @@ class FavouritedEntry(BaseModel):
 
     class Meta:
         ordering = ("-create_time",)
+        constraints = (
+            models.UniqueConstraint(fields=("user", "entry"), name="unique_favourited_entry"),
+        )
         verbose_name = "Favourited entry"
         verbose_name_plural = "Favourited entries"
 
@@ -165,6 +485,9 @@ class BookmarkedEntry(BaseModel):
 
     class Meta:
         ordering = ("-create_time",)
+        constraints = (
+            models.UniqueConstraint(fields=("user", "entry"), name="unique_bookmarked_entry"),
+        )
         verbose_name = "Bookmarked entry"
         verbose_name_plural = "Bookmarked entries"
 
@@ -179,8 +502,25 @@ class EntryComment(BaseModel):
 
     class Meta:
         ordering = ("-create_time",)
+        indexes = (
+            # comments of an entry are paged with a seek on (create_time, id)
+            models.Index(fields=("entry", "-create_time", "-id"), name="entry_comment_thread_idx"),
+        )
         verbose_name = "Entry comment"
         verbose_name_plural = "Entry comments"
 
     def __str__(self):
         return f"{self.user}: {textwrap.shorten(self.body, width=25, placeholder='...')}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Entry.objects.filter(id=self.entry_id).update(comment_count=models.F("comment_count") + 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            Entry.objects.filter(id=self.entry_id).update(comment_count=Greatest(models.F("comment_count") - 1, 0))
+        return deleted
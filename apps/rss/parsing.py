@@ -0,0 +1,179 @@
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+from typing import NamedTuple, Optional
+from urllib.error import URLError
+
+import feedparser
+from dateutil import parser
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_parse_executor = None
+_parse_executor_lock = threading.Lock()
+
+# fields of the parse tree the services read, the rest is dropped before results leave the parse process.
+# FeedParserDict stores `description` as `subtitle` of feeds
+FEED_KEYS = ('title', 'subtitle', 'updated', 'links')
+
+
+class ParsedEntry(NamedTuple):
+    """
+    Item of a feed normalized to the fields Entry is created from, it keeps no reference to the parse tree
+    """
+    title: str
+    url: Optional[str]
+    guid: Optional[str]
+    content: str
+    publish_date: Optional[datetime]
+
+    @classmethod
+    def from_entry(cls, entry):
+        if 'content' in entry:
+            content = entry.content[0].value
+        else:
+            content = entry.get('description', '')
+        publish_date = entry.get('published') or entry.get('updated')
+        return cls(
+            title=entry.get('title', ''),
+            url=entry.get('link'),
+            guid=entry.get('id'),
+            content=content,
+            publish_date=parser.parse(publish_date) if publish_date else None,
+        )
+
+
+def normalize_entries(entries):
+    return [entry if isinstance(entry, ParsedEntry) else ParsedEntry.from_entry(entry) for entry in entries]
+
+
+def download(feed_url):
+    """
+    Fetch the feed without parsing it, returns the body and a result holding the response fields feedparser sets
+    (status, href, headers) or `bozo_exception` when no response was received
+    """
+    result = feedparser.FeedParserDict(bozo=False, entries=[], feed=feedparser.FeedParserDict(), headers={})
+    try:
+        body = feedparser.http.get(feed_url, None, None, feedparser.USER_AGENT, None, [], {}, result)
+    except URLError as error:
+        result.update(bozo=True, bozo_exception=error)
+        body = b''
+    return body, result
+
+
+def parse(body, headers, href):
+    """
+    Parse a downloaded body into a compact result, it runs in the parse processes so it must not use Django
+    """
+    # relative links of the entries are resolved against the feed URL like feedparser does when it downloads
+    feed_parser = feedparser.parse(io.BytesIO(body), response_headers={'content-location': href, **headers})
+    return compact(feed_parser)
+
+
+def compact(feed_parser):
+    return feedparser.FeedParserDict(
+        bozo=feed_parser.bozo,
+        version=feed_parser.get('version', ''),
+        feed=_pick(feed_parser.feed, FEED_KEYS),
+        entries=normalize_entries(feed_parser.entries),
+    )
+
+
+def _pick(parsed_dict, keys):
+    return feedparser.FeedParserDict((key, parsed_dict[key]) for key in keys if key in parsed_dict)
+
+
+def get_parse_executor(size):
+    """
+    Parse processes of the worker process, started on first use and shared by the tasks running in its threads.
+    None in daemonic processes, e.g. children of the prefork pool of celery, which can not have children
+    """
+    global _parse_executor
+    if multiprocessing.current_process().daemon:
+        return None
+    with _parse_executor_lock:
+        if _parse_executor is None:
+            # spawned rather than forked so they do not share the database connections of the worker
+            _parse_executor = ProcessPoolExecutor(size, mp_context=multiprocessing.get_context('spawn'))
+        return _parse_executor
+
+
+def _discard_parse_executor(executor):
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is executor:
+            _parse_executor = None
+    executor.shutdown(wait=False)
+
+
+class FeedParsePool:
+    """
+    Downloads feeds in threads and parses them in `size` processes, feedparser is pure Python and holds the GIL.
+    Results are prefetched for a batch of feeds and returned by `parse` in the order the caller needs them.
+    The processes are kept by the worker process for the next batches, see `get_parse_executor`
+    """
+    DOWNLOAD_THREADS = 16
+
+    def __init__(self, size):
+        self.size = size
+        self.futures = {}
+        self.download_executor = None
+        self.parse_executor = None
+
+    def __enter__(self):
+        self.download_executor = ThreadPoolExecutor(self.DOWNLOAD_THREADS, thread_name_prefix='feed-download')
+        self.parse_executor = get_parse_executor(self.size)
+        if self.parse_executor is None:
+            logger.warning("Feeds are parsed in download threads, the worker process can not start parse processes")
+        return self
+
+    def __exit__(self, *exc_info):
+        self.futures.clear()
+        self.download_executor.shutdown(cancel_futures=True)
+
+    def prefetch(self, feed_urls):
+        for feed_url in feed_urls:
+            if feed_url not in self.futures:
+                self.futures[feed_url] = self.download_executor.submit(self._fetch, feed_url)
+
+    def parse(self, feed_url):
+        future = self.futures.pop(feed_url, None) or self.download_executor.submit(self._fetch, feed_url)
+        return future.result()
+
+    def _fetch(self, feed_url):
+        body, result = download(feed_url)
+        if not body:
+            return result
+        href = result.get('href', feed_url)
+        feed_parser = None
+        if self.parse_executor:
+            try:
+                feed_parser = self.parse_executor.submit(parse, body, result['headers'], href).result()
+            except BrokenProcessPool:  # a parse process died, e.g. killed for its memory
+                logger.warning("Parse processes are restarted", exc_info=True)
+                _discard_parse_executor(self.parse_executor)
+        if feed_parser is None:
+            feed_parser = parse(body, result['headers'], href)
+        feed_parser.update(
+            (key, value) for key, value in result.items() if key in ('status', 'href', 'headers', 'etag', 'modified')
+        )
+        return feed_parser
+
+
+@contextmanager
+def parse_pool(size=None):
+    """
+    Yields a FeedParsePool of RSS_PARSE_POOL_SIZE processes, or None when it is 0 and feeds are fetched one by one
+    """
+    size = settings.RSS_PARSE_POOL_SIZE if size is None else size
+    if not size:
+        yield None
+        return
+    with FeedParsePool(size) as pool:
+        yield pool
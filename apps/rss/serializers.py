@@ -1,11 +1,13 @@
 from rest_framework import serializers
 
-from .models import RSSFeed, Entry, EntryComment
+from .exceptions import InvalidOPML
+from .models import RSSFeed, RSSFeedRegistration, Entry, EntryComment
+from .services import OPMLService
 from ..account.serializers import UserReadOnlySerializer
 
 
 class RSSFeedSerializer(serializers.ModelSerializer):
-    number_of_followers = serializers.SerializerMethodField()
+    number_of_followers = serializers.IntegerField(source='follower_count', read_only=True)
     is_followed = serializers.SerializerMethodField()
     number_of_unseen_entries = serializers.SerializerMethodField(allow_null=True)
 
@@ -25,9 +27,6 @@ class RSSFeedSerializer(serializers.ModelSerializer):
         )
         read_only = True
 
-    def get_number_of_followers(self, rss_feed):
-        return rss_feed.followers.count()
-
     def get_is_followed(self, rss_feed):
         return rss_feed.is_followed_by_user(self.context['request'].user)
 
@@ -39,14 +38,48 @@ class RSSFeedSerializer(serializers.ModelSerializer):
 
 class RSSFeedCreateSerializer(serializers.Serializer):
     feed_url = serializers.URLField(required=True)
+    asynchronous = serializers.BooleanField(
+        default=False, write_only=True, help_text="Fetch the feed in background and respond with a registration to poll"
+    )
     message = serializers.CharField(read_only=True)
     rss_feed = RSSFeedSerializer(allow_null=True, required=False, read_only=True)
 
 
+class RSSFeedRegistrationSerializer(serializers.ModelSerializer):
+    rss_feed = RSSFeedSerializer(allow_null=True, read_only=True)
+
+    class Meta:
+        model = RSSFeedRegistration
+        fields = (
+            'id',
+            'feed_url',
+            'status',
+            'message',
+            'rss_feed',
+        )
+        read_only = True
+
+
 class RSSFeedFollowSerializer(serializers.Serializer):
     feed_id = serializers.PrimaryKeyRelatedField(queryset=RSSFeed.objects.all(), required=True, source='feed')
 
 
+class OPMLImportSerializer(serializers.Serializer):
+    file = serializers.FileField(write_only=True, help_text="OPML file of feeds to follow")
+    rss_feeds = serializers.PrimaryKeyRelatedField(
+        many=True, read_only=True, help_text="Existing feeds which are followed"
+    )
+    registrations = RSSFeedRegistrationSerializer(
+        many=True, read_only=True, help_text="Missing feeds which are followed once they are fetched"
+    )
+
+    def validate_file(self, opml_file):
+        try:
+            return OPMLService().parse(opml_file)
+        except InvalidOPML as e:
+            raise serializers.ValidationError(e.message)
+
+
 class EntrySerializer(serializers.ModelSerializer):
     is_bookmarked = serializers.SerializerMethodField()
     is_favourited = serializers.SerializerMethodField()
@@ -59,8 +92,12 @@ class EntrySerializer(serializers.ModelSerializer):
             'title',
             'url',
             'guid',
+            'summary',
+            'word_count',
+            'comment_count',
             'content',
             'publish_date',
+            'canonical',
             'is_bookmarked',
             'is_favourited',
         )
@@ -73,6 +110,14 @@ class EntrySerializer(serializers.ModelSerializer):
         return entry.favourite_users.filter(id=self.context['request'].user.id).exists()
 
 
+class EntryListSerializer(EntrySerializer):
+    """
+    Entries without their description, the full content is returned by retrieve
+    """
+    class Meta(EntrySerializer.Meta):
+        fields = tuple(field for field in EntrySerializer.Meta.fields if field != 'content')
+
+
 class EntryBookmarkSerializer(serializers.Serializer):
     entry_id = serializers.PrimaryKeyRelatedField(queryset=Entry.objects.all(), required=True, source='entry')
 
@@ -1,106 +1,1005 @@
+import asyncio
+import io
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from xml.etree import ElementTree
+
 import feedparser
+from celery import group
 from dateutil import parser
-from django.db import transaction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.urls import reverse
 from django.utils import timezone
+from django_redis import get_redis_connection
+from redis import RedisError
+
+from helper import html
+from helper.url import canonicalize_url
+from . import backoff, fingerprint
+from .backoff import HostCircuitBreaker
+from .exceptions import InvalidFeedURL, InvalidOPML
+from .models import (
+    RSSFeed,
+    RSSFeedAlias,
+    RSSFeedFollower,
+    RSSFeedRegistration,
+    Entry,
+    EntryContent,
+    ArchivedEntry,
+    SeenEntry,
+    BookmarkedEntry,
+    FavouritedEntry,
+    EntryComment,
+    TimelineInbox,
+    InboxEntry,
+    WebSubSubscription,
+)
+from .parsing import ParsedEntry, normalize_entries
 
-from .exceptions import InvalidFeedURL
-from .models import RSSFeed, Entry
+logger = logging.getLogger(__name__)
 
 
 class RSSFeedService:
+    STATUS_BATCH_SIZE = 500
+
+    PERMANENT_REDIRECT_STATUSES = (301, 308)
+
     def create(self, feed_url, create_or_update_entries_function=None):
+        """
+        URL variants and former URLs of an existing feed resolve to that feed without fetching it again
+        """
+        rss_feed = RSSFeed.find_by_url(feed_url)
+        if rss_feed:
+            return rss_feed
+
         feed_parser = self._parse_feed_url(feed_url)
 
         if not self._is_valid(feed_parser):
             raise InvalidFeedURL
 
         with transaction.atomic():
-            rss_feed = self._get_or_create_rss_feed(feed_url, feed_parser)
+            rss_feed = self._get_or_create_rss_feed(self._get_permanent_url(feed_url, feed_parser), feed_parser)
+            self._add_alias(rss_feed, feed_url)
 
             if create_or_update_entries_function:
                 create_or_update_entries_function(rss_feed, feed_parser.entries)
 
-            return rss_feed
+        WebSubService().subscribe_if_advertised(rss_feed, feed_parser)
+        return rss_feed
+
+    def register(self, feed_url):
+        """
+        Register the feed URL in pending state for `create_rss_feed` task.
+        Duplicate requests are coalesced, returns the registration and whether the task must be enqueued
+        """
+        registration, created = RSSFeedRegistration.objects.get_or_create(feed_url=feed_url)
+        if created:
+            rss_feed = RSSFeed.find_by_url(feed_url)
+            if rss_feed:
+                registration.complete(rss_feed)
+            return registration, rss_feed is None
+
+        if registration.status == RSSFeedRegistration.PENDING:
+            retry_query = {'modify_time__lte': timezone.now() - RSSFeedRegistration.PENDING_TIMEOUT}
+        elif registration.status == RSSFeedRegistration.FAILED:
+            retry_query = {}
+        else:
+            return registration, False
+        # only one of the concurrent requests can claim the retry
+        claimed = RSSFeedRegistration.objects.filter(id=registration.id, status=registration.status, **retry_query).update(
+            status=RSSFeedRegistration.PENDING, message='', modify_time=timezone.now()
+        )
+        registration.refresh_from_db()
+        return registration, bool(claimed)
+
+    def prefetch(self, rss_feeds, parse_pool):
+        """
+        Start fetching a batch of feeds in the parse pool, hosts whose circuit breaker is open are skipped
+        """
+        parse_pool.prefetch(
+            rss_feed.feed_url for rss_feed in rss_feeds if not HostCircuitBreaker(rss_feed.feed_url).open_until()
+        )
+
+    def update(self, rss_feed: RSSFeed, create_or_update_entries_function, commit=True, parse_pool=None):
+        """
+        Fetch the feed and update its status, with `commit=False` the status is left for `save_statuses`.
+        With a parse pool the feed is taken from the prefetched batch
+        """
+        circuit_breaker = HostCircuitBreaker(rss_feed.feed_url)
+        open_until = circuit_breaker.open_until()
+        if open_until:  # the host is down, check the feed again once the breaker closes
+            rss_feed.next_check = open_until
+            if commit:
+                rss_feed.save(update_fields=RSSFeed.STATUS_FIELDS)
+            return
 
-    def update(self, rss_feed: RSSFeed, create_or_update_entries_function):
-        feed_parser = self._parse_feed_url(rss_feed.feed_url)
-        rss_feed.last_status = feed_parser.status
+        feed_parser = self._parse_feed_url(rss_feed.feed_url, parse_pool)
+        result = backoff.classify(feed_parser)
+        rss_feed.last_status = getattr(feed_parser, 'status', None)
         rss_feed.last_checked = timezone.now()
+        if result == backoff.TRANSIENT:
+            circuit_breaker.record_failure()
+        else:
+            circuit_breaker.record_success()
 
-        if feed_parser.status != 200:
-            if rss_feed.number_of_errors >= RSSFeed.ERROR_LIMIT:
-                rss_feed.deactivate()
-            else:
-                rss_feed.increase_number_of_error()
+        if result == backoff.SUCCESS:
+            if self._follow_permanent_redirect(rss_feed, feed_parser):
+                rss_feed.deactivate(commit=commit)  # its followers have moved to the feed it redirects to
+                return
+            entries = normalize_entries(feed_parser.entries)
+            del feed_parser  # the parse tree is freed before the entries are stored
+            create_or_update_entries_function(rss_feed, entries)
+            rss_feed.reset_number_of_errors(commit=commit)
+        elif result == backoff.GONE:
+            rss_feed.deactivate(commit=commit)
         else:
-            create_or_update_entries_function(rss_feed, feed_parser.entries)
-            rss_feed.number_of_errors = 0  # reset errors
-            rss_feed.next_check = RSSFeed.calculate_next_check()
-            rss_feed.save()
+            error_limit = RSSFeed.TRANSIENT_ERROR_LIMIT if result == backoff.TRANSIENT else RSSFeed.ERROR_LIMIT
+            if rss_feed.number_of_errors >= error_limit:
+                rss_feed.deactivate(commit=commit)
+            else:
+                rss_feed.increase_number_of_error(commit=commit)
+
+    def update_batch(self, rss_feeds, create_or_update_entries_function, parse_pool=None):
+        """
+        Refresh the feeds one after another and save their statuses in one statement, also when a refresh fails.
+        With a parse pool the feeds of the batch are fetched concurrently
+        """
+        if parse_pool:
+            self.prefetch(rss_feeds, parse_pool)
+        updated_feeds = []
+        try:
+            for rss_feed in rss_feeds:
+                self.update(rss_feed, create_or_update_entries_function, commit=False, parse_pool=parse_pool)
+                updated_feeds.append(rss_feed)
+        finally:
+            self.save_statuses(updated_feeds)
+
+    def save_statuses(self, rss_feeds):
+        RSSFeed.objects.bulk_update(rss_feeds, RSSFeed.STATUS_FIELDS, batch_size=self.STATUS_BATCH_SIZE)
 
     @staticmethod
-    def _parse_feed_url(feed_url):
+    def _parse_feed_url(feed_url, parse_pool=None):
+        if parse_pool:
+            return parse_pool.parse(feed_url)
         return feedparser.parse(feed_url)
 
     @staticmethod
     def _is_valid(feed_parser):
-        if feed_parser.status != 200:
+        if backoff.classify(feed_parser) != backoff.SUCCESS:
             return False
         if 'xml' not in feed_parser.headers['content-type']:
             return False
         return True
 
+    def _get_permanent_url(self, feed_url, feed_parser):
+        """
+        URL the feed permanently redirects to, feedparser follows redirects and keeps the status of the redirect
+        """
+        permanent_url = getattr(feed_parser, 'href', None)
+        if getattr(feed_parser, 'status', None) in self.PERMANENT_REDIRECT_STATUSES and permanent_url:
+            return permanent_url
+        return feed_url
+
+    def _follow_permanent_redirect(self, rss_feed: RSSFeed, feed_parser) -> bool:
+        """
+        Move the feed to the URL it permanently redirects to and keep the former URL as an alias.
+        When another feed already has that URL, followers move to it and True is returned
+        """
+        permanent_url = self._get_permanent_url(rss_feed.feed_url, feed_parser)
+        if permanent_url == rss_feed.feed_url:
+            return False
+
+        target_feed = RSSFeed.find_by_url(permanent_url)
+        if target_feed and target_feed != rss_feed:
+            self._add_alias(target_feed, rss_feed.feed_url)
+            RSSFeedFollowService().move_followers(rss_feed, target_feed)
+            return True
+
+        former_url = rss_feed.feed_url
+        rss_feed.feed_url = permanent_url
+        rss_feed.save(update_fields=("feed_url", "canonical_url", "modify_time"))
+        self._add_alias(rss_feed, former_url)
+        return False
+
+    @staticmethod
+    def _add_alias(rss_feed: RSSFeed, feed_url):
+        canonical_url = canonicalize_url(feed_url)
+        if canonical_url != rss_feed.canonical_url:
+            RSSFeedAlias.objects.update_or_create(
+                canonical_url=canonical_url, defaults={'feed': rss_feed, 'feed_url': feed_url}
+            )
+
     @staticmethod
     def _get_or_create_rss_feed(feed_url, feed_parser):
+        rss_feed = RSSFeed.find_by_url(feed_url)
+        if rss_feed:
+            return rss_feed
+
+        # set required fields
+        new_rss_feed = RSSFeed(
+            title=feed_parser.feed.title,
+            feed_url=feed_url,
+            last_checked=timezone.now(),
+            next_check=RSSFeed.calculate_next_check(),
+            last_status=feed_parser.status,
+        )
+        # set optional fields
+        if hasattr(feed_parser.feed, 'description'):
+            new_rss_feed.description = feed_parser.feed.description
+        if hasattr(feed_parser.feed, 'updated'):
+            new_rss_feed.last_update = parser.parse(feed_parser.feed.updated)
+
+        try:
+            with transaction.atomic():
+                new_rss_feed.save()
+        except IntegrityError:  # a concurrent request created the feed or a variant of its URL
+            return RSSFeed.find_by_url(feed_url)
+        return new_rss_feed
+
+
+class FeedSchedulerService:
+    """
+    Claims due feeds and orders them by priority so the feeds most users read stay fresh when refreshing falls behind.
+    The priority grows with followers, hours overdue and entries per day in the last POST_RATE_DAYS
+    """
+    HIGH_PRIORITY_QUEUE = 'feeds-high'
+    DEFAULT_PRIORITY_QUEUE = 'feeds-default'
+    LOW_PRIORITY_QUEUE = 'feeds-low'
+    HIGH_PRIORITY = 100
+    DEFAULT_PRIORITY = 10
+    FOLLOWER_WEIGHT = 1
+    STALENESS_WEIGHT = 1  # per overdue hour
+    POST_RATE_WEIGHT = 5  # per entry a day
+    POST_RATE_DAYS = 30
+    # claimed feeds are not claimed again until they are refreshed, it spans several ticks of `dispatch_feeds` so
+    # feeds waiting in a queue behind a backlog are not sent again
+    DISPATCH_LEASE = timedelta(hours=3)
+    CLAIM_BATCH_SIZE = 500
+    DISPATCH_BATCH_SIZE = 50  # feeds per `update_feed_batch` task
+
+    def claim_due_feeds(self):
+        """
+        Yields batches of due feeds in priority order. Each batch is claimed with `FOR UPDATE SKIP LOCKED` and leased
+        by pushing `next_check` forward, so concurrent dispatchers never claim the same feed
+        """
+        while True:
+            with transaction.atomic():
+                due_times = dict(
+                    RSSFeed.active_objects.filter(next_check__lte=timezone.now())
+                    .order_by('next_check')
+                    .select_for_update(skip_locked=True)
+                    .values_list('id', 'next_check')[:self.CLAIM_BATCH_SIZE]
+                )
+                if not due_times:
+                    return
+                RSSFeed.objects.filter(id__in=due_times).update(next_check=timezone.now() + self.DISPATCH_LEASE)
+            # feeds of the batch are read after the update, their `next_check` is the lease
+            yield self.prioritize(due_times)
+
+    def prioritize(self, due_times):
+        """
+        Returns the feeds of `due_times`, a map of feed id to the time it was due, sorted by priority
+        """
+        now = timezone.now()
+        recent_entry_count = Entry.objects.filter(
+            feed=OuterRef('pk'), create_time__gte=now - timedelta(days=self.POST_RATE_DAYS)
+        ).order_by().values('feed')
+        rss_feeds = list(
+            RSSFeed.objects.filter(id__in=due_times).annotate(recent_entry_count=self._count(recent_entry_count))
+        )
+        for rss_feed in rss_feeds:
+            rss_feed.priority = self.get_priority(rss_feed, due_times[rss_feed.id], now)
+        return sorted(rss_feeds, key=lambda rss_feed: rss_feed.priority, reverse=True)
+
+    def get_priority(self, rss_feed: RSSFeed, due_time, now) -> float:
+        overdue_hours = max((now - due_time).total_seconds() / 3600, 0)
+        post_rate = rss_feed.recent_entry_count / self.POST_RATE_DAYS
+        return (
+            rss_feed.follower_count * self.FOLLOWER_WEIGHT
+            + overdue_hours * self.STALENESS_WEIGHT
+            + post_rate * self.POST_RATE_WEIGHT
+        )
+
+    def get_queue(self, priority) -> str:
+        if priority >= self.HIGH_PRIORITY:
+            return self.HIGH_PRIORITY_QUEUE
+        if priority >= self.DEFAULT_PRIORITY:
+            return self.DEFAULT_PRIORITY_QUEUE
+        return self.LOW_PRIORITY_QUEUE
+
+    def dispatch(self):
+        """
+        Send due feeds to the queue of their priority tier in `update_feed_batch` tasks of DISPATCH_BATCH_SIZE feeds,
+        in priority order. A task saves the statuses of its feeds in one statement, it gets the lease of its feeds
+        and skips those claimed again since
+        """
+        from .tasks import update_feed_batch
+        for rss_feeds in self.claim_due_feeds():
+            rss_feed_ids_by_queue = defaultdict(list)
+            for rss_feed in rss_feeds:
+                rss_feed_ids_by_queue[self.get_queue(rss_feed.priority)].append(str(rss_feed.id))
+            lease = rss_feeds[0].next_check.isoformat()
+            for queue, rss_feed_ids in rss_feed_ids_by_queue.items():
+                for index in range(0, len(rss_feed_ids), self.DISPATCH_BATCH_SIZE):
+                    update_feed_batch.apply_async(
+                        (rss_feed_ids[index:index + self.DISPATCH_BATCH_SIZE], lease), queue=queue
+                    )
+
+    @staticmethod
+    def _count(queryset):
+        return Coalesce(Subquery(queryset.annotate(count=Count('id')).values('count'), output_field=IntegerField()), 0)
+
+
+class WebSubService:
+    """
+    Push delivery of feeds which advertise a WebSub hub, polling takes over again when the hub goes quiet
+    """
+    HUB_TIMEOUT = 10  # second
+    MAX_LEASE_SECONDS = 365 * 24 * 3600
+
+    def subscribe_if_advertised(self, rss_feed: RSSFeed, feed_parser):
+        if not settings.WEBSUB_CALLBACK_BASE_URL:
+            return None
+        if WebSubSubscription.objects.filter(feed=rss_feed).exists():
+            return None
+
+        hub_url, topic_url = self._discover(feed_parser)
+        if not hub_url:
+            return None
+
+        subscription = WebSubSubscription.objects.create(
+            feed=rss_feed,
+            hub_url=hub_url,
+            topic_url=topic_url or rss_feed.feed_url,
+            secret=secrets.token_hex(32),
+        )
+        self.subscribe(subscription)
+        return subscription
+
+    def subscribe(self, subscription: WebSubSubscription) -> bool:
+        """
+        Ask the hub for a (new) lease, the hub confirms it asynchronously through the callback endpoint
+        """
+        data = {
+            'hub.mode': 'subscribe',
+            'hub.topic': subscription.topic_url,
+            'hub.callback': self._get_callback_url(subscription),
+            'hub.secret': subscription.secret,
+            'hub.lease_seconds': settings.WEBSUB_LEASE_SECONDS,
+        }
         try:
-            return RSSFeed.objects.get(title__exact=feed_parser.feed.title, feed_url=feed_url)
-        except RSSFeed.DoesNotExist:
-            # set required fields
-            new_rss_feed = RSSFeed(
-                title=feed_parser.feed.title,
-                feed_url=feed_url,
-                last_checked=timezone.now(),
-                next_check=RSSFeed.calculate_next_check(),
-                last_status=feed_parser.status,
+            status = self._post_to_hub(subscription.hub_url, data)
+        except (URLError, OSError):
+            return False
+        return 200 <= status < 300
+
+    def verify(self, subscription: WebSubSubscription, mode, topic, lease_seconds=None) -> bool:
+        """
+        Confirm the subscriptions we asked for. We never ask a hub to unsubscribe, so an unsubscribe request is refused
+        and the subscription is kept. A denied subscription is left to polling
+        """
+        if topic != subscription.topic_url:
+            return False
+        if mode == 'subscribe':
+            subscription.verify(self._get_lease_seconds(lease_seconds))
+            self._postpone_polling(subscription.feed)
+            return True
+        if mode == 'denied':
+            subscription.is_verified = False
+            subscription.save()
+        return False
+
+    def ingest(self, subscription: WebSubSubscription, body, signature, create_or_update_entries_function) -> bool:
+        if not subscription.is_verified or not subscription.is_valid_signature(body, signature):
+            return False
+
+        # feedparser reads a bytes or str argument as a file name or URL when it does not look like a document
+        feed_parser = feedparser.parse(io.BytesIO(body))
+        with transaction.atomic():
+            create_or_update_entries_function(subscription.feed, feed_parser.entries)
+            subscription.last_push = timezone.now()
+            subscription.save()
+            self._postpone_polling(subscription.feed)
+        return True
+
+    def renew_expiring(self):
+        """
+        Renew leases which expire soon, subscriptions the hub never verified (e.g. the first request failed) have no
+        lease and are requested again
+        """
+        renew_before = timezone.now() + timedelta(hours=settings.WEBSUB_QUIET_HOURS)
+        subscriptions = WebSubSubscription.objects.filter(
+            Q(lease_expires__lte=renew_before) | Q(lease_expires__isnull=True, is_verified=False),
+            feed__is_active=True,
+        )
+        for subscription in subscriptions.select_related('feed'):
+            self.subscribe(subscription)
+
+    @classmethod
+    def _get_lease_seconds(cls, lease_seconds) -> int:
+        """
+        Lease the hub granted, WEBSUB_LEASE_SECONDS when the hub sends none or an invalid one
+        """
+        try:
+            lease_seconds = int(lease_seconds)
+        except (TypeError, ValueError):
+            return settings.WEBSUB_LEASE_SECONDS
+        if lease_seconds <= 0:
+            return settings.WEBSUB_LEASE_SECONDS
+        return min(lease_seconds, cls.MAX_LEASE_SECONDS)
+
+    @staticmethod
+    def _postpone_polling(rss_feed: RSSFeed):
+        """
+        While the hub keeps pushing, polling is pushed back; once it goes quiet `update_feeds` polls the feed again
+        """
+        rss_feed.last_checked = timezone.now()
+        rss_feed.next_check = RSSFeed.calculate_next_check(settings.WEBSUB_QUIET_HOURS)
+        rss_feed.save()
+
+    @staticmethod
+    def _discover(feed_parser):
+        hub_url, topic_url = None, None
+        for link in feed_parser.feed.get('links', []):
+            if link.get('rel') == 'hub' and not hub_url:
+                hub_url = link.get('href')
+            elif link.get('rel') == 'self' and not topic_url:
+                topic_url = link.get('href')
+        return hub_url, topic_url
+
+    @staticmethod
+    def _get_callback_url(subscription: WebSubSubscription):
+        path = reverse('rss:websub-callback', kwargs={'pk': subscription.id})
+        return settings.WEBSUB_CALLBACK_BASE_URL.rstrip('/') + path
+
+    @classmethod
+    def _post_to_hub(cls, hub_url, data):
+        with urlopen(hub_url, data=urlencode(data).encode(), timeout=cls.HUB_TIMEOUT) as response:
+            return response.status
+
+
+class RSSFeedFollowService:
+    """
+    Follow many feeds at once, the followers are inserted in one statement and existing ones are ignored.
+    The feed rows are locked while following so the follower count is not increased twice for one follower
+    """
+
+    RECONCILE_BATCH_SIZE = 1000
+
+    def follow(self, user, rss_feeds):
+        rss_feeds = list({rss_feed.id: rss_feed for rss_feed in rss_feeds}.values())
+        if not rss_feeds:
+            return
+        with transaction.atomic():
+            # concurrent follows of the same feeds wait for the row locks, so a new follower is counted once
+            list(
+                RSSFeed.objects.select_for_update().filter(id__in=[rss_feed.id for rss_feed in rss_feeds])
+                .order_by('id').values_list('id', flat=True)
+            )
+            followed_feed_ids = set(
+                RSSFeedFollower.objects.filter(user=user, feed__in=rss_feeds).values_list('feed_id', flat=True)
             )
-            # set optional fields
-            if hasattr(feed_parser.feed, 'description'):
-                new_rss_feed.description = feed_parser.feed.description
-            if hasattr(feed_parser.feed, 'updated'):
-                new_rss_feed.last_update = parser.parse(feed_parser.feed.updated)
+            new_feed_ids = [rss_feed.id for rss_feed in rss_feeds if rss_feed.id not in followed_feed_ids]
+            RSSFeedFollower.objects.bulk_create(
+                [RSSFeedFollower(user=user, feed_id=rss_feed_id) for rss_feed_id in new_feed_ids], ignore_conflicts=True
+            )
+            RSSFeed.change_follower_count(new_feed_ids, 1)
+        InboxService().follow(user, *rss_feeds)
+        TimelineService().invalidate_for_user(user)
+
+    def move_followers(self, source_feed: RSSFeed, target_feed: RSSFeed):
+        """
+        Followers of a feed which turned out to be a copy of another feed follow that feed instead
+        """
+        with transaction.atomic():
+            followers = list(source_feed.followers.all())
+            for follower in followers:
+                self.follow(follower, [target_feed])
+            deleted, _ = RSSFeedFollower.objects.filter(feed=source_feed).delete()
+            RSSFeed.change_follower_count([source_feed.id], -deleted)
+            InboxEntry.objects.filter(user__in=followers, entry__feed=source_feed).delete()
+
+    def follow_after_registration(self, user, feed_urls):
+        """
+        Register feeds that do not exist yet, the user follows each of them once `create_rss_feed` task creates it
+        """
+        from .tasks import create_rss_feed
+        registrations, registration_ids_to_enqueue = [], []
+        for feed_url in feed_urls:
+            registration, enqueue = RSSFeedService().register(feed_url)
+            registrations.append(registration)
+            if enqueue:
+                registration_ids_to_enqueue.append(registration.id)
+
+        self.follow(user, [registration.rss_feed for registration in registrations if registration.rss_feed])
+        RSSFeedRegistration.followers.through.objects.bulk_create(
+            [
+                RSSFeedRegistration.followers.through(rssfeedregistration_id=registration.id, user_id=user.id)
+                for registration in registrations if registration.status != RSSFeedRegistration.CREATED
+            ],
+            ignore_conflicts=True,
+        )
+        if registration_ids_to_enqueue:
+            tasks = group(create_rss_feed.s(registration_id) for registration_id in registration_ids_to_enqueue)
+            transaction.on_commit(lambda: tasks.delay())
+        return registrations
+
+    def follow_registered_feed(self, registration: RSSFeedRegistration):
+        for user in registration.followers.all():
+            self.follow(user, [registration.rss_feed])
+        registration.followers.clear()
+
+    def reconcile_follower_counts(self) -> int:
+        """
+        Fix follower counts which drifted from the followers, e.g. when users were deleted.
+        Returns the number of fixed feeds
+        """
+        follower_count = Coalesce(
+            Subquery(
+                RSSFeedFollower.objects.filter(feed=OuterRef('pk')).order_by().values('feed')
+                .annotate(count=Count('id')).values('count'),
+                output_field=IntegerField(),
+            ),
+            0,
+        )
+        fixed, rss_feeds = 0, RSSFeed.objects.order_by('id')
+        while True:
+            batch = list(rss_feeds.values_list('id', flat=True)[:self.RECONCILE_BATCH_SIZE])
+            if not batch:
+                return fixed
+            fixed += (
+                RSSFeed.objects.filter(id__in=batch)
+                .exclude(follower_count=follower_count)
+                .update(follower_count=follower_count)
+            )
+            rss_feeds = RSSFeed.objects.order_by('id').filter(id__gt=batch[-1])
+
 
-            new_rss_feed.save()
-            return new_rss_feed
+class OPMLService:
+    """
+    Import and export of followed feeds as OPML, the subscription list format of feed readers
+    """
+    MAX_OUTLINES = 1000
+
+    def parse(self, opml_file):
+        """
+        Returns unique feed URLs of the outlines, outlines are nested in categories in most files
+        """
+        try:
+            root = ElementTree.fromstring(opml_file.read())
+        except ElementTree.ParseError:
+            raise InvalidOPML
+        if root.tag != 'opml':
+            raise InvalidOPML
+
+        feed_urls = []
+        for outline in root.iter('outline'):
+            feed_url = outline.get('xmlUrl') or outline.get('xmlurl')
+            if not feed_url or feed_url in feed_urls:
+                continue
+            try:
+                URLValidator()(feed_url)
+            except ValidationError:
+                continue
+            feed_urls.append(feed_url)
+        if len(feed_urls) > self.MAX_OUTLINES:
+            raise InvalidOPML(f'OPML file can have at most {self.MAX_OUTLINES} feeds')
+        return feed_urls
+
+    def import_feeds(self, user, feed_urls):
+        """
+        Existing feeds are followed right away, others are fetched in parallel and followed when they are created.
+        Returns followed feeds and registrations of missing feeds
+        """
+        feed_urls = {canonicalize_url(feed_url): feed_url for feed_url in feed_urls}
+        feed_ids = dict(RSSFeed.objects.filter(canonical_url__in=feed_urls).values_list('canonical_url', 'id'))
+        feed_ids.update(RSSFeedAlias.objects.filter(canonical_url__in=feed_urls).values_list('canonical_url', 'feed_id'))
+        rss_feeds = list(RSSFeed.objects.filter(id__in=feed_ids.values()))
+        follow_service = RSSFeedFollowService()
+        follow_service.follow(user, rss_feeds)
+        missing_feed_urls = [feed_url for canonical_url, feed_url in feed_urls.items() if canonical_url not in feed_ids]
+        registrations = follow_service.follow_after_registration(user, missing_feed_urls)
+        return rss_feeds, registrations
+
+    def export(self, user) -> bytes:
+        opml = ElementTree.Element('opml', version='2.0')
+        head = ElementTree.SubElement(opml, 'head')
+        ElementTree.SubElement(head, 'title').text = f'Feeds of {user.get_username()}'
+        body = ElementTree.SubElement(opml, 'body')
+        for title, feed_url in RSSFeed.objects.filter(followers=user).order_by('title').values_list('title', 'feed_url'):
+            ElementTree.SubElement(body, 'outline', type='rss', text=title, title=title, xmlUrl=feed_url)
+        return ElementTree.tostring(opml, encoding='utf-8', xml_declaration=True)
 
 
 class EntryService:
     def create_or_update(self, rss_feed: RSSFeed, entries):
-        get_query = dict()
-        for row in entries:
-            if hasattr(row, 'link'):
-                get_query['url'] = row.link
-            if hasattr(row, 'id'):
-                get_query['guid'] = row.id
-            if hasattr(row, 'title'):
-                get_query['title'] = row.title
+        """
+        Store the entries of the feed which are not stored yet, feedparser items are normalized to ParsedEntry records
+        """
+        parsed_entries = normalize_entries(entries)
+        stored_entries = self._get_stored_entries(rss_feed, parsed_entries)
+        deduplication_service = EntryDeduplicationService()
+        new_entries, new_contents = [], []
+        for parsed_entry in parsed_entries:
+            if self._is_stored(parsed_entry, stored_entries):
+                continue
+            stored_entries[parsed_entry.title].append((parsed_entry.url, parsed_entry.guid))
+
+            # the API serves the description as stored, it is sanitized and summarized once here
+            content, text = html.sanitize(parsed_entry.content)
+            new_entry = Entry(
+                feed=rss_feed,
+                title=parsed_entry.title,
+                url=parsed_entry.url,
+                guid=parsed_entry.guid,
+                summary=Entry.summarize(text),
+                word_count=html.count_words(text),
+                publish_date=parsed_entry.publish_date or timezone.now(),
+            )
+            deduplication_service.fingerprint(new_entry, content)
+            new_entries.append(new_entry)
+            new_contents.append(EntryContent(entry=new_entry, content=content))
+
+        if new_entries:
+            # copies of the entries in other feeds are linked to them, they do not make them stored entries
+            deduplication_service.find_canonicals(rss_feed, new_entries)
+            # duplicates read the content of their canonical entry
+            new_contents = [new_content for new_content in new_contents if new_content.entry.canonical is None]
+            Entry.objects.bulk_create(new_entries)
+            EntryContent.objects.bulk_create(new_contents)
+            new_entry_ids = [new_entry.id for new_entry in new_entries]
+            transaction.on_commit(lambda: TimelineService().invalidate_for_feed(rss_feed))
+            transaction.on_commit(lambda: EntryNotificationService().publish(rss_feed, new_entry_ids))
+            InboxService().schedule_fan_out(rss_feed, new_entry_ids)
+
+    @staticmethod
+    def _get_stored_entries(rss_feed: RSSFeed, parsed_entries):
+        """
+        URL and GUID of the stored entries of the feed by title, one query for all the parsed entries.
+        Archived entries count as stored, feeds keep listing old items (e.g. the back catalogue of a podcast)
+        """
+        stored_entries = defaultdict(list)
+        titles = {parsed_entry.title for parsed_entry in parsed_entries}
+        entries = Entry.objects.filter(feed=rss_feed, title__in=titles).order_by().values_list('url', 'guid', 'title')
+        archived_entries = (
+            ArchivedEntry.objects.filter(feed=rss_feed, title__in=titles).order_by().values_list('url', 'guid', 'title')
+        )
+        for url, guid, title in entries.union(archived_entries, all=True):
+            stored_entries[title].append((url, guid))
+        return stored_entries
+
+    @staticmethod
+    def _is_stored(parsed_entry: ParsedEntry, stored_entries) -> bool:
+        # the URL and the GUID are compared only when the feed gives them
+        return any(
+            parsed_entry.url in (None, url) and parsed_entry.guid in (None, guid)
+            for url, guid in stored_entries[parsed_entry.title]
+        )
+
+
+class EntryDeduplicationService:
+    """
+    Links an entry syndicated by several feeds (e.g. an aggregator and the origin feed) to the first stored copy.
+    Copies share the canonical URL, or have the same title and a SimHash of the description at most
+    MAX_DISTANCE bits apart within WINDOW
+    """
+    MAX_DISTANCE = 3  # bit
+    WINDOW = timedelta(days=7)
+    MAX_CANDIDATES = 10
+
+    def fingerprint(self, entry: Entry, content):
+        entry.url_fingerprint = fingerprint.url_fingerprint(entry.url)
+        entry.content_hash = fingerprint.simhash(content)
+
+    def find_canonicals(self, rss_feed: RSSFeed, entries):
+        """
+        Set `canonical` of the new entries of the feed, candidates of all of them are read in one query
+        """
+        titles = {entry.title for entry in entries}
+        url_fingerprints = {entry.url_fingerprint for entry in entries if entry.url_fingerprint}
+        window_start = timezone.now() - self.WINDOW
+        query = Q(title__in=titles, create_time__gte=window_start)
+        if url_fingerprints:
+            query |= Q(url_fingerprint__in=url_fingerprints)
+        candidates = list(
+            Entry.objects.filter(query, canonical__isnull=True)
+            .exclude(feed=rss_feed)
+            .only('id', 'title', 'create_time', 'url_fingerprint', 'content_hash')
+            .order_by('create_time')
+        )
+        for entry in entries:
+            entry.canonical = self._find_canonical(entry, candidates, window_start)
+
+    def _find_canonical(self, entry: Entry, candidates, window_start):
+        candidates = [
+            candidate for candidate in candidates
+            if (candidate.title == entry.title and candidate.create_time >= window_start)
+            or (entry.url_fingerprint and candidate.url_fingerprint == entry.url_fingerprint)
+        ][:self.MAX_CANDIDATES]
+        for candidate in candidates:
+            if entry.url_fingerprint and candidate.url_fingerprint == entry.url_fingerprint:
+                return candidate
+            if None in (candidate.content_hash, entry.content_hash):
+                continue
+            if fingerprint.hamming_distance(candidate.content_hash, entry.content_hash) <= self.MAX_DISTANCE:
+                return candidate
+        return None
+
+
+class EntryNotificationService:
+    """
+    Redis pub/sub of new entries, one channel per feed. Notifications are best effort, clients catch up with `since`
+    """
+    CHANNEL = 'rss:feed:{feed_id}:entries'
+    CHANNEL_PATTERN = 'rss:feed:*:entries'
+
+    def publish(self, rss_feed: RSSFeed, entry_ids):
+        message = json.dumps({'feed_id': str(rss_feed.id), 'entry_ids': [str(entry_id) for entry_id in entry_ids]})
+        try:
+            get_redis_connection().publish(self.CHANNEL.format(feed_id=rss_feed.id), message)
+        except (RedisError, NotImplementedError):  # redis is down or the cache backend is not redis
+            logger.warning("New entries of feed %s were not published", rss_feed.id, exc_info=True)
+
+    async def wait(self, feed_ids, timeout):
+        """
+        Wait until one of the feeds gets new entries or timeout passes, returns ids of new entries or None
+        """
+        if not feed_ids:
+            await asyncio.sleep(timeout)
+            return None
+        return await EntrySubscriber.get().wait(feed_ids, timeout)
+
+
+class EntrySubscriber:
+    """
+    One subscription to the entry channels per process. A thread reads the messages while long-polls wait and
+    resolves their futures on their event loops, so a waiting client costs a future instead of a thread
+    """
+    POLL_TIMEOUT = 1  # second, the thread stops within this once no client waits
+    RETRY_DELAY = 5  # second
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = defaultdict(set)  # feed id -> futures
+        self.thread = None
 
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    async def wait(self, feed_ids, timeout):
+        future = asyncio.get_running_loop().create_future()
+        feed_ids = [str(feed_id) for feed_id in feed_ids]
+        with self.lock:
+            for feed_id in feed_ids:
+                self.waiters[feed_id].add(future)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.listen, name='entry-subscriber', daemon=True)
+                self.thread.start()
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self.lock:
+                for feed_id in feed_ids:
+                    self.waiters[feed_id].discard(future)
+                    if not self.waiters[feed_id]:
+                        del self.waiters[feed_id]
+
+    def listen(self):
+        pubsub = None
+        try:
+            while True:
+                with self.lock:
+                    if not self.waiters:
+                        self.thread = None
+                        return
+                try:
+                    if pubsub is None:
+                        pubsub = get_redis_connection().pubsub(ignore_subscribe_messages=True)
+                        pubsub.psubscribe(EntryNotificationService.CHANNEL_PATTERN)
+                    message = pubsub.get_message(timeout=self.POLL_TIMEOUT)
+                except (RedisError, OSError, NotImplementedError):
+                    logger.warning("Entry notifications are not received", exc_info=True)
+                    pubsub = None
+                    time.sleep(self.RETRY_DELAY)
+                    continue
+                if message is not None:
+                    self.dispatch(json.loads(message['data']))
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+    def dispatch(self, message):
+        with self.lock:
+            futures = list(self.waiters.get(message['feed_id'], ()))
+        for future in futures:
             try:
-                Entry.objects.get(**get_query)
-            except Entry.DoesNotExist:
-                new_entry = Entry(feed=rss_feed, title=row.title)
-                if hasattr(row, 'link'):
-                    new_entry.url = row.link
-                if hasattr(row, 'id'):
-                    new_entry.guid = row.id
-
-                if hasattr(row, 'content'):
-                    new_entry.content = row.content[0].value
-                elif hasattr(row, 'description'):
-                    new_entry.content = row.description
-
-                if hasattr(row, 'published'):
-                    new_entry.publish_date = parser.parse(row.published)
-                elif hasattr(row, 'updated'):
-                    new_entry.publish_date = parser.parse(row.updated)
-
-                new_entry.save()
+                future.get_loop().call_soon_threadsafe(self._resolve, future, message['entry_ids'])
+            except RuntimeError:  # the loop of the request was closed
+                continue
+
+    @staticmethod
+    def _resolve(future, entry_ids):
+        if not future.done():
+            future.set_result(entry_ids)
+
+
+class TimelineService:
+    """
+    Latest entries of the feeds a user follows, the head page is cached per user until those feeds get new entries
+    """
+    HEAD_CACHE_KEY = 'rss:timeline-head:{user_id}'
+
+    def get_queryset(self, user):
+        """
+        Users with an inbox get a queryset of InboxEntry, pages of it are read from the inbox index alone
+        and their entries are loaded with `get_entries`
+        """
+        if TimelineInbox.objects.filter(user=user).exists():
+            return InboxEntry.objects.filter(user=user)
+        followed_feeds = RSSFeedFollower.objects.filter(user=user).values('feed_id')
+        return Entry.objects.filter(feed_id__in=followed_feeds, publish_date__isnull=False)
+
+    @staticmethod
+    def get_entries(inbox_entries):
+        entries = Entry.objects.in_bulk([inbox_entry.entry_id for inbox_entry in inbox_entries])
+        return [entries[inbox_entry.entry_id] for inbox_entry in inbox_entries if inbox_entry.entry_id in entries]
+
+    def get_head_entry_ids(self, user, queryset, ordering, size):
+        cache_key = self.HEAD_CACHE_KEY.format(user_id=user.id)
+        entry_ids = cache.get(cache_key)
+        if entry_ids is None:
+            id_field = 'entry_id' if queryset.model is InboxEntry else 'id'
+            # read from the primary, a replica behind the ingest would leave out new entries until the page expires
+            queryset = queryset.using(DEFAULT_DB_ALIAS)
+            entry_ids = list(queryset.order_by(*ordering).values_list(id_field, flat=True)[:size])
+            cache.set(cache_key, entry_ids, settings.TIMELINE_CACHE_TIMEOUT)
+        return entry_ids
+
+    def invalidate_for_user(self, user):
+        cache.delete(self.HEAD_CACHE_KEY.format(user_id=user.id))
+
+    def invalidate_for_feed(self, rss_feed: RSSFeed):
+        self.invalidate_for_users(RSSFeedFollower.objects.filter(feed=rss_feed).values_list('user_id', flat=True))
+
+    def invalidate_for_users(self, user_ids):
+        cache.delete_many([self.HEAD_CACHE_KEY.format(user_id=user_id) for user_id in user_ids])
+
+
+class InboxService:
+    """
+    Fan-out-on-write of new entries to timeline inboxes, for users who follow too many feeds to join them on read
+    """
+    BATCH_SIZE = 1000
+
+    def enable(self, user):
+        inbox, created = TimelineInbox.objects.get_or_create(user=user)
+        if created:
+            followed_feeds = RSSFeedFollower.objects.filter(user=user).values('feed_id')
+            entries = Entry.objects.filter(feed_id__in=followed_feeds, publish_date__isnull=False)
+            self._add_entries([inbox], entries.order_by('-publish_date', '-id')[:inbox.max_length])
+        return inbox
+
+    def disable(self, user):
+        TimelineInbox.objects.filter(user=user).delete()
+        InboxEntry.objects.filter(user=user).delete()
+
+    def follow(self, user, *rss_feeds: RSSFeed):
+        inbox = TimelineInbox.objects.filter(user=user).first()
+        if inbox:
+            entries = Entry.objects.filter(feed__in=rss_feeds, publish_date__isnull=False).order_by('-publish_date', '-id')
+            self._add_entries([inbox], entries[:inbox.max_length])
+            self.trim(inbox)
+
+    def unfollow(self, user, rss_feed: RSSFeed):
+        InboxEntry.objects.filter(user=user, entry__feed=rss_feed).delete()
+
+    def schedule_fan_out(self, rss_feed: RSSFeed, entry_ids):
+        """
+        Users who have not enabled their inbox read the timeline with a join, so nothing is queued for them
+        """
+        if TimelineInbox.objects.filter(user__rssfeedfollower__feed=rss_feed).exists():
+            from .tasks import fan_out_entries
+            entry_ids = [str(entry_id) for entry_id in entry_ids]
+            transaction.on_commit(lambda: fan_out_entries.delay(str(rss_feed.id), entry_ids))
+
+    def fan_out(self, rss_feed_id, entry_ids):
+        inboxes = list(TimelineInbox.objects.filter(user__rssfeedfollower__feed_id=rss_feed_id))
+        self._add_entries(inboxes, Entry.objects.filter(id__in=entry_ids, publish_date__isnull=False))
+        for inbox in inboxes:
+            self.trim(inbox)
+        # the head pages were invalidated when the entries were stored, a read since then cached them without the entries
+        TimelineService().invalidate_for_users(inbox.user_id for inbox in inboxes)
+
+    def trim(self, inbox: TimelineInbox):
+        inbox_entries = InboxEntry.objects.filter(user_id=inbox.user_id)
+        boundary = inbox_entries.order_by('-publish_date', '-entry_id').values_list('publish_date', flat=True)
+        boundary = boundary[inbox.max_length:inbox.max_length + 1]
+        if boundary:
+            inbox_entries.filter(publish_date__lte=boundary[0]).delete()
+
+    def _add_entries(self, inboxes, entries):
+        entries = list(entries.values_list('id', 'publish_date'))
+        InboxEntry.objects.bulk_create(
+            [
+                InboxEntry(user_id=inbox.user_id, entry_id=entry_id, publish_date=publish_date)
+                for inbox in inboxes
+                for entry_id, publish_date in entries
+            ],
+            batch_size=self.BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+class EntryRetentionService:
+    """
+    Move entries older than the retention horizon of their feed to the archive table,
+    bookmarked, favourited and commented entries are kept
+    """
+    BATCH_SIZE = 500
+
+    def archive(self) -> int:
+        now = timezone.now()
+        archived = 0
+        if settings.ENTRY_RETENTION_DAYS:
+            feeds = RSSFeed.objects.filter(retention_days__isnull=True)
+            archived += self._archive_feeds(feeds, now - timedelta(days=settings.ENTRY_RETENTION_DAYS))
+
+        retention_days = RSSFeed.objects.filter(retention_days__isnull=False).values_list('retention_days', flat=True)
+        for days in retention_days.order_by().distinct():
+            feeds = RSSFeed.objects.filter(retention_days=days)
+            archived += self._archive_feeds(feeds, now - timedelta(days=days))
+        return archived
+
+    def _archive_feeds(self, feeds, horizon) -> int:
+        queryset = Entry.objects.filter(
+            Q(publish_date__lt=horizon) | Q(publish_date__isnull=True, create_time__lt=horizon),
+            feed__in=feeds,
+        ).exclude(
+            id__in=BookmarkedEntry.objects.values('entry_id')
+        ).exclude(
+            id__in=FavouritedEntry.objects.values('entry_id')
+        ).exclude(
+            id__in=EntryComment.objects.values('entry_id')
+        ).exclude(
+            # copies in other feeds read the content of canonical entries, they are archived first
+            id__in=Entry.objects.filter(canonical__isnull=False).values('canonical_id')
+        ).order_by('publish_date')
+
+        archived = 0
+        while True:
+            archived_in_batch = self._archive_batch(queryset)
+            archived += archived_in_batch
+            if archived_in_batch < self.BATCH_SIZE:
+                return archived
+
+    def _archive_batch(self, queryset) -> int:
+        with transaction.atomic():
+            entries = queryset.select_related('body', 'canonical__body').select_for_update(skip_locked=True, of=('self',))
+            entries = list(entries[:self.BATCH_SIZE])
+            entry_ids = [entry.id for entry in entries]
+            ArchivedEntry.objects.bulk_create([ArchivedEntry.from_entry(entry) for entry in entries], ignore_conflicts=True)
+            SeenEntry.objects.filter(entry_id__in=entry_ids).delete()
+            Entry.objects.filter(id__in=entry_ids).delete()
+        return len(entries)
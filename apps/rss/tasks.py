@@ -1,15 +1,89 @@
 from celery import shared_task
 from django.contrib.auth import get_user_model
-from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from .models import RSSFeed
-from .services import EntryService, RSSFeedService
+from .exceptions import InvalidFeedURL
+from .models import RSSFeed, RSSFeedRegistration
+from .parsing import parse_pool
+from .services import (
+    EntryService,
+    RSSFeedService,
+    RSSFeedFollowService,
+    FeedSchedulerService,
+    WebSubService,
+    InboxService,
+    EntryRetentionService,
+)
 
 User = get_user_model()
 
 
+@shared_task
+def dispatch_feeds(*args, **kwargs):
+    FeedSchedulerService().dispatch()
+
+
+@shared_task
+def update_feed_batch(rss_feed_ids, lease=None):
+    """
+    Refresh a batch of feeds `dispatch_feeds` sent to a priority queue, in the order they were sent.
+    Feeds whose `next_check` is no longer the lease they were sent with were claimed again and sent in a newer task.
+    Feeds are downloaded concurrently and parsed in RSS_PARSE_POOL_SIZE processes when it is set
+    """
+    rss_feed_ids = [str(rss_feed_id) for rss_feed_id in rss_feed_ids]
+    queryset = RSSFeed.active_objects.filter(id__in=rss_feed_ids)
+    if lease:
+        queryset = queryset.filter(next_check=parse_datetime(lease))
+    rss_feeds = {str(rss_feed.id): rss_feed for rss_feed in queryset}
+    with parse_pool() as pool:
+        RSSFeedService().update_batch(
+            [rss_feeds[rss_feed_id] for rss_feed_id in rss_feed_ids if rss_feed_id in rss_feeds],
+            EntryService().create_or_update,
+            parse_pool=pool,
+        )
+
+
 @shared_task
 def update_feeds(*args, **kwargs):
-    for feed in RSSFeed.active_objects.filter(next_check__lte=timezone.now()):
-        rss_service = RSSFeedService()
-        rss_service.update(feed, EntryService().create_or_update)
+    """
+    Refresh due feeds in this worker in priority order, `dispatch_feeds` spreads them over the priority queues instead.
+    Feeds of a batch are downloaded concurrently and parsed in RSS_PARSE_POOL_SIZE processes when it is set
+    """
+    rss_service = RSSFeedService()
+    entry_service = EntryService()
+    with parse_pool() as pool:
+        for rss_feeds in FeedSchedulerService().claim_due_feeds():
+            rss_service.update_batch(rss_feeds, entry_service.create_or_update, parse_pool=pool)
+
+
+@shared_task
+def create_rss_feed(registration_id):
+    registration = RSSFeedRegistration.objects.get(id=registration_id)
+    try:
+        rss_feed = RSSFeedService().create(
+            feed_url=registration.feed_url,
+            create_or_update_entries_function=EntryService().create_or_update
+        )
+    except InvalidFeedURL as e:
+        registration.fail(e.message)
+    except Exception:
+        registration.fail('RSS Feed could not be fetched')
+        raise
+    else:
+        registration.complete(rss_feed)
+        RSSFeedFollowService().follow_registered_feed(registration)
+
+
+@shared_task
+def fan_out_entries(rss_feed_id, entry_ids):
+    InboxService().fan_out(rss_feed_id, entry_ids)
+
+
+@shared_task
+def renew_websub_subscriptions(*args, **kwargs):
+    WebSubService().renew_expiring()
+
+
+@shared_task
+def archive_entries(*args, **kwargs):
+    EntryRetentionService().archive()
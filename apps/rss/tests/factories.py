@@ -1,7 +1,7 @@
-from factory import fuzzy, django, Faker, SubFactory
+from factory import fuzzy, django, Faker, SubFactory, RelatedFactory
 
 from apps.account.tests.factories import UserFactory
-from ..models import RSSFeed, Entry, EntryComment
+from ..models import RSSFeed, Entry, EntryContent, EntryComment
 
 
 class RSSFeedFactory(django.DjangoModelFactory):
@@ -26,8 +26,17 @@ class EntryFactory(django.DjangoModelFactory):
     title = Faker('name')
     url = Faker('url')
     guid = Faker('url')
-    content = Faker('text')
+    summary = Faker('sentence')
     publish_date = Faker('date_time')
+    body = RelatedFactory('apps.rss.tests.factories.EntryContentFactory', factory_related_name='entry')
+
+
+class EntryContentFactory(django.DjangoModelFactory):
+    class Meta:
+        model = EntryContent
+
+    entry = SubFactory(EntryFactory, body=None)
+    content = Faker('text')
 
 
 class EntryCommentFactory(django.DjangoModelFactory):
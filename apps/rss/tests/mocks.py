@@ -1,5 +1,45 @@
+import fnmatch
+import time
+from urllib.parse import urlparse
+
 import feedparser
 
+WEBSUB_FEED = '''
+<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">
+<channel>
+    <title>Sample Feed With Hub</title>
+    <description>Feed which advertises a hub</description>
+    <link>http://example.org/</link>
+    <atom:link rel="hub" href="http://hub.example.org/" />
+    <atom:link rel="self" href="http://example.org/feed.xml" />
+<item>
+    <title>Pushed entry title</title>
+    <link>http://example.org/entry/pushed</link>
+    <description>Pushed entry</description>
+    <pubDate>Thu, 05 Sep 2002 00:00:01 GMT</pubDate>
+    <guid>http://example.org/entry/pushed</guid>
+</item>
+</channel>
+</rss>
+'''
+
+DOWNLOADED_FEED = b'''<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/">
+<channel>
+    <title>Downloaded Feed</title>
+    <link>http://example.org/</link>
+    <item>
+        <title>Relative entry</title>
+        <link>/entry/1</link>
+        <guid isPermaLink="false">entry-1</guid>
+        <content:encoded><![CDATA[<p>Full content</p>]]></content:encoded>
+        <pubDate>Thu, 05 Sep 2002 00:00:01 GMT</pubDate>
+    </item>
+</channel>
+</rss>
+'''
+
 
 class FakerRssFeedParse:
     def valid_parser(*args, **kwargs):
@@ -29,11 +69,36 @@ class FakerRssFeedParse:
         parser.headers = {'content-type': 'xml'}
         return parser
 
+    def valid_parser_permanent_redirect(*args, **kwargs):
+        parser = FakerRssFeedParse.valid_parser()
+        parser.status = 301
+        parser.href = 'https://example.com/moved.xml'
+        return parser
+
+    def valid_parser_with_hub(*args, **kwargs):
+        parser = feedparser.parse(WEBSUB_FEED)
+        parser.status = 200
+        parser.headers = {'content-type': 'xml'}
+        return parser
+
     def invalid_parser_response_404(*args, **kwargs):
         parser = feedparser.parse('hello')
         parser.status = 404
         return parser
 
+    def invalid_parser_response_410(*args, **kwargs):
+        parser = feedparser.parse('hello')
+        parser.status = 410
+        return parser
+
+    def invalid_parser_response_503(*args, **kwargs):
+        parser = feedparser.parse('hello')
+        parser.status = 503
+        return parser
+
+    def invalid_parser_no_response(*args, **kwargs):
+        return feedparser.parse('hello')
+
     def invalid_parser_response_json(*args, **kwargs):
         parser = feedparser.parse('hello')
         parser.status = 200
@@ -41,5 +106,80 @@ class FakerRssFeedParse:
         return parser
 
 
+class FakeFeedDownload:
+    def valid_download(feed_url):
+        result = feedparser.FeedParserDict(
+            bozo=False, entries=[], feed=feedparser.FeedParserDict(), status=200, href=feed_url,
+            headers={'content-type': 'application/rss+xml'},
+        )
+        return DOWNLOADED_FEED, result
+
+    def no_response(feed_url):
+        result = feedparser.FeedParserDict(bozo=True, entries=[], feed=feedparser.FeedParserDict(), headers={})
+        return b'', result
+
+
 class FakeLimitError:
     FAKE_ERROR_LIMIT = 1
+
+
+class FakeWebSubHub:
+    """
+    Local stand-in for a WebSub hub, it records subscription requests instead of sending them over the network
+    """
+    def __init__(self, status=202):
+        self.status = status
+        self.requests = []
+
+    def post(self, hub_url, data):
+        self.requests.append((hub_url, data))
+        return self.status
+
+    @property
+    def callback_path(self):
+        return urlparse(self.requests[-1][1]['hub.callback']).path
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the redis pub/sub used by entry notifications, published messages are kept per channel
+    """
+    def __init__(self):
+        self.channels = {}
+        self.pubsubs = []
+
+    def publish(self, channel, message):
+        self.channels.setdefault(channel, []).append(message)
+        return 1
+
+    def pubsub(self, **kwargs):
+        pubsub = FakePubSub(self)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+
+class FakePubSub:
+    """
+    Messages published before the subscription are delivered too, unlike redis
+    """
+    POLL_INTERVAL = 0.01  # second
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.patterns = []
+
+    def psubscribe(self, *patterns):
+        self.patterns.extend(patterns)
+
+    def get_message(self, timeout=0):
+        deadline = time.monotonic() + timeout
+        while True:
+            for channel, messages in self.redis.channels.items():
+                if messages and any(fnmatch.fnmatchcase(channel, pattern) for pattern in self.patterns):
+                    return {'type': 'pmessage', 'channel': channel, 'data': messages.pop(0)}
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.POLL_INTERVAL)
+
+    def close(self):
+        self.patterns = []
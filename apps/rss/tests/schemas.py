@@ -1,5 +1,5 @@
 from apps.account.tests.schemas import user_read_only_schema
-from helper.test import generate_list_schema_schema
+from helper.test import generate_list_schema_schema, generate_keyset_list_schema_schema
 
 rss_feed_schema = {
     'id': {'type': 'string', 'required': True, 'nullable': False},
@@ -20,12 +20,18 @@ entry_schema = {
     'title': {'type': 'string', 'required': True, 'nullable': False},
     'url': {'type': 'string', 'required': True, 'nullable': True},
     'guid': {'type': 'string', 'required': True, 'nullable': True},
+    'summary': {'type': 'string', 'required': True, 'nullable': False},
+    'word_count': {'type': 'integer', 'required': True, 'nullable': False},
+    'comment_count': {'type': 'integer', 'required': True, 'nullable': False},
     'content': {'type': 'string', 'required': True, 'nullable': False},
     'publish_date': {'type': 'string', 'required': True, 'nullable': True},
+    'canonical': {'type': 'string', 'required': True, 'nullable': True},
     'is_bookmarked': {'type': 'boolean', 'required': True, 'nullable': False},
     'is_favourited': {'type': 'boolean', 'required': True, 'nullable': False},
 }
 
+entry_list_item_schema = {key: value for key, value in entry_schema.items() if key != 'content'}
+
 entry_comment_schema = {
     'id': {'type': 'string', 'required': True, 'nullable': False},
     'entry_id': {'type': 'string', 'required': True, 'nullable': False},
@@ -39,6 +45,22 @@ feed_schema_after_create = {
     'rss_feed': {'type': 'dict', 'required': True, 'nullable': True, 'schema': rss_feed_schema},
 }
 
+rss_feed_registration_schema = {
+    'id': {'type': 'string', 'required': True, 'nullable': False},
+    'feed_url': {'type': 'string', 'required': True, 'nullable': False},
+    'status': {'type': 'string', 'required': True, 'allowed': ['pending', 'created', 'failed']},
+    'message': {'type': 'string', 'required': True, 'nullable': False},
+    'rss_feed': {'type': 'dict', 'required': True, 'nullable': True, 'schema': rss_feed_schema},
+}
+
+opml_import_schema = {
+    'rss_feeds': {'type': 'list', 'required': True, 'schema': {'type': 'string'}},
+    'registrations': {
+        'type': 'list', 'required': True, 'schema': {'type': 'dict', 'schema': rss_feed_registration_schema}
+    },
+}
+
 rss_feed_list_schema = generate_list_schema_schema(rss_feed_schema)
-entry_list_schema = generate_list_schema_schema(entry_schema)
-entry_comment_list_schema = generate_list_schema_schema(entry_comment_schema)
+entry_list_schema = generate_list_schema_schema(entry_list_item_schema)
+entry_comment_list_schema = generate_keyset_list_schema_schema(entry_comment_schema)
+timeline_schema = generate_keyset_list_schema_schema(entry_list_item_schema)
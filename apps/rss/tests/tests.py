@@ -1,17 +1,48 @@
+import asyncio
+import hashlib
+import hmac
 import json
-from datetime import timedelta
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import StringIO
 from unittest import mock
+from urllib.error import URLError
 from uuid import uuid4
 
+import feedparser
+from asgiref.sync import async_to_sync
 from cerberus import Validator
-from django.test import TestCase
+from dateutil.tz import tzutc
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.contrib.sessions.models import Session
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 
 from apps.account.tests.factories import UserFactory
+from helper.db import ReplicaRoutingMiddleware, close_unusable_connections
+from helper.swagger import CachedSchemaGenerator
+from helper.url import canonicalize_url
+from rss_reader.urls import schema_view
 from .factories import RSSFeedFactory, EntryFactory, EntryCommentFactory
-from .mocks import FakerRssFeedParse, FakeLimitError
+from .mocks import (
+    FakerRssFeedParse,
+    FakeFeedDownload,
+    FakeLimitError,
+    FakeWebSubHub,
+    FakeRedis,
+    DOWNLOADED_FEED,
+    WEBSUB_FEED,
+)
 from .schemas import (
     rss_feed_list_schema,
     entry_list_schema,
@@ -19,9 +50,45 @@ from .schemas import (
     entry_comment_list_schema,
     entry_comment_schema,
     feed_schema_after_create,
+    rss_feed_registration_schema,
+    opml_import_schema,
+    timeline_schema,
+)
+from ..models import (
+    RSSFeed,
+    RSSFeedFollower,
+    Entry,
+    EntryContent,
+    BookmarkedEntry,
+    SeenEntry,
+    FavouritedEntry,
+    EntryComment,
+    ArchivedEntry,
+    TimelineInbox,
+    InboxEntry,
+    RSSFeedRegistration,
+    WebSubSubscription,
+)
+from ..parsing import FeedParsePool, ParsedEntry, get_parse_executor, parse
+from ..services import (
+    EntryService,
+    EntryNotificationService,
+    EntrySubscriber,
+    FeedSchedulerService,
+    RSSFeedService,
+    RSSFeedFollowService,
+    TimelineService,
+)
+from ..tasks import (
+    update_feeds,
+    update_feed_batch,
+    dispatch_feeds,
+    renew_websub_subscriptions,
+    create_rss_feed,
+    archive_entries,
+    fan_out_entries,
 )
-from ..models import RSSFeed, RSSFeedFollower, Entry, BookmarkedEntry, SeenEntry, FavouritedEntry, EntryComment
-from ..tasks import update_feeds
+from ..views import EntryStreamView
 
 
 class RSSFeedListTest(APITestCase):
@@ -85,6 +152,13 @@ class RSSFeedListTest(APITestCase):
             else:
                 self.assertFalse(result['is_followed'])
 
+    def test_order_by_follower_count(self):
+        self.active_feed_2.follow(self.user)
+        self.client.force_login(self.user)
+        response = self.client.get(f"{self.url}?ordering=-follower_count")
+        self.assertEqual(response.data['results'][0]['id'], str(self.active_feed_2.id))
+        self.assertEqual(response.data['results'][0]['number_of_followers'], 1)
+
     def test_number_of_followers_value(self):
         self.active_feed_1.follow(self.user)
         self.client.force_login(self.user)
@@ -111,6 +185,31 @@ class RSSFeedListTest(APITestCase):
                 self.assertEqual(result['number_of_unseen_entries'], 0)
 
 
+    def test_sparse_fields(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f"{self.url}?fields=id,title")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for result in response.data['results']:
+            self.assertEqual(set(result), {'id', 'title'})
+
+    def test_omit_fields(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f"{self.url}?omit=number_of_unseen_entries,number_of_followers")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for result in response.data['results']:
+            self.assertNotIn('number_of_unseen_entries', result)
+            self.assertNotIn('number_of_followers', result)
+            self.assertIn('is_followed', result)
+
+    def test_unrequested_fields_are_not_queried(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as all_fields_queries:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as sparse_fields_queries:
+            self.client.get(f"{self.url}?fields=id,title")
+        self.assertLess(len(sparse_fields_queries), len(all_fields_queries))
+
+
 class RSSFeedFollowTest(APITestCase):
     @classmethod
     def setUpTestData(cls):
@@ -172,6 +271,119 @@ class RSSFeedFollowTest(APITestCase):
         self.assertFalse(RSSFeedFollower.objects.filter(feed=self.active_feed_1, user=self.user).exists())
 
 
+@mock.patch('apps.rss.services.group')
+class OPMLTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = '/api/v1/rss/feeds/opml/'
+        cls.existing_feed = RSSFeedFactory(feed_url='https://example.com/existing.xml')
+        cls.followed_feed = RSSFeedFactory(feed_url='https://example.com/followed.xml')
+        cls.missing_feed_url = 'https://simpleisbetterthancomplex.com/feed.xml'
+
+        cls.user = UserFactory()
+        cls.followed_feed.follow(cls.user)
+        cls.auth_client = APIClient()
+        cls.auth_client.force_login(cls.user)
+
+    def opml_file(self, *feed_urls):
+        outlines = ''.join(f'<outline type="rss" text="feed" xmlUrl="{feed_url}"/>' for feed_url in feed_urls)
+        content = f'<?xml version="1.0"?><opml version="2.0"><body><outline text="News">{outlines}</outline></body></opml>'
+        return SimpleUploadedFile('feeds.opml', content.encode(), content_type='text/x-opml')
+
+    def import_opml(self, opml_file):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.auth_client.post(self.url, {'file': opml_file}, format='multipart')
+
+    def test_status_401(self, group):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export(self, group):
+        response = self.auth_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(self.followed_feed.feed_url.encode(), response.content)
+        self.assertNotIn(self.existing_feed.feed_url.encode(), response.content)
+
+    def test_import(self, group):
+        response = self.import_opml(self.opml_file(
+            self.existing_feed.feed_url, self.followed_feed.feed_url, self.missing_feed_url, self.missing_feed_url
+        ))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        schema_validator = Validator(opml_import_schema)
+        self.assertTrue(schema_validator.validate(json.loads(response.content)), msg=schema_validator.errors)
+        self.assertEqual(len(response.data['rss_feeds']), 2)
+        self.assertTrue(self.existing_feed.is_followed_by_user(self.user))
+        self.assertEqual(RSSFeedFollower.objects.filter(user=self.user).count(), 2)
+        registration = RSSFeedRegistration.objects.get(feed_url=self.missing_feed_url)
+        self.assertEqual([item['id'] for item in response.data['registrations']], [str(registration.id)])
+        self.assertEqual(list(registration.followers.all()), [self.user])
+        group.return_value.delay.assert_called_once()
+
+    def test_import_invalid_file(self, group):
+        response = self.import_opml(SimpleUploadedFile('feeds.opml', b'<html>', content_type='text/x-opml'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.import_opml(SimpleUploadedFile('feeds.opml', b'<html></html>', content_type='text/x-opml'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.valid_parser)
+    def test_follow_registered_feed(self, group):
+        self.import_opml(self.opml_file(self.missing_feed_url))
+        registration = RSSFeedRegistration.objects.get(feed_url=self.missing_feed_url)
+        create_rss_feed(registration.id)
+        self.assertTrue(RSSFeed.objects.get(feed_url=self.missing_feed_url).is_followed_by_user(self.user))
+        self.assertFalse(registration.followers.exists())
+
+    def test_follow_updates_follower_count(self, group):
+        self.existing_feed.follow(self.user)
+        with self.assertNumQueries(1):  # already followed, the count is not touched
+            self.existing_feed.follow(self.user)
+        self.assertEqual(RSSFeedFollower.objects.filter(user=self.user, feed=self.existing_feed).count(), 1)
+        self.existing_feed.refresh_from_db()
+        self.assertEqual(self.existing_feed.follower_count, 1)
+        with self.assertNumQueries(2):
+            self.existing_feed.unfollow(self.user)
+        with self.assertNumQueries(1):
+            self.existing_feed.unfollow(self.user)
+        self.assertFalse(self.existing_feed.is_followed_by_user(self.user))
+        self.existing_feed.refresh_from_db()
+        self.assertEqual(self.existing_feed.follower_count, 0)
+
+    def test_bulk_follow_updates_follower_count(self, group):
+        other_feed = RSSFeedFactory()
+        self.existing_feed.follow(self.user)
+        RSSFeedFollowService().follow(self.user, [self.existing_feed, other_feed, other_feed])
+        self.existing_feed.refresh_from_db()
+        other_feed.refresh_from_db()
+        self.assertEqual((self.existing_feed.follower_count, other_feed.follower_count), (1, 1))
+
+    def test_bulk_follow_locks_feeds(self, group):
+        other_feed = RSSFeedFactory()
+        with mock.patch.object(RSSFeed.objects, 'select_for_update', wraps=RSSFeed.objects.select_for_update) as lock:
+            RSSFeedFollowService().follow(self.user, [self.existing_feed, other_feed])
+            RSSFeedFollowService().follow(self.user, [self.existing_feed, other_feed])
+        self.assertEqual(lock.call_count, 2)
+        follower_counts = RSSFeed.objects.filter(id__in=[self.existing_feed.id, other_feed.id]).values_list(
+            'follower_count', flat=True
+        )
+        self.assertEqual(list(follower_counts), [1, 1])
+
+    def test_stale_instance_keeps_follower_count(self, group):
+        stale_feed = RSSFeed.objects.get(id=self.existing_feed.id)
+        self.existing_feed.follow(self.user)
+        stale_feed.title = 'Renamed'
+        stale_feed.save()
+        self.existing_feed.refresh_from_db()
+        self.assertEqual((self.existing_feed.title, self.existing_feed.follower_count), ('Renamed', 1))
+
+    def test_reconcile_follower_counts(self, group):
+        RSSFeedFollower.objects.create(user=UserFactory(), feed=self.existing_feed)  # not counted
+        out = StringIO()
+        call_command('reconcile_follower_counts', stdout=out)
+        self.assertIn('of 1 feeds', out.getvalue())
+        self.existing_feed.refresh_from_db()
+        self.assertEqual(self.existing_feed.follower_count, 1)
+
+
 class EntryListTest(APITestCase):
     @classmethod
     def setUpTestData(cls):
@@ -261,6 +473,185 @@ class EntryListTest(APITestCase):
         schema_validator = Validator(entry_list_schema)
         self.assertTrue(schema_validator.validate(json.loads(response.content)), msg=schema_validator.errors)
 
+    def test_content_field(self):
+        response = self.auth_client.get(f"{self.get_url()}?fields=id,content&feed_id={self.feed_1.id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for result in response.data['results']:
+            self.assertEqual(result['content'], Entry.objects.get(id=result['id']).content)
+
+
+class TimelineTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = '/api/v1/rss/timeline/'
+        cls.followed_feed_1 = RSSFeedFactory()
+        cls.followed_feed_2 = RSSFeedFactory()
+        cls.other_feed = RSSFeedFactory()
+        now = timezone.now()
+        for hours in range(3):
+            EntryFactory(feed=cls.followed_feed_1, publish_date=now - timedelta(hours=hours))
+            EntryFactory(feed=cls.followed_feed_2, publish_date=now - timedelta(hours=hours))
+            EntryFactory(feed=cls.other_feed, publish_date=now - timedelta(hours=hours))
+
+        cls.user = UserFactory()
+        cls.followed_feed_1.follow(cls.user)
+        cls.followed_feed_2.follow(cls.user)
+        cls.auth_client = APIClient()
+        cls.auth_client.force_login(cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_status_401(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_entries_of_followed_feeds(self):
+        response = self.auth_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        schema_validator = Validator(timeline_schema)
+        self.assertTrue(schema_validator.validate(json.loads(response.content)), msg=schema_validator.errors)
+        expected_ids = Entry.objects.filter(feed__in=(self.followed_feed_1, self.followed_feed_2)).order_by(
+            '-publish_date', '-id'
+        )
+        self.assertEqual([result['id'] for result in response.data['results']], [str(entry.id) for entry in expected_ids])
+        self.assertIsNone(response.data['next'])
+
+    def test_keyset_pages(self):
+        ids = []
+        url = f"{self.url}?page_size=4"
+        while url:
+            response = self.auth_client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 4)
+            ids += [result['id'] for result in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(len(set(ids)), 6)
+
+    def test_invalid_cursor(self):
+        response = self.auth_client.get(f"{self.url}?cursor=invalid")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_exclude_seen(self):
+        seen_entry = Entry.objects.filter(feed=self.followed_feed_1).first()
+        seen_entry.seen(self.user)
+        response = self.auth_client.get(f"{self.url}?exclude_seen=true")
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertNotIn(str(seen_entry.id), [result['id'] for result in response.data['results']])
+
+    def test_head_page_is_refreshed_after_new_entries(self):
+        self.auth_client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryService().create_or_update(self.followed_feed_1, FakerRssFeedParse.valid_parser().entries)
+        response = self.auth_client.get(self.url)
+        self.assertEqual(len(response.data['results']), 7)
+
+    def test_head_page_is_refreshed_after_unfollow(self):
+        self.auth_client.get(self.url)
+        self.auth_client.delete('/api/v1/rss/feeds/follow/', {'feed_id': self.followed_feed_2.id})
+        response = self.auth_client.get(self.url)
+        self.assertEqual(len(response.data['results']), 3)
+
+
+class TimelineInboxTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = '/api/v1/rss/timeline/'
+        cls.inbox_url = '/api/v1/rss/timeline/inbox/'
+        cls.feed = RSSFeedFactory()
+        cls.other_feed = RSSFeedFactory()
+        EntryFactory(feed=cls.feed, publish_date=timezone.now() - timedelta(hours=1))
+        EntryFactory(feed=cls.other_feed, publish_date=timezone.now() - timedelta(hours=1))
+
+        cls.user = UserFactory()
+        cls.feed.follow(cls.user)
+        cls.auth_client = APIClient()
+        cls.auth_client.force_login(cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_enable_inbox_with_backfill(self):
+        response = self.auth_client.patch(self.inbox_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(TimelineInbox.objects.filter(user=self.user).exists())
+        self.assertEqual(InboxEntry.objects.filter(user=self.user).count(), 1)
+        response = self.auth_client.get(self.url)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_disable_inbox(self):
+        self.auth_client.patch(self.inbox_url)
+        response = self.auth_client.delete(self.inbox_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(TimelineInbox.objects.filter(user=self.user).exists())
+        self.assertFalse(InboxEntry.objects.filter(user=self.user).exists())
+
+    @mock.patch('apps.rss.tasks.fan_out_entries.delay')
+    def test_fan_out_new_entries(self, delay):
+        self.auth_client.patch(self.inbox_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryService().create_or_update(self.feed, FakerRssFeedParse.valid_parser().entries)
+        delay.assert_called_once()
+        fan_out_entries(*delay.call_args.args)
+        self.assertEqual(InboxEntry.objects.filter(user=self.user).count(), 2)
+        response = self.auth_client.get(self.url)
+        self.assertEqual(len(response.data['results']), 2)
+
+    @mock.patch('apps.rss.tasks.fan_out_entries.delay')
+    def test_no_fan_out_without_inbox(self, delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryService().create_or_update(self.feed, FakerRssFeedParse.valid_parser().entries)
+        delay.assert_not_called()
+
+    def test_bounded_inbox(self):
+        self.auth_client.patch(self.inbox_url)
+        TimelineInbox.objects.filter(user=self.user).update(max_length=2)
+        new_entries = [EntryFactory(feed=self.feed, publish_date=timezone.now() - timedelta(minutes=m)) for m in range(2)]
+        fan_out_entries(str(self.feed.id), [str(entry.id) for entry in new_entries])
+        self.assertEqual(
+            set(InboxEntry.objects.filter(user=self.user).values_list('entry_id', flat=True)),
+            {entry.id for entry in new_entries}
+        )
+
+    def test_pages_are_read_from_inbox(self):
+        self.auth_client.patch(self.inbox_url)
+        new_entries = [EntryFactory(feed=self.feed, publish_date=timezone.now() - timedelta(minutes=m)) for m in range(3)]
+        fan_out_entries(str(self.feed.id), [str(entry.id) for entry in new_entries])
+        response = self.auth_client.get(self.url, {'page_size': 2})
+        self.assertEqual([entry['id'] for entry in response.data['results']], [str(entry.id) for entry in new_entries[:2]])
+        with CaptureQueriesContext(connection) as context:
+            response = self.auth_client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['id'], str(new_entries[2].id))
+        self.assertIsNone(response.data['next'])
+        page_query = next(query['sql'] for query in context.captured_queries if 'ORDER BY' in query['sql'])
+        self.assertIn('FROM "rss_inboxentry"', page_query)
+        self.assertNotIn('JOIN', page_query)
+
+    @mock.patch('apps.rss.tasks.fan_out_entries.delay')
+    def test_head_page_is_refreshed_after_fan_out(self, delay):
+        self.auth_client.patch(self.inbox_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryService().create_or_update(self.feed, FakerRssFeedParse.valid_parser().entries)
+        # read between storing the entries and fanning them out
+        self.assertEqual(len(self.auth_client.get(self.url).data['results']), 1)
+        fan_out_entries(*delay.call_args.args)
+        self.assertEqual(len(self.auth_client.get(self.url).data['results']), 2)
+
+    def test_exclude_seen_with_inbox(self):
+        self.auth_client.patch(self.inbox_url)
+        Entry.objects.get(feed=self.feed).seen(self.user)
+        response = self.auth_client.get(self.url, {'exclude_seen': True})
+        self.assertEqual(response.data['results'], [])
+
+    def test_follow_and_unfollow_with_inbox(self):
+        self.auth_client.patch(self.inbox_url)
+        self.auth_client.patch('/api/v1/rss/feeds/follow/', {'feed_id': self.other_feed.id})
+        self.assertEqual(InboxEntry.objects.filter(user=self.user).count(), 2)
+        self.auth_client.delete('/api/v1/rss/feeds/follow/', {'feed_id': self.other_feed.id})
+        self.assertEqual(InboxEntry.objects.filter(user=self.user).count(), 1)
+
 
 class EntryRetrieveTest(APITestCase):
     @classmethod
@@ -286,6 +677,12 @@ class EntryRetrieveTest(APITestCase):
         schema_validator = Validator(entry_schema)
         self.assertTrue(schema_validator.validate(json.loads(response.content)), msg=schema_validator.errors)
 
+    def test_omit_content(self):
+        response = self.auth_client.get(f"{self.get_url(self.entry_1_1)}?omit=content")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('content', response.data)
+        self.assertIn('summary', response.data)
+
     def test_seen_after_retrieve_when_user_has_not_followed_feed(self):
         self.assertFalse(SeenEntry.objects.filter(user=self.user, entry=self.entry_1_2).exists())
         response = self.auth_client.get(self.get_url(self.entry_1_2))
@@ -346,6 +743,14 @@ class EntryBookmarkTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK, msg=response.content)
         self.assertEqual(BookmarkedEntry.objects.filter(entry=self.entry_2_1, user=self.user).count(), 0)
 
+    def test_toggles_are_one_statement(self):
+        for toggle in (self.entry_1_1.add_bookmark, self.entry_1_1.add_bookmark, self.entry_1_1.remove_bookmark,
+                       self.entry_1_1.add_favourite, self.entry_1_1.remove_favourite, self.entry_1_1.seen):
+            with self.assertNumQueries(1):
+                toggle(self.user)
+        self.assertFalse(BookmarkedEntry.objects.filter(entry=self.entry_1_1, user=self.user).exists())
+        self.assertEqual(SeenEntry.objects.filter(entry=self.entry_1_1, user=self.user).count(), 1)
+
 
 class EntryFavouriteTest(APITestCase):
     @classmethod
@@ -454,11 +859,43 @@ class CommentEntryListTest(APITestCase):
     def test_entry_id_filter(self):
         response = self.auth_client.get(f'{self.url}?entry_id={self.entry_1.id}')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['count'], EntryComment.objects.filter(entry=self.entry_1).count())
+        self.assertEqual(len(response.data['results']), EntryComment.objects.filter(entry=self.entry_1).count())
 
         response = self.auth_client.get(f'{self.url}?entry_id={self.entry_2.id}')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data['count'], EntryComment.objects.filter(entry=self.entry_2).count())
+        self.assertEqual(len(response.data['results']), EntryComment.objects.filter(entry=self.entry_2).count())
+
+    def test_users_are_joined(self):
+        url = f'{self.url}?entry_id={self.entry_1.id}'
+        with CaptureQueriesContext(connection) as context:
+            self.auth_client.get(url)
+        EntryCommentFactory.create_batch(5, entry=self.entry_1)
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = self.auth_client.get(url)
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_keyset_pages(self):
+        EntryCommentFactory.create_batch(4, entry=self.entry_1)
+        comment_ids = []
+        url = f'{self.url}?entry_id={self.entry_1.id}&page_size=2'
+        while url:
+            response = self.auth_client.get(url)
+            comment_ids += [comment['id'] for comment in response.data['results']]
+            url = response.data['next']
+        expected = EntryComment.objects.filter(entry=self.entry_1).order_by('-create_time', '-id')
+        self.assertEqual(comment_ids, [str(comment.id) for comment in expected])
+
+    def test_comment_count(self):
+        self.entry_1.refresh_from_db()
+        self.assertEqual(self.entry_1.comment_count, 1)
+        comment = EntryCommentFactory(entry=self.entry_1)
+        comment.body = 'edited'
+        comment.save()
+        self.entry_1.refresh_from_db()
+        self.assertEqual(self.entry_1.comment_count, 2)
+        comment.delete()
+        response = self.auth_client.get(f'/api/v1/rss/entries/{self.entry_1.id}/')
+        self.assertEqual(response.data['comment_count'], 1)
 
 
 class TestCreateRSSFeed(APITestCase):
@@ -506,11 +943,140 @@ class TestCreateRSSFeed(APITestCase):
         self.assertFalse(response.data['rss_feed'])
 
 
+class FeedURLTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rss_feed = RSSFeedFactory(feed_url='https://example.com/feed.xml', number_of_errors=0)
+        cls.user = UserFactory()
+        cls.rss_feed.follow(cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_canonicalize_url(self):
+        self.assertEqual(canonicalize_url('HTTP://Example.com:80/feed/?utm_source=x&b=2&a=1#top'), 'example.com/feed?a=1&b=2')
+        self.assertEqual(canonicalize_url('https://example.com:8443/feed'), 'example.com:8443/feed')
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url')
+    def test_create_url_variant(self, parse_feed_url):
+        for feed_url in ('http://example.com/feed.xml', 'https://EXAMPLE.com/feed.xml/'):
+            self.assertEqual(RSSFeedService().create(feed_url), self.rss_feed)
+        parse_feed_url.assert_not_called()
+        self.assertEqual(RSSFeed.objects.count(), 1)
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.valid_parser_permanent_redirect)
+    def test_create_permanent_redirect(self):
+        rss_feed = RSSFeedService().create('https://example.com/old.xml', EntryService().create_or_update)
+        self.assertEqual(rss_feed.feed_url, 'https://example.com/moved.xml')
+        self.assertEqual(RSSFeed.find_by_url('http://example.com/old.xml'), rss_feed)
+        self.assertEqual(Entry.objects.filter(feed=rss_feed).count(), 1)
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.valid_parser_permanent_redirect)
+    def test_update_permanent_redirect(self):
+        RSSFeedService().update(self.rss_feed, EntryService().create_or_update)
+        self.rss_feed.refresh_from_db()
+        self.assertEqual(self.rss_feed.feed_url, 'https://example.com/moved.xml')
+        self.assertEqual(self.rss_feed.canonical_url, 'example.com/moved.xml')
+        self.assertEqual(self.rss_feed.number_of_errors, 0)
+        self.assertEqual(RSSFeed.find_by_url('https://example.com/feed.xml'), self.rss_feed)
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.valid_parser_permanent_redirect)
+    def test_update_redirect_to_existing_feed(self):
+        target_feed = RSSFeedFactory(feed_url='https://example.com/moved.xml')
+        RSSFeedService().update(self.rss_feed, EntryService().create_or_update)
+        self.rss_feed.refresh_from_db()
+        self.assertFalse(self.rss_feed.is_active)
+        self.assertTrue(target_feed.is_followed_by_user(self.user))
+        # followers are moved, not copied
+        self.assertFalse(self.rss_feed.is_followed_by_user(self.user))
+        target_feed.refresh_from_db()
+        self.assertEqual((self.rss_feed.follower_count, target_feed.follower_count), (0, 1))
+        self.assertEqual(RSSFeed.find_by_url('https://example.com/feed.xml/'), target_feed)
+        self.assertFalse(Entry.objects.filter(feed=self.rss_feed).exists())
+
+    def test_concurrently_created_url_variant(self):
+        # the variant is created after `find_by_url` of this request missed it
+        with mock.patch.object(RSSFeed, 'find_by_url', side_effect=[None, self.rss_feed]):
+            rss_feed = RSSFeedService()._get_or_create_rss_feed(
+                'http://example.com/feed.xml', FakerRssFeedParse.valid_parser()
+            )
+        self.assertEqual(rss_feed, self.rss_feed)
+        self.assertEqual(RSSFeed.objects.count(), 1)
+
+
+@mock.patch('apps.rss.views.create_rss_feed.delay')
+class TestCreateRSSFeedAsynchronously(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = '/api/v1/rss/feeds/'
+        cls.feed_url = 'https://simpleisbetterthancomplex.com/feed.xml'
+
+        cls.user = UserFactory()
+        cls.auth_client = APIClient()
+        cls.auth_client.force_login(cls.user)
+
+    def create(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.auth_client.post(self.url, {'feed_url': self.feed_url, 'asynchronous': True})
+
+    def test_accepted(self, delay):
+        response = self.create()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        schema_validator = Validator(rss_feed_registration_schema)
+        self.assertTrue(schema_validator.validate(json.loads(response.content)), msg=schema_validator.errors)
+        self.assertEqual(response.data['status'], RSSFeedRegistration.PENDING)
+        self.assertFalse(RSSFeed.objects.exists())
+        delay.assert_called_once_with(RSSFeedRegistration.objects.get().id)
+
+    def test_duplicate_requests_are_coalesced(self, delay):
+        first_response = self.create()
+        second_response = self.create()
+        self.assertEqual(first_response.data['id'], second_response.data['id'])
+        self.assertEqual(RSSFeedRegistration.objects.count(), 1)
+        delay.assert_called_once()
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.valid_parser)
+    def test_task_creates_feed(self, delay):
+        response = self.create()
+        create_rss_feed(response.data['id'])
+        response = self.auth_client.get(f"/api/v1/rss/feed-registrations/{response.data['id']}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        schema_validator = Validator(rss_feed_registration_schema)
+        self.assertTrue(schema_validator.validate(json.loads(response.content)), msg=schema_validator.errors)
+        self.assertEqual(response.data['status'], RSSFeedRegistration.CREATED)
+        self.assertEqual(response.data['rss_feed']['id'], str(RSSFeed.objects.get(feed_url=self.feed_url).id))
+        self.assertEqual(Entry.objects.count(), 1)
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.invalid_parser_response_404)
+    def test_task_fails_and_retry(self, delay):
+        response = self.create()
+        create_rss_feed(response.data['id'])
+        registration = RSSFeedRegistration.objects.get(id=response.data['id'])
+        self.assertEqual(registration.status, RSSFeedRegistration.FAILED)
+        self.assertTrue(registration.message)
+        self.assertFalse(RSSFeed.objects.exists())
+        # a new request retries a failed registration
+        response = self.create()
+        self.assertEqual(response.data['status'], RSSFeedRegistration.PENDING)
+        self.assertEqual(delay.call_count, 2)
+
+    def test_existing_feed(self, delay):
+        rss_feed = RSSFeedFactory(feed_url=self.feed_url)
+        response = self.create()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], RSSFeedRegistration.CREATED)
+        self.assertEqual(response.data['rss_feed']['id'], str(rss_feed.id))
+        delay.assert_not_called()
+
+
 class TestUpdateRSSFeed(TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.rss_feed = RSSFeedFactory(next_check=timezone.now() - timedelta(hours=1), is_active=True, last_status=200)
 
+    def setUp(self):
+        cache.clear()
+
     @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.valid_parser)
     def test_update_successfully(self):
         # create new entry if process run successfully
@@ -532,3 +1098,862 @@ class TestUpdateRSSFeed(TestCase):
         update_feeds()
         self.rss_feed.refresh_from_db()
         self.assertEqual(self.rss_feed.is_active, False)
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.invalid_parser_response_410)
+    def test_deactivate_gone_feed(self):
+        update_feeds()
+        self.rss_feed.refresh_from_db()
+        self.assertEqual(self.rss_feed.is_active, False)
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.invalid_parser_response_503)
+    @override_settings(FEED_BACKOFF_MAX_HOURS=48)
+    def test_transient_error_backoff(self):
+        self.rss_feed.number_of_errors = RSSFeed.ERROR_LIMIT
+        self.rss_feed.save()
+        update_feeds()
+        self.rss_feed.refresh_from_db()
+        self.assertEqual(self.rss_feed.is_active, True)
+        self.assertEqual(self.rss_feed.number_of_errors, RSSFeed.ERROR_LIMIT + 1)
+        delay = 2 ** RSSFeed.ERROR_LIMIT
+        self.assertGreaterEqual(self.rss_feed.next_check, self.rss_feed.last_checked + timedelta(hours=delay / 2))
+        self.assertLessEqual(self.rss_feed.next_check, timezone.now() + timedelta(hours=delay))
+
+
+class HostCircuitBreakerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rss_feeds = [
+            RSSFeedFactory(
+                feed_url=f'https://example.com/{index}.xml', next_check=timezone.now() - timedelta(hours=1), number_of_errors=0
+            )
+            for index in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(HOST_CIRCUIT_BREAKER_THRESHOLD=2)
+    def test_open_after_transient_errors(self):
+        with mock.patch(
+            'apps.rss.services.RSSFeedService._parse_feed_url', side_effect=FakerRssFeedParse.invalid_parser_no_response
+        ) as parse_feed_url:
+            update_feeds()
+        self.assertEqual(parse_feed_url.call_count, 2)
+        self.assertEqual(RSSFeed.objects.filter(number_of_errors=1).count(), 2)
+        postponed_feeds = RSSFeed.objects.filter(number_of_errors=0)
+        self.assertEqual(postponed_feeds.count(), 2)
+        self.assertTrue(all(rss_feed.next_check > timezone.now() for rss_feed in postponed_feeds))
+
+    @override_settings(HOST_CIRCUIT_BREAKER_THRESHOLD=2)
+    def test_permanent_errors_do_not_open(self):
+        with mock.patch(
+            'apps.rss.services.RSSFeedService._parse_feed_url', side_effect=FakerRssFeedParse.invalid_parser_response_404
+        ) as parse_feed_url:
+            update_feeds()
+        self.assertEqual(parse_feed_url.call_count, 4)
+
+
+class FeedParsePoolTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rss_feeds = [
+            RSSFeedFactory(
+                feed_url=f'https://example.com/{index}.xml', next_check=timezone.now() - timedelta(hours=1), number_of_errors=0
+            )
+            for index in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_compact_result(self):
+        feed_parser = parse(DOWNLOADED_FEED, {'content-type': 'application/rss+xml'}, 'https://example.com/feed.xml')
+        self.assertEqual(feed_parser.version, 'rss20')
+        self.assertEqual(feed_parser.feed.title, 'Downloaded Feed')
+        self.assertEqual(feed_parser.entries, [ParsedEntry(
+            title='Relative entry',
+            url='https://example.com/entry/1',
+            guid='entry-1',
+            content='<p>Full content</p>',
+            publish_date=datetime(2002, 9, 5, 0, 0, 1, tzinfo=tzutc()),
+        )])
+
+    @mock.patch('apps.rss.parsing.download', side_effect=FakeFeedDownload.valid_download)
+    def test_parse_in_processes(self, download):
+        feed_urls = [rss_feed.feed_url for rss_feed in self.rss_feeds]
+        with FeedParsePool(2) as pool:
+            pool.prefetch(feed_urls)
+            results = [pool.parse(feed_url) for feed_url in reversed(feed_urls)]
+        self.assertEqual(download.call_count, 3)
+        self.assertEqual([result.href for result in results], list(reversed(feed_urls)))
+        self.assertTrue(all(result.status == 200 and len(result.entries) == 1 for result in results))
+
+    @override_settings(RSS_PARSE_POOL_SIZE=2)
+    @mock.patch('apps.rss.parsing.download', side_effect=FakeFeedDownload.valid_download)
+    def test_update_feeds(self, download):
+        update_feeds()
+        self.assertEqual(download.call_count, 3)
+        self.assertEqual(Entry.objects.filter(url='https://example.com/entry/1').count(), 3)
+        self.assertEqual(RSSFeed.objects.filter(last_status=200, number_of_errors=0).count(), 3)
+
+    @override_settings(RSS_PARSE_POOL_SIZE=2)
+    @mock.patch('apps.rss.parsing.download', side_effect=FakeFeedDownload.valid_download)
+    def test_dispatched_batch_is_parsed_in_processes(self, download):
+        executor = get_parse_executor(2)
+        with mock.patch.object(executor, 'submit', wraps=executor.submit) as submit:
+            update_feed_batch([rss_feed.id for rss_feed in self.rss_feeds])
+        self.assertEqual(submit.call_count, 3)
+        self.assertEqual(download.call_count, 3)
+        self.assertEqual(Entry.objects.filter(url='https://example.com/entry/1').count(), 3)
+
+    def test_parse_processes_are_shared(self):
+        with FeedParsePool(2) as pool, FeedParsePool(2) as other_pool:
+            self.assertIs(pool.parse_executor, other_pool.parse_executor)
+        self.assertIs(get_parse_executor(2), pool.parse_executor)
+
+    @override_settings(RSS_PARSE_POOL_SIZE=2)
+    @mock.patch('apps.rss.parsing.download', side_effect=FakeFeedDownload.no_response)
+    def test_update_feeds_without_response(self, download):
+        update_feeds()
+        self.assertEqual(RSSFeed.objects.filter(number_of_errors=1, last_status=None).count(), 3)
+
+
+class FeedSchedulerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.abandoned_feed = RSSFeedFactory(next_check=now - timedelta(hours=2))
+        cls.busy_feed = RSSFeedFactory(next_check=now - timedelta(minutes=10))
+        EntryFactory.create_batch(12, feed=cls.busy_feed)
+        cls.popular_feed = RSSFeedFactory(next_check=now - timedelta(minutes=5))
+        for user in UserFactory.create_batch(10):
+            cls.popular_feed.follow(user)
+        cls.not_due_feed = RSSFeedFactory(next_check=now + timedelta(hours=1))
+
+    def test_claim_due_feeds_in_priority_order(self):
+        batches = list(FeedSchedulerService().claim_due_feeds())
+        self.assertEqual(batches, [[self.popular_feed, self.busy_feed, self.abandoned_feed]])
+        # claimed feeds are leased
+        self.assertFalse(list(FeedSchedulerService().claim_due_feeds()))
+
+    @mock.patch.object(FeedSchedulerService, 'CLAIM_BATCH_SIZE', 2)
+    def test_claim_due_feeds_in_batches(self):
+        batches = list(FeedSchedulerService().claim_due_feeds())
+        # feeds which have been due the longest are claimed first, each batch is in priority order
+        self.assertEqual(batches, [[self.busy_feed, self.abandoned_feed], [self.popular_feed]])
+
+    @mock.patch('apps.rss.tasks.update_feed_batch.apply_async')
+    @mock.patch.object(FeedSchedulerService, 'HIGH_PRIORITY', 10)
+    @mock.patch.object(FeedSchedulerService, 'DEFAULT_PRIORITY', 5)
+    def test_dispatch_to_priority_queues(self, apply_async):
+        dispatch_feeds()
+        batches = [(call.args[0][0], call.kwargs['queue']) for call in apply_async.call_args_list]
+        self.assertEqual(batches, [
+            ([str(self.popular_feed.id)], FeedSchedulerService.HIGH_PRIORITY_QUEUE),
+            ([str(self.busy_feed.id), str(self.abandoned_feed.id)], FeedSchedulerService.LOW_PRIORITY_QUEUE),
+        ])
+        # dispatched feeds are leased until their task runs
+        self.assertFalse(list(FeedSchedulerService().claim_due_feeds()))
+
+    @mock.patch('apps.rss.tasks.update_feed_batch.apply_async')
+    @mock.patch.object(FeedSchedulerService, 'DISPATCH_BATCH_SIZE', 1)
+    def test_dispatch_in_batches(self, apply_async):
+        dispatch_feeds()
+        self.assertEqual([len(call.args[0][0]) for call in apply_async.call_args_list], [1, 1, 1])
+
+    def test_skip_feeds_claimed_again(self):
+        with mock.patch('apps.rss.tasks.update_feed_batch.apply_async') as apply_async:
+            dispatch_feeds()
+        tasks = [call.args[0] for call in apply_async.call_args_list]
+        lease = tasks[0][1]
+        self.assertEqual(parse_datetime(lease), RSSFeed.objects.get(id=self.busy_feed.id).next_check)
+        # the lease of the busy feed ran out and a newer task claimed it
+        RSSFeed.objects.filter(id=self.busy_feed.id).update(next_check=timezone.now() + timedelta(minutes=1))
+        with mock.patch.object(RSSFeedService, 'update_batch') as update_batch:
+            for rss_feed_ids, lease in tasks:
+                update_feed_batch(rss_feed_ids, lease)
+        updated_feeds = [rss_feed for call in update_batch.call_args_list for rss_feed in call.args[0]]
+        self.assertCountEqual(updated_feeds, [self.popular_feed, self.abandoned_feed])
+
+
+class UpdateFeedsStatusTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rss_feeds = [
+            RSSFeedFactory(next_check=timezone.now() - timedelta(hours=1), number_of_errors=0) for _ in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.invalid_parser_response_404)
+    def test_statuses_are_saved_in_bulk(self):
+        with CaptureQueriesContext(connection) as context:
+            update_feeds()
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        updates = [sql for sql in updates if '"last_status"' in sql]  # leaving out the lease of claimed feeds
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('"title"', updates[0])
+        for rss_feed in self.rss_feeds:
+            rss_feed.refresh_from_db()
+            self.assertEqual(rss_feed.last_status, 404)
+            self.assertEqual(rss_feed.number_of_errors, 1)
+            self.assertGreater(rss_feed.next_check, timezone.now())
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.invalid_parser_response_404)
+    def test_statuses_of_dispatched_batch_are_saved_in_bulk(self):
+        with CaptureQueriesContext(connection) as context:
+            update_feed_batch([rss_feed.id for rss_feed in self.rss_feeds])
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        for rss_feed in self.rss_feeds:
+            rss_feed.refresh_from_db()
+            self.assertEqual(rss_feed.last_status, 404)
+
+
+@override_settings(WEBSUB_CALLBACK_BASE_URL='http://testserver')
+class WebSubTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = '/api/v1/rss/feeds/'
+        cls.user = UserFactory()
+        cls.auth_client = APIClient()
+        cls.auth_client.force_login(cls.user)
+
+    def setUp(self):
+        self.hub = FakeWebSubHub()
+        patcher = mock.patch('apps.rss.services.WebSubService._post_to_hub', self.hub.post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_feed(self):
+        with mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.valid_parser_with_hub):
+            response = self.auth_client.post(self.url, {'feed_url': 'http://example.org/feed.xml'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return WebSubSubscription.objects.get(feed_id=response.data['rss_feed']['id'])
+
+    def verify(self, subscription, mode='subscribe', topic=None, lease_seconds=3600):
+        return self.client.get(self.hub.callback_path, {
+            'hub.mode': mode,
+            'hub.topic': topic or subscription.topic_url,
+            'hub.challenge': 'challenge-string',
+            'hub.lease_seconds': lease_seconds,
+        })
+
+    def push(self, subscription, body, secret=None):
+        signature = hmac.new((secret or subscription.secret).encode(), body, hashlib.sha1).hexdigest()
+        return self.client.generic(
+            'POST', self.hub.callback_path, body, content_type='application/rss+xml', HTTP_X_HUB_SIGNATURE=f'sha1={signature}'
+        )
+
+    def test_subscribe_on_create(self):
+        subscription = self.create_feed()
+        self.assertEqual(subscription.hub_url, 'http://hub.example.org/')
+        self.assertEqual(subscription.topic_url, 'http://example.org/feed.xml')
+        self.assertFalse(subscription.is_verified)
+        hub_url, data = self.hub.requests[-1]
+        self.assertEqual(hub_url, subscription.hub_url)
+        self.assertEqual(data['hub.mode'], 'subscribe')
+        self.assertEqual(data['hub.secret'], subscription.secret)
+
+    @mock.patch('apps.rss.services.RSSFeedService._parse_feed_url', FakerRssFeedParse.valid_parser)
+    def test_feed_without_hub(self):
+        response = self.auth_client.post(self.url, {'feed_url': 'https://simpleisbetterthancomplex.com/feed.xml'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(WebSubSubscription.objects.exists())
+        self.assertEqual(self.hub.requests, [])
+
+    def test_verify_challenge(self):
+        subscription = self.create_feed()
+        response = self.verify(subscription)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'challenge-string')
+        subscription.refresh_from_db()
+        self.assertTrue(subscription.is_verified)
+        self.assertGreater(subscription.lease_expires, timezone.now())
+        # polling is postponed while the hub is in charge
+        self.assertGreater(subscription.feed.next_check, RSSFeed.calculate_next_check())
+
+    def test_verify_wrong_topic(self):
+        subscription = self.create_feed()
+        response = self.verify(subscription, topic='http://example.org/other.xml')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        subscription.refresh_from_db()
+        self.assertFalse(subscription.is_verified)
+
+    def test_push_entries(self):
+        subscription = self.create_feed()
+        Entry.objects.all().delete()
+        self.verify(subscription)
+        response = self.push(subscription, WEBSUB_FEED.strip().encode())
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(Entry.objects.filter(feed=subscription.feed).count(), 1)
+        subscription.refresh_from_db()
+        self.assertIsNotNone(subscription.last_push)
+
+    def test_push_is_not_read_as_file_name(self):
+        subscription = self.create_feed()
+        Entry.objects.all().delete()
+        self.verify(subscription)
+        with tempfile.NamedTemporaryFile('w', suffix='.xml') as local_feed:
+            local_feed.write(WEBSUB_FEED.strip())
+            local_feed.flush()
+            response = self.push(subscription, local_feed.name.encode())
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(Entry.objects.exists())
+
+    def test_unsubscribe_not_requested(self):
+        subscription = self.create_feed()
+        self.verify(subscription)
+        response = self.verify(subscription, mode='unsubscribe')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotEqual(response.content, b'challenge-string')
+        subscription.refresh_from_db()
+        self.assertTrue(subscription.is_verified)
+
+    def test_push_invalid_signature(self):
+        subscription = self.create_feed()
+        Entry.objects.all().delete()
+        self.verify(subscription)
+        response = self.push(subscription, WEBSUB_FEED.strip().encode(), secret='wrong-secret')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(Entry.objects.exists())
+
+    def test_push_before_verification(self):
+        subscription = self.create_feed()
+        Entry.objects.all().delete()
+        self.push(subscription, WEBSUB_FEED.strip().encode())
+        self.assertFalse(Entry.objects.exists())
+
+    def test_renew_lease(self):
+        subscription = self.create_feed()
+        self.verify(subscription)
+        WebSubSubscription.objects.filter(id=subscription.id).update(lease_expires=timezone.now() + timedelta(minutes=5))
+        self.hub.requests.clear()
+        renew_websub_subscriptions()
+        self.assertEqual(len(self.hub.requests), 1)
+        self.assertEqual(self.hub.requests[0][1]['hub.topic'], subscription.topic_url)
+
+    def test_retry_unverified_subscription(self):
+        with mock.patch('apps.rss.services.WebSubService._post_to_hub', side_effect=URLError('hub is down')):
+            subscription = self.create_feed()
+        self.assertIsNone(subscription.lease_expires)
+        renew_websub_subscriptions()
+        self.assertEqual(len(self.hub.requests), 1)
+        self.assertEqual(self.hub.requests[0][1]['hub.topic'], subscription.topic_url)
+
+    @override_settings(WEBSUB_LEASE_SECONDS=7200)
+    def test_verify_invalid_lease_seconds(self):
+        subscription = self.create_feed()
+        response = self.verify(subscription, lease_seconds='forever')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        subscription.refresh_from_db()
+        self.assertGreater(subscription.lease_expires, timezone.now() + timedelta(seconds=7000))
+
+
+class EntryDeduplicationTest(APITestCase):
+    ARTICLE = (
+        '<p>The city council approved the new budget on Monday after a long debate about public transport, '
+        'schools and the renovation of the old library in the city centre.</p>'
+        '<p>Most of the money goes to new bus lines that connect the northern districts with the university campus '
+        'and the central station.</p>'
+        '<p>Schools receive funds for new laboratories, sports halls and teachers, while the library will reopen in '
+        'two years with a larger reading room.</p>'
+        '<p>The opposition criticised the plan as too expensive and asked for a public vote, but the majority '
+        'rejected the proposal late in the evening.</p>'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.origin_feed = RSSFeedFactory()
+        cls.aggregator_feed = RSSFeedFactory()
+        cls.user = UserFactory()
+        cls.auth_client = APIClient()
+        cls.auth_client.force_login(cls.user)
+
+    def ingest(self, rss_feed, **row):
+        row.setdefault('title', 'Budget approved')
+        EntryService().create_or_update(rss_feed, [feedparser.FeedParserDict(**row)])
+        return Entry.objects.filter(feed=rss_feed).latest('create_time')
+
+    def test_same_url(self):
+        entry = self.ingest(self.origin_feed, link='https://news.example.com/budget', description=self.ARTICLE)
+        duplicate = self.ingest(
+            self.aggregator_feed, link='http://news.example.com/budget/?utm_source=rss', description=self.ARTICLE
+        )
+        self.assertEqual(duplicate.canonical, entry)
+        self.assertFalse(EntryContent.objects.filter(entry=duplicate).exists())
+        self.assertEqual(duplicate.content, self.ARTICLE)
+
+    def test_near_duplicate_content(self):
+        entry = self.ingest(self.origin_feed, link='https://news.example.com/budget', description=self.ARTICLE)
+        edited_article = self.ARTICLE.replace('Monday', 'Monday evening') + '<p>Read more on our site.</p>'
+        duplicate = self.ingest(self.aggregator_feed, link='https://aggregator.example.com/1', description=edited_article)
+        self.assertEqual(duplicate.canonical, entry)
+        other = self.ingest(
+            self.aggregator_feed, link='https://aggregator.example.com/2', description='<p>A different story.</p>'
+        )
+        self.assertIsNone(other.canonical)
+
+    def test_candidates_of_a_batch_are_read_in_one_query(self):
+        entries = [
+            self.ingest(self.origin_feed, title=f'Budget {index}', link=f'https://news.example.com/{index}')
+            for index in range(3)
+        ]
+        rows = [
+            feedparser.FeedParserDict(title=f'Budget {index}', link=f'https://news.example.com/{index}/?utm_source=rss')
+            for index in range(3)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            EntryService().create_or_update(self.aggregator_feed, rows)
+        candidate_queries = [query for query in queries if '"canonical_id" IS NULL' in query['sql']]
+        self.assertEqual(len(candidate_queries), 1)
+        duplicates = Entry.objects.filter(feed=self.aggregator_feed).order_by('title')
+        self.assertEqual([duplicate.canonical for duplicate in duplicates], entries)
+
+    def test_deleted_canonical_entry_is_replaced_by_duplicate(self):
+        entry = self.ingest(self.origin_feed, link='https://news.example.com/budget', description=self.ARTICLE)
+        duplicate = self.ingest(self.aggregator_feed, link='https://news.example.com/budget?utm_source=a')
+        other_duplicate = self.ingest(RSSFeedFactory(), link='https://news.example.com/budget?utm_source=b')
+        self.assertEqual((duplicate.canonical, other_duplicate.canonical), (entry, entry))
+        self.origin_feed.delete()
+        duplicate.refresh_from_db()
+        other_duplicate.refresh_from_db()
+        self.assertIsNone(duplicate.canonical)
+        self.assertEqual(other_duplicate.canonical, duplicate)
+        self.assertEqual((duplicate.content, other_duplicate.content), (self.ARTICLE, self.ARTICLE))
+
+    def test_same_entry_in_same_feed_is_not_stored_again(self):
+        self.ingest(self.origin_feed, link='https://news.example.com/budget', description=self.ARTICLE)
+        self.ingest(self.origin_feed, link='https://news.example.com/budget', description=self.ARTICLE)
+        self.assertEqual(Entry.objects.filter(feed=self.origin_feed).count(), 1)
+
+    def test_collapse_duplicates(self):
+        entry = self.ingest(self.origin_feed, link='https://news.example.com/budget', description=self.ARTICLE)
+        self.ingest(self.aggregator_feed, link='https://news.example.com/budget', description=self.ARTICLE)
+        response = self.auth_client.get('/api/v1/rss/entries/', {'collapse_duplicates': True})
+        self.assertEqual([result['id'] for result in response.data['results']], [str(entry.id)])
+        # a copy is listed when its canonical entry is not
+        response = self.auth_client.get(
+            '/api/v1/rss/entries/', {'collapse_duplicates': True, 'feed_id': self.aggregator_feed.id}
+        )
+        self.assertEqual(response.data['count'], 1)
+
+    def test_keep_canonical_entry_of_duplicates(self):
+        old_date = timezone.now() - timedelta(days=400)
+        entry = self.ingest(self.origin_feed, link='https://news.example.com/budget', description=self.ARTICLE)
+        duplicate = self.ingest(self.aggregator_feed, link='https://news.example.com/budget', description=self.ARTICLE)
+        Entry.objects.filter(id=entry.id).update(publish_date=old_date)
+        archive_entries()
+        self.assertTrue(Entry.objects.filter(id=entry.id).exists())
+        Entry.objects.filter(id=duplicate.id).update(publish_date=old_date)
+        archive_entries()
+        self.assertEqual(ArchivedEntry.objects.get(id=duplicate.id).content, self.ARTICLE)
+        archive_entries()
+        self.assertTrue(ArchivedEntry.objects.filter(id=entry.id).exists())
+
+
+class EntrySanitizationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rss_feed = RSSFeedFactory()
+
+    def ingest(self, description):
+        row = feedparser.FeedParserDict(title='Sanitized', link='https://example.com/entry', description=description)
+        EntryService().create_or_update(self.rss_feed, [row])
+        return Entry.objects.get(feed=self.rss_feed)
+
+    def test_sanitize_feed_markup(self):
+        EntryService().create_or_update(self.rss_feed, FakerRssFeedParse.valid_parser().entries)
+        entry = Entry.objects.get(feed=self.rss_feed)
+        self.assertEqual(entry.content, 'Watch out for <span>nasty\n            tricks</span>')
+        self.assertEqual(entry.summary, 'Watch out for nasty tricks')
+        self.assertEqual(entry.word_count, 5)
+
+    def test_sanitize_unsafe_markup(self):
+        entry = self.ingest(
+            '<p onclick="steal()" style="color: red">Hello <script>alert(1)</script>'
+            '<a href="java&#x09;script:alert(1)">link</a> <a href="https://example.com" target="_blank">site</a>'
+            '<img src="data:image/png;base64,AAAA" alt="pixel"><iframe src="https://evil.example.com">frame</iframe>'
+            '<ul><li>open &amp; unclosed'
+        )
+        self.assertEqual(
+            entry.content,
+            '<p>Hello <a>link</a> <a href="https://example.com">site</a><img alt="pixel">'
+            '<ul><li>open &amp; unclosed</li></ul></p>'
+        )
+        self.assertEqual(entry.summary, 'Hello link site open & unclosed')
+        self.assertEqual(entry.word_count, 5)
+
+    def test_self_closing_and_unclosed_dropped_tags(self):
+        entry = self.ingest(
+            '<p>Intro <svg width="10"/> rest <iframe src="https://example.com/embed"/> of it</p>'
+            '<p>Video <object data="video.swf"> fallback</p><p>more <math><mi>x</mi></math> <svg> chart</p>'
+        )
+        self.assertEqual(entry.content, '<p>Intro  rest  of it</p><p>Video </p><p>more x  chart</p>')
+        self.assertEqual(entry.summary, 'Intro rest of it Video more x chart')
+        self.assertEqual(entry.word_count, 8)
+
+    def test_summary_is_truncated_plain_text(self):
+        entry = self.ingest('<p>' + 'word ' * 200 + '</p>')
+        self.assertEqual(len(entry.summary), Entry.SUMMARY_LENGTH)
+        self.assertNotIn('<', entry.summary)
+        self.assertEqual(entry.word_count, 200)
+
+
+class ParsedEntryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rss_feed = RSSFeedFactory()
+
+    def rows(self, number_of_rows):
+        return [
+            feedparser.FeedParserDict(
+                title=f'Entry {index}', link=f'https://example.com/{index}', description=f'<p>Entry number {index}</p>',
+                updated='Thu, 05 Sep 2002 00:00:01 GMT',
+            )
+            for index in range(number_of_rows)
+        ]
+
+    def test_normalize(self):
+        parsed_entry = ParsedEntry.from_entry(self.rows(1)[0])
+        self.assertEqual(parsed_entry.url, 'https://example.com/0')
+        self.assertIsNone(parsed_entry.guid)
+        self.assertEqual(parsed_entry.content, '<p>Entry number 0</p>')
+        self.assertEqual(parsed_entry.publish_date, datetime(2002, 9, 5, 0, 0, 1, tzinfo=tzutc()))
+        self.assertFalse(hasattr(parsed_entry, '__dict__'))
+        with self.assertRaises(AttributeError):
+            parsed_entry.title = 'Changed'
+
+    def test_store_in_bulk(self):
+        with CaptureQueriesContext(connection) as context:
+            EntryService().create_or_update(self.rss_feed, self.rows(10))
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(Entry.objects.filter(feed=self.rss_feed).count(), 10)
+        self.assertEqual(EntryContent.objects.filter(entry__feed=self.rss_feed).count(), 10)
+
+    def test_skip_stored_entries(self):
+        EntryService().create_or_update(self.rss_feed, self.rows(2))
+        rows = self.rows(3)
+        EntryService().create_or_update(self.rss_feed, rows + rows)
+        self.assertEqual(Entry.objects.filter(feed=self.rss_feed).count(), 3)
+
+
+@override_settings(ENTRY_RETENTION_DAYS=30)
+class EntryRetentionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.feed = RSSFeedFactory()
+        cls.short_retention_feed = RSSFeedFactory(retention_days=7)
+        cls.user = UserFactory()
+        cls.old_date = timezone.now() - timedelta(days=60)
+        cls.recent_date = timezone.now() - timedelta(days=10)
+
+    def test_archive_old_entries(self):
+        old_entry = EntryFactory(feed=self.feed, publish_date=self.old_date)
+        recent_entry = EntryFactory(feed=self.feed, publish_date=self.recent_date)
+        old_entry.seen(self.user)
+        archive_entries()
+        self.assertFalse(Entry.objects.filter(id=old_entry.id).exists())
+        self.assertTrue(Entry.objects.filter(id=recent_entry.id).exists())
+        self.assertFalse(SeenEntry.objects.filter(entry_id=old_entry.id).exists())
+        archived_entry = ArchivedEntry.objects.get(id=old_entry.id)
+        self.assertEqual(archived_entry.content, old_entry.content)
+        self.assertEqual(archived_entry.feed, self.feed)
+
+    def test_feed_retention(self):
+        entry = EntryFactory(feed=self.short_retention_feed, publish_date=self.recent_date)
+        archive_entries()
+        self.assertFalse(Entry.objects.filter(id=entry.id).exists())
+        self.assertTrue(ArchivedEntry.objects.filter(id=entry.id).exists())
+
+    def test_keep_bookmarked_favourited_and_commented_entries(self):
+        bookmarked_entry = EntryFactory(feed=self.feed, publish_date=self.old_date)
+        bookmarked_entry.add_bookmark(self.user)
+        favourited_entry = EntryFactory(feed=self.feed, publish_date=self.old_date)
+        favourited_entry.add_favourite(self.user)
+        commented_entry = EntryCommentFactory(entry__feed=self.feed, entry__publish_date=self.old_date).entry
+        archive_entries()
+        self.assertEqual(Entry.objects.filter(id__in=(bookmarked_entry.id, favourited_entry.id, commented_entry.id)).count(), 3)
+        self.assertFalse(ArchivedEntry.objects.exists())
+
+    def test_archived_entries_are_not_ingested_again(self):
+        parsed_entry = ParsedEntry(
+            title='Episode 1', url='https://example.org/1', guid='episode-1', content='<p>First</p>',
+            publish_date=self.old_date,
+        )
+        EntryService().create_or_update(self.feed, [parsed_entry])
+        archive_entries()
+        with mock.patch('apps.rss.services.InboxService.schedule_fan_out') as schedule_fan_out:
+            EntryService().create_or_update(self.feed, [parsed_entry])
+        schedule_fan_out.assert_not_called()
+        self.assertFalse(Entry.objects.filter(feed=self.feed).exists())
+        self.assertEqual(ArchivedEntry.objects.filter(feed=self.feed).count(), 1)
+
+
+class EntryStreamTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = '/api/v1/rss/entries/stream/'
+        cls.feed = RSSFeedFactory()
+        cls.other_feed = RSSFeedFactory()
+        cls.user = UserFactory()
+        cls.feed.follow(cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.redis = FakeRedis()
+        for patcher in (
+            mock.patch('apps.rss.services.get_redis_connection', return_value=self.redis),
+            mock.patch.object(EntrySubscriber, 'POLL_TIMEOUT', 0.05),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        thread = EntrySubscriber.get().thread
+        if thread:
+            thread.join(timeout=1)
+
+    def test_stream_unauthorized(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_stream_new_entries(self):
+        entry = EntryFactory(feed=self.feed)
+        EntryNotificationService().publish(self.feed, [entry.id])
+        response = self.client.get(self.url, {'timeout': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'entry_ids': [str(entry.id)], 'time': entry.create_time.isoformat(), 'entry_id': str(entry.id)
+        })
+
+    def test_stream_timeout(self):
+        EntryNotificationService().publish(self.other_feed, [EntryFactory(feed=self.other_feed).id])
+        response = self.client.get(self.url, {'timeout': 0})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_stream_since(self):
+        since = timezone.now()
+        entry = EntryFactory(feed=self.feed)
+        EntryFactory(feed=self.other_feed)
+        response = self.client.get(self.url, {'since': since.isoformat(), 'timeout': 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['entry_ids'], [str(entry.id)])
+
+    @mock.patch.object(EntryStreamView, 'max_entries', 2)
+    def test_stream_continues_after_last_entry_sent(self):
+        since = timezone.now()
+        entries = EntryFactory.create_batch(3, feed=self.feed)
+        # an entry of a transaction which commits later, created before the entries sent
+        Entry.objects.filter(id=entries[2].id).update(create_time=entries[1].create_time)
+        entries = sorted(Entry.objects.filter(feed=self.feed), key=lambda entry: (entry.create_time, entry.id))
+        response = self.client.get(self.url, {'since': since.isoformat(), 'timeout': 0})
+        self.assertEqual(response.json()['entry_ids'], [str(entry.id) for entry in entries[:2]])
+        cursor = {'since': response.json()['time'], 'since_id': response.json()['entry_id'], 'timeout': 0}
+        response = self.client.get(self.url, cursor)
+        self.assertEqual(response.json()['entry_ids'], [str(entries[2].id)])
+        cursor = {'since': response.json()['time'], 'since_id': response.json()['entry_id'], 'timeout': 0}
+        self.assertEqual(self.client.get(self.url, cursor).status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_stream_invalid_timeout(self):
+        response = self.client.get(self.url, {'timeout': 'soon'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_waiters_share_one_subscription(self):
+        entry = EntryFactory(feed=self.feed)
+
+        async def wait_for_entries():
+            service = EntryNotificationService()
+            waiters = [asyncio.ensure_future(service.wait([self.feed.id], 5)) for _ in range(3)]
+            await asyncio.sleep(0.1)
+            service.publish(self.feed, [entry.id])
+            return await asyncio.gather(*waiters)
+
+        self.assertEqual(async_to_sync(wait_for_entries)(), [[str(entry.id)]] * 3)
+        self.assertEqual(len(self.redis.pubsubs), 1)
+
+    def test_stream_post_not_allowed(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_publish_on_new_entries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            EntryService().create_or_update(self.feed, FakerRssFeedParse.valid_parser().entries)
+        message = json.loads(self.redis.channels[EntryNotificationService.CHANNEL.format(feed_id=self.feed.id)][0])
+        self.assertEqual(len(message['entry_ids']), self.feed.entries.count())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def route(self, method, status_code=200, **headers):
+        """
+        Returns the database entries are read from while the request is handled
+        """
+        databases = []
+
+        def view(request):
+            databases.append(router.db_for_read(Entry))
+            return HttpResponse(status=status_code)
+
+        request = getattr(RequestFactory(), method)('/api/v1/rss/entries/', **headers)
+        ReplicaRoutingMiddleware(view)(request)
+        return databases[0]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.route('get'), 'replica')
+        self.assertEqual(self.route('head'), 'replica')
+        self.assertEqual(self.route('post', status_code=201), 'default')
+        self.assertEqual(router.db_for_write(Entry), 'default')
+
+    def test_read_your_writes(self):
+        self.route('post', status_code=201, HTTP_AUTHORIZATION='Bearer writer')
+        self.assertEqual(self.route('get', HTTP_AUTHORIZATION='Bearer writer'), 'default')
+        self.assertEqual(self.route('get', HTTP_AUTHORIZATION='Bearer reader'), 'replica')
+
+    def test_failed_writes_do_not_pin(self):
+        self.route('post', status_code=400, HTTP_AUTHORIZATION='Bearer writer')
+        self.assertEqual(self.route('get', HTTP_AUTHORIZATION='Bearer writer'), 'replica')
+
+    def test_primary_outside_of_requests(self):
+        # celery tasks and management commands
+        self.assertEqual(router.db_for_read(Entry), 'default')
+
+    def test_sessions_read_from_primary(self):
+        databases = []
+
+        def view(request):
+            databases.append(router.db_for_read(Session))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(RequestFactory().get('/api/v1/rss/entries/'))
+        self.assertEqual(databases, ['default'])
+
+    def test_timeline_head_is_cached_from_primary(self):
+        entry = EntryFactory()
+        entry_ids = []
+
+        def view(request):
+            entry_ids.extend(TimelineService().get_head_entry_ids(
+                UserFactory.build(id=1), Entry.objects.filter(id=entry.id), ('-publish_date', '-id'), 10
+            ))
+            return HttpResponse()
+
+        # the test database has no replica, reading from it would fail
+        ReplicaRoutingMiddleware(view)(RequestFactory().get('/api/v1/rss/timeline/'))
+        self.assertEqual(entry_ids, [entry.id])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(self.route('get'), 'default')
+
+
+class DatabaseConnectionTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_client = APIClient()
+        cls.admin_client.force_login(UserFactory(is_staff=True))
+        cls.auth_client = APIClient()
+        cls.auth_client.force_login(UserFactory())
+
+    def test_close_unusable_connections(self):
+        dropped = mock.Mock(
+            connection=object(), in_atomic_block=False, health_checked_at=0, **{'is_usable.return_value': False}
+        )
+        healthy = mock.Mock(
+            connection=object(), in_atomic_block=False, health_checked_at=0, **{'is_usable.return_value': True}
+        )
+        in_transaction = mock.Mock(connection=object(), in_atomic_block=True, health_checked_at=0)
+        with mock.patch('helper.db.connections.all', return_value=[dropped, healthy, in_transaction]):
+            close_unusable_connections()
+            with override_settings(DATABASE_HEALTH_CHECKS=False):
+                close_unusable_connections()
+        dropped.close.assert_called_once()
+        healthy.close.assert_not_called()
+        in_transaction.is_usable.assert_not_called()
+
+    @override_settings(DATABASE_HEALTH_CHECK_INTERVAL=30)
+    def test_recently_checked_connections_are_not_checked_again(self):
+        healthy = mock.Mock(
+            connection=object(), in_atomic_block=False, health_checked_at=0, **{'is_usable.return_value': True}
+        )
+        new = mock.Mock(connection=object(), in_atomic_block=False, health_checked_at=time.time())
+        with mock.patch('helper.db.connections.all', return_value=[healthy, new]):
+            close_unusable_connections()
+            close_unusable_connections()
+        healthy.is_usable.assert_called_once()
+        new.is_usable.assert_not_called()
+
+    def test_stats(self):
+        response = self.admin_client.get('/api/v1/admin/db-stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('connections_created', response.data)
+        self.assertEqual(response.data['connections'][0]['alias'], 'default')
+        self.assertTrue(response.data['connections'][0]['is_open'])
+
+    def test_stats_for_admins_only(self):
+        response = self.auth_client.get('/api/v1/admin/db-stats/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class WorkerProfileTest(TestCase):
+    def test_websub_callback_url(self):
+        pk = uuid4()
+        web_url = reverse('rss:websub-callback', kwargs={'pk': pk})
+        with override_settings(ROOT_URLCONF='rss_reader.worker_urls'):
+            self.assertEqual(reverse('rss:websub-callback', kwargs={'pk': pk}), web_url)
+
+    def test_worker_does_not_import_api(self):
+        output = StringIO()
+        call_command('benchmark_startup', runs=1, stdout=output)
+        worker_line = output.getvalue().splitlines()[-1]
+        self.assertTrue(worker_line.startswith('worker:'))
+        self.assertTrue(worker_line.endswith('API modules: none'))
+
+
+class APISchemaTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.auth_client = APIClient()
+        cls.auth_client.force_login(UserFactory())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_schema_is_generated_once(self):
+        with mock.patch.object(CachedSchemaGenerator, 'get_schema', autospec=True,
+                               side_effect=CachedSchemaGenerator.get_schema) as get_schema:
+            response = self.auth_client.get('/api-docs.json')
+            self.auth_client.get('/api-docs.json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_schema.call_count, 1)
+        schema = json.loads(response.content)
+        self.assertIn('/rss/feeds/', schema['paths'])
+        self.assertNotIn('host', schema)
+
+    def test_etag(self):
+        response = self.auth_client.get('/api-docs.json')
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(response.content).hexdigest()}"')
+        response = self.auth_client.get('/api-docs.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_build_replaces_cached_schema(self):
+        response = self.auth_client.get('/api-docs/?format=openapi')
+        cache.set(CachedSchemaGenerator.CACHE_KEY.format(version='', codec='json'), ('"stale"', b'{}'))
+        schema_view.get_generator().build(codecs=('json',))
+        self.assertEqual(self.auth_client.get('/api-docs/?format=openapi')['ETag'], response['ETag'])
+
+    def test_ui(self):
+        response = self.auth_client.get('/redoc/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'RSS Reader', response.content)
+
+    def test_schema_for_authenticated_users_only(self):
+        response = self.client.get('/api-docs.json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
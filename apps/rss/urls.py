@@ -1,14 +1,27 @@
+from django.urls import path
 from rest_framework.routers import SimpleRouter
 
-from .views import RSSFeedView, EntryView, EntryCommentView
+from .views import (
+    RSSFeedView,
+    RSSFeedRegistrationView,
+    EntryView,
+    EntryStreamView,
+    TimelineView,
+    EntryCommentView,
+    WebSubCallbackView,
+)
 
 app_name = 'rss'
 
 router = SimpleRouter()
 router.register('entry-comments', EntryCommentView, basename='entry-comments')
 router.register('feeds', RSSFeedView, basename='feeds')
+router.register('feed-registrations', RSSFeedRegistrationView, basename='feed-registrations')
 router.register('entries', EntryView, basename='entries')
+router.register('timeline', TimelineView, basename='timeline')
 
 urls = [
+    path('entries/stream/', EntryStreamView.as_view(), name='entry-stream'),
+    path('websub/<uuid:pk>/', WebSubCallbackView.as_view(), name='websub-callback'),
 ]
 urlpatterns = urls + router.urls
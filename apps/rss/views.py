@@ -1,44 +1,82 @@
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from dateutil import parser
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.utils import swagger_auto_schema, no_body
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
+from rest_framework.exceptions import APIException
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.parsers import MultiPartParser
 from rest_framework.mixins import ListModelMixin, CreateModelMixin, RetrieveModelMixin
+from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
-from helper.drf import GetCustomSerializerClass
+from helper.drf import GetCustomSerializerClass, SparseFieldsetsMixin
+from helper.pagination import KeysetPagination
 from .exceptions import InvalidFeedURL
-from .filters import RSSFeedFilter, EntryFilter
-from .models import RSSFeed, Entry, EntryComment
+from .filters import RSSFeedFilter, EntryFilter, TimelineFilter, TimelineFilterBackend
+from .models import RSSFeed, RSSFeedFollower, RSSFeedRegistration, Entry, EntryComment, InboxEntry, WebSubSubscription
 from .serializers import (
     RSSFeedCreateSerializer,
     RSSFeedSerializer,
+    RSSFeedRegistrationSerializer,
     RSSFeedFollowSerializer,
+    OPMLImportSerializer,
     EntrySerializer,
+    EntryListSerializer,
     EntryBookmarkSerializer,
     EntryFavouriteSerializer,
     EntryCommentSerializer,
 )
-from .services import RSSFeedService, EntryService
+from .services import (
+    RSSFeedService,
+    EntryService,
+    WebSubService,
+    TimelineService,
+    InboxService,
+    EntryNotificationService,
+    OPMLService,
+)
+from .tasks import create_rss_feed
 
 
-class RSSFeedView(GetCustomSerializerClass, ListModelMixin, CreateModelMixin, GenericViewSet):
+class RSSFeedView(SparseFieldsetsMixin, GetCustomSerializerClass, ListModelMixin, CreateModelMixin, GenericViewSet):
     queryset = RSSFeed.objects.all()
     serializer_class = RSSFeedSerializer
     create_serializer_class = RSSFeedCreateSerializer
-    filter_backends = (SearchFilter, DjangoFilterBackend)
+    filter_backends = (SearchFilter, DjangoFilterBackend, OrderingFilter)
     search_fields = ('title', 'feed_url')
     filterset_class = RSSFeedFilter
+    ordering_fields = ('follower_count', 'title', 'last_update', 'create_time')
 
-    @swagger_auto_schema(request_body=RSSFeedCreateSerializer(), responses={status.HTTP_200_OK: RSSFeedCreateSerializer()})
+    @swagger_auto_schema(
+        request_body=RSSFeedCreateSerializer(),
+        responses={status.HTTP_200_OK: RSSFeedCreateSerializer(), status.HTTP_202_ACCEPTED: RSSFeedRegistrationSerializer()}
+    )
     def create(self, request, *args, **kwargs):
         """
         ## If an RSS Feed is not exits user can create new one and follow it
+        - asynchronous: the feed is fetched in background, poll the returned registration in `feed-registrations`
         """
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         rss_service = RSSFeedService()
+        if serializer.validated_data['asynchronous']:
+            registration, enqueue = rss_service.register(serializer.validated_data['feed_url'])
+            if enqueue:
+                transaction.on_commit(lambda: create_rss_feed.delay(registration.id))
+            serializer = RSSFeedRegistrationSerializer(registration, context=self.get_serializer_context())
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
         try:
             rss_feed = rss_service.create(
                 feed_url=serializer.validated_data['feed_url'],
@@ -72,17 +110,77 @@ class RSSFeedView(GetCustomSerializerClass, ListModelMixin, CreateModelMixin, Ge
         feed = serializer.validated_data['feed']
         if request.method == "PATCH":
             feed.follow(request.user)
+            InboxService().follow(request.user, feed)
         elif request.method == "DELETE":
             feed.unfollow(request.user)
+            InboxService().unfollow(request.user, feed)
+        TimelineService().invalidate_for_user(request.user)
         return Response(status=status.HTTP_200_OK)
 
+    @swagger_auto_schema(method='get', responses={status.HTTP_200_OK: 'OPML file'})
+    @swagger_auto_schema(
+        method='post', request_body=OPMLImportSerializer(), responses={status.HTTP_200_OK: OPMLImportSerializer()}
+    )
+    @action(detail=False, methods=['get', 'post'], parser_classes=(MultiPartParser,), pagination_class=None)
+    def opml(self, request, *args, **kwargs):
+        """
+        ## Import / Export followed RSS Feeds as OPML
+        - get: **Export** followed RSS Feeds
+        - post: **Import** an OPML file, existing feeds are followed and missing ones are fetched in background,
+          poll the returned registrations in `feed-registrations`
+        """
+        if request.method == "GET":
+            response = HttpResponse(OPMLService().export(request.user), content_type='text/x-opml; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="feeds.opml"'
+            return response
+
+        serializer = OPMLImportSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        rss_feeds, registrations = OPMLService().import_feeds(request.user, serializer.validated_data['file'])
+        serializer = OPMLImportSerializer(
+            {'rss_feeds': rss_feeds, 'registrations': registrations}, context=self.get_serializer_context()
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
 
-class EntryView(ListModelMixin, RetrieveModelMixin, GenericViewSet):
+class RSSFeedRegistrationView(SparseFieldsetsMixin, RetrieveModelMixin, GenericViewSet):
+    """
+    Status of asynchronous feed creation requests
+    """
+    queryset = RSSFeedRegistration.objects.select_related('rss_feed')
+    serializer_class = RSSFeedRegistrationSerializer
+
+
+class EntryView(SparseFieldsetsMixin, ListModelMixin, RetrieveModelMixin, GenericViewSet):
     queryset = Entry.objects.all()
     serializer_class = EntrySerializer
+    list_serializer_class = EntryListSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = EntryFilter
 
+    def is_content_requested(self):
+        if self.action == 'list':
+            return 'content' in (self.get_requested_fields() or ())
+        return self.is_field_requested('content')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.is_content_requested():
+            queryset = queryset.select_related('body', 'canonical__body')
+        return queryset
+
+    def get_serializer_class(self):
+        if not self.is_content_requested():
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        """
+        ## Entries return a summary, the full content is loaded by retrieve or when `fields` includes `content`
+        - collapse_duplicates: hide copies of entries which are listed from another feed, see `canonical`
+        """
+        return super().list(request, *args, **kwargs)
+
     def retrieve(self, request, *args, **kwargs):
         """
         ## If the current user has followed the feed of entry, entry is added to seen table after retrieve
@@ -132,8 +230,191 @@ class EntryView(ListModelMixin, RetrieveModelMixin, GenericViewSet):
         return Response(status=status.HTTP_200_OK)
 
 
-class EntryCommentView(ListModelMixin, CreateModelMixin, GenericViewSet):
-    queryset = EntryComment.objects.all()
+class TimelinePagination(KeysetPagination):
+    ordering = ('-publish_date', '-id')
+    inbox_ordering = ('-publish_date', '-entry_id')  # same cursor values, entry_id of the inbox is the entry id
+
+    def get_ordering(self, request, queryset, view):
+        return self.inbox_ordering if queryset.model is InboxEntry else self.ordering
+
+
+class TimelineView(SparseFieldsetsMixin, ListModelMixin, GenericViewSet):
+    queryset = Entry.objects.none()
+    serializer_class = EntryListSerializer
+    pagination_class = TimelinePagination
+    filter_backends = (TimelineFilterBackend,)
+    filterset_class = TimelineFilter
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return super().get_queryset()
+        return TimelineService().get_queryset(self.request.user)
+
+    def is_head_page(self):
+        query_params = self.request.query_params
+        return not any(param in query_params for param in ('cursor', 'page_size', 'exclude_seen', 'collapse_duplicates'))
+
+    def paginate_queryset(self, queryset):
+        if self.is_head_page():
+            # the cached page has one extra entry, so the paginator can tell whether there is a next page
+            ordering = self.paginator.get_ordering(self.request, queryset, self)
+            entry_ids = TimelineService().get_head_entry_ids(
+                self.request.user, queryset, ordering, self.paginator.page_size + 1
+            )
+            queryset = Entry.objects.filter(id__in=entry_ids)
+        page = super().paginate_queryset(queryset)
+        if page is not None and queryset.model is InboxEntry:
+            page = TimelineService().get_entries(page)  # the next link is built from the inbox page
+        return page
+
+    def list(self, request, *args, **kwargs):
+        """
+        ## Latest entries of all feeds the current user follows, newest first
+        - exclude_seen: leave out entries the user has seen
+        - cursor: follow the `next` link to read older entries
+        """
+        return super().list(request, *args, **kwargs)
+
+    @swagger_auto_schema(methods=['patch', 'delete'], request_body=no_body, responses={status.HTTP_200_OK: None})
+    @action(detail=False, methods=['patch', 'delete'])
+    def inbox(self, request, *args, **kwargs):
+        """
+        ## Enable / Disable the timeline inbox, recommended when following many feeds
+        - patch: **Enable** inbox, new entries of followed feeds are delivered to it when they are fetched
+        - delete: **Disable** inbox, the timeline is read from followed feeds directly
+        """
+        if request.method == "PATCH":
+            InboxService().enable(request.user)
+        elif request.method == "DELETE":
+            InboxService().disable(request.user)
+        TimelineService().invalidate_for_user(request.user)
+        return Response(status=status.HTTP_200_OK)
+
+
+class EntryStreamView:
+    """
+    Long-poll of new entries of followed feeds, served asynchronously so waiting clients do not hold a worker
+    under ASGI. Responds as soon as followed feeds get new entries, or with 204 after `timeout` seconds.
+    `time` and `entry_id` of a response point at the last entry it sent, pass them as `since` and `since_id` to get
+    the entries created after it
+    """
+    default_timeout = 25  # second
+    max_timeout = 55  # second
+    max_entries = 100
+
+    @classmethod
+    def as_view(cls):
+        # Django 3.2 runs only coroutine functions asynchronously, class-based views can be async from 4.1 on
+        async def view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return HttpResponseNotAllowed(['GET'])
+            return await cls().get(request, *args, **kwargs)
+        return view
+
+    async def get(self, request, *args, **kwargs):
+        user = await sync_to_async(self.authenticate)(request)
+        if user is None:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        try:
+            timeout = min(max(int(request.GET.get('timeout', self.default_timeout)), 0), self.max_timeout)
+            since = parser.isoparse(request.GET['since']) if request.GET.get('since') else None
+            since_id = UUID(request.GET['since_id']) if request.GET.get('since_id') else None
+        except ValueError:
+            return JsonResponse({'detail': 'Invalid timeout, since or since_id.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        feed_ids = await sync_to_async(self.get_followed_feed_ids)(user)
+        entries = await sync_to_async(self.get_entries_since)(feed_ids, since, since_id) if since else []
+        if not entries:
+            entry_ids = await EntryNotificationService().wait(feed_ids, timeout)
+            entries = await sync_to_async(self.get_entries)(entry_ids) if entry_ids else []
+        if not entries:
+            return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+        # the cursor is the last entry sent, not the clock, entries committed after this response are not skipped
+        last_create_time, last_entry_id = entries[-1]
+        return JsonResponse({
+            'entry_ids': [str(entry_id) for _, entry_id in entries],
+            'time': last_create_time.isoformat(),
+            'entry_id': str(last_entry_id),
+        })
+
+    @staticmethod
+    def authenticate(request):
+        drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            user = drf_request.user
+        except APIException:
+            return None
+        return user if user.is_authenticated else None
+
+    @staticmethod
+    def get_followed_feed_ids(user):
+        return list(RSSFeedFollower.objects.filter(user=user).values_list('feed_id', flat=True))
+
+    def get_entries_since(self, feed_ids, since, since_id=None):
+        """
+        Creation time and id of the entries created after the cursor, oldest first
+        """
+        query = Q(create_time__gt=since)
+        if since_id:
+            query |= Q(create_time=since, id__gt=since_id)
+        entries = Entry.objects.filter(query, feed_id__in=feed_ids).order_by('create_time', 'id')
+        return list(entries.values_list('create_time', 'id')[:self.max_entries])
+
+    @staticmethod
+    def get_entries(entry_ids):
+        return list(Entry.objects.filter(id__in=entry_ids).order_by('create_time', 'id').values_list('create_time', 'id'))
+
+
+class EntryCommentView(SparseFieldsetsMixin, ListModelMixin, CreateModelMixin, GenericViewSet):
+    queryset = EntryComment.objects.select_related('user')
     serializer_class = EntryCommentSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_fields = ('entry_id',)
+    pagination_class = KeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        """
+        ## Comments newest first, follow the `next` link to read older comments
+        """
+        return super().list(request, *args, **kwargs)
+
+
+class WebSubCallbackView(APIView):
+    """
+    Callback of WebSub hubs, it is called by hubs and not by users of API
+    """
+    permission_classes = (AllowAny,)
+    authentication_classes = ()
+    swagger_schema = None
+
+    def get(self, request, pk, *args, **kwargs):
+        """
+        ## Verification of intent: echo the challenge if we have asked for this subscription
+        """
+        subscription = get_object_or_404(WebSubSubscription.objects.select_related('feed'), pk=pk)
+        verified = WebSubService().verify(
+            subscription,
+            mode=request.query_params.get('hub.mode'),
+            topic=request.query_params.get('hub.topic'),
+            lease_seconds=request.query_params.get('hub.lease_seconds'),
+        )
+        if not verified:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(request.query_params.get('hub.challenge', ''), content_type='text/plain')
+
+    def post(self, request, pk, *args, **kwargs):
+        """
+        ## Content distribution: ingest pushed entries, content with an invalid signature is ignored
+        """
+        subscription = get_object_or_404(WebSubSubscription.objects.select_related('feed'), pk=pk)
+        WebSubService().ingest(
+            subscription,
+            body=request.body,
+            signature=request.headers.get('X-Hub-Signature'),
+            create_or_update_entries_function=EntryService().create_or_update,
+        )
+        # hubs must get a success status even when the signature is invalid
+        return HttpResponse(status=status.HTTP_202_ACCEPTED)
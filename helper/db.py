@@ -0,0 +1,144 @@
+import hashlib
+import os
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.backends.signals import connection_created
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PRIMARY_APP_LABELS = ('sessions',)  # a session is read right after it is created at login
+PINNED_CLIENT_KEY = 'db:pinned:{client}'
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+class ReplicaRouter:
+    """
+    Reads of safe API requests go to a random database of DATABASE_REPLICAS, ReplicaRoutingMiddleware decides which
+    requests. Writes and everything outside of those requests (celery tasks, management commands) use the primary
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _read_from_replica.get() and model._meta.app_label not in PRIMARY_APP_LABELS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the data of the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let GET, HEAD and OPTIONS requests read from replicas. A client which changed data reads from the primary for
+    REPLICA_STICKINESS_SECONDS so it sees its own writes (follow, bookmark, comment, ...) while replicas catch up.
+    Clients are told apart by their credentials, the JWT or the session cookie
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        client = self.get_client(request)
+        is_safe = request.method in SAFE_METHODS
+        token = _read_from_replica.set(is_safe and not (client and cache.get(PINNED_CLIENT_KEY.format(client=client))))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_from_replica.reset(token)
+
+        if not is_safe and client and response.status_code < 400:
+            cache.set(PINNED_CLIENT_KEY.format(client=client), True, settings.REPLICA_STICKINESS_SECONDS)
+        return response
+
+    @staticmethod
+    def get_client(request):
+        credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not credentials:
+            return None
+        return hashlib.sha256(credentials.encode()).hexdigest()
+
+
+# connections of this process, web and celery processes each keep their own persistent connections
+_connection_stats = {'created': 0, 'closed_unusable': 0}
+_connection_created_at = {}
+
+
+def _count_connection(sender, connection, **kwargs):
+    _connection_stats['created'] += 1
+    _connection_created_at[connection.alias] = connection.health_checked_at = time.time()
+
+
+connection_created.connect(_count_connection)
+
+
+def close_unusable_connections(**kwargs):
+    """
+    Close persistent connections the server dropped (restart, failover, pooler timeout) before a request or a task
+    reuses them, Django closes them only after a query failed. It is a no-op unless CONN_MAX_AGE keeps connections.
+    A connection is checked at most once per DATABASE_HEALTH_CHECK_INTERVAL, new connections are not checked
+    """
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    now = time.time()
+    for db_connection in connections.all():
+        if db_connection.connection is None or db_connection.in_atomic_block:
+            continue
+        if now - getattr(db_connection, 'health_checked_at', 0) < settings.DATABASE_HEALTH_CHECK_INTERVAL:
+            continue
+        if db_connection.is_usable():
+            db_connection.health_checked_at = now
+        else:
+            db_connection.close()
+            _connection_stats['closed_unusable'] += 1
+
+
+class DatabaseHealthCheckMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        close_unusable_connections()
+        return self.get_response(request)
+
+
+def get_connection_stats():
+    now = time.time()
+    stats = {
+        'pid': os.getpid(),
+        'connections_created': _connection_stats['created'],
+        'connections_closed_unusable': _connection_stats['closed_unusable'],
+        'connections': [
+            {
+                'alias': db_connection.alias,
+                'is_open': db_connection.connection is not None,
+                'age': round(now - _connection_created_at[db_connection.alias])
+                if db_connection.connection is not None and db_connection.alias in _connection_created_at else None,
+                'max_age': db_connection.settings_dict['CONN_MAX_AGE'],
+            }
+            for db_connection in connections.all()
+        ],
+        'server': None,
+    }
+    if connection.vendor == 'postgresql':
+        # connections of the database by state, through a pooler these are the connections of the pooler
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() GROUP BY 1"
+            )
+            stats['server'] = dict(cursor.fetchall())
+    return stats
+
@@ -16,3 +16,40 @@ class GetCustomSerializerClass:
                 % self.__class__.__name__
         )
         return self.serializer_class
+
+
+class SparseFieldsetsMixin:
+    """
+    Let clients pick the fields of GET responses with `fields` and `omit` query params, e.g. `?fields=id,title`.
+    Fields which are not requested are removed from the serializer, so they are never computed
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+
+    def _get_query_param_set(self, param):
+        request = getattr(self, 'request', None)
+        if request is None or not request.query_params.get(param):
+            return None
+        return set(request.query_params[param].split(','))
+
+    def get_requested_fields(self):
+        return self._get_query_param_set(self.fields_query_param)
+
+    def get_omitted_fields(self):
+        return self._get_query_param_set(self.omit_query_param) or set()
+
+    def is_field_requested(self, field_name) -> bool:
+        requested_fields = self.get_requested_fields()
+        if requested_fields is not None and field_name not in requested_fields:
+            return False
+        return field_name not in self.get_omitted_fields()
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        request = getattr(self, 'request', None)
+        if request is not None and request.method == 'GET':
+            fields = getattr(serializer, 'child', serializer).fields
+            for field_name in list(fields):
+                if not self.is_field_requested(field_name):
+                    fields.pop(field_name)
+        return serializer
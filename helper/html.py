@@ -0,0 +1,126 @@
+import re
+from html import escape, unescape
+from html.parser import HTMLParser
+
+ALLOWED_TAGS = {
+    'a', 'abbr', 'b', 'blockquote', 'br', 'caption', 'cite', 'code', 'dd', 'del', 'div', 'dl', 'dt', 'em',
+    'figcaption', 'figure', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'ins', 'li', 'ol', 'p', 'pre',
+    'q', 's', 'small', 'span', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'u',
+    'ul',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'abbr': {'title'},
+    'img': {'src', 'alt', 'title', 'width', 'height'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+}
+URL_ATTRIBUTES = {'href', 'src'}
+ALLOWED_URL_SCHEMES = ('http', 'https', 'mailto')
+VOID_TAGS = {'br', 'hr', 'img'}
+DROPPED_CONTENT_TAGS = {'script', 'style', 'iframe', 'object', 'noscript', 'template'}
+BLOCK_TAGS = {
+    'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'p',
+    'pre', 'td', 'th', 'tr',
+}
+WORD_RE = re.compile(r'\w+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class HTMLSanitizer(HTMLParser):
+    """
+    Allowlist sanitizer, tags and attributes which are not allowed are dropped but their text is kept,
+    except the content of script-like tags. Open tags are closed at the end of the document, a script-like tag the feed
+    never closes ends with the tag it is nested in
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.output = []
+        self.text = []
+        self.open_tags = []
+        self.dropped_tags = []  # script-like tags being dropped, with the number of tags open around them
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_CONTENT_TAGS:
+            self.dropped_tags.append((tag, len(self.open_tags)))
+            return
+        if self.dropped_tags:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(' ')
+        if tag not in ALLOWED_TAGS:
+            return
+        allowed_attributes = ALLOWED_ATTRIBUTES.get(tag, set())
+        attributes = ''.join(
+            f' {name}="{escape(value, quote=True)}"'
+            for name, value in attrs
+            if name in allowed_attributes and value is not None and self._is_safe(name, value)
+        )
+        self.output.append(f'<{tag}{attributes}>')
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in DROPPED_CONTENT_TAGS:
+            return  # self-closing, it has no content to drop
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.dropped_tags:
+            dropped_tag, depth = self.dropped_tags[-1]
+            if tag == dropped_tag:
+                self.dropped_tags.pop()
+                return
+            if tag not in self.open_tags[:depth]:
+                return
+            self.dropped_tags.clear()  # a tag around the dropped ones ends, they were never closed
+        if tag in DROPPED_CONTENT_TAGS:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append(' ')
+        if tag not in self.open_tags:
+            return
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.output.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropped_tags:
+            return
+        self.output.append(escape(data, quote=False))
+        self.text.append(data)
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.output.append(f'</{self.open_tags.pop()}>')
+
+    @staticmethod
+    def _is_safe(name, value) -> bool:
+        if name not in URL_ATTRIBUTES:
+            return True
+        # browsers ignore control characters and whitespace in schemes, e.g. `java\tscript:`
+        url = WHITESPACE_RE.sub('', unescape(value)).lower()
+        scheme, separator, _ = url.partition(':')
+        if not separator or '/' in scheme:
+            return True  # relative URL
+        return scheme in ALLOWED_URL_SCHEMES
+
+
+def sanitize(content):
+    """
+    Returns the sanitized HTML and the plain text of the content
+    """
+    sanitizer = HTMLSanitizer()
+    sanitizer.feed(content or '')
+    sanitizer.close()
+    return ''.join(sanitizer.output), WHITESPACE_RE.sub(' ', ''.join(sanitizer.text)).strip()
+
+
+def count_words(text) -> int:
+    return len(WORD_RE.findall(text))
@@ -1,7 +1,90 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 50
     page_size_query_param = 'page_size'
     max_page_size = 1000
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Forward only keyset (seek) pagination, pages are read with a range condition on the values of `ordering`
+    of the last item instead of an offset, so deep pages cost the same as the first one.
+    The last field of `ordering` must be unique, `get_ordering` can pick the ordering by queryset
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = ('-create_time', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.request = request
+        self.ordering = self.get_ordering(request, queryset, view)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(self.get_seek_filter(cursor))
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def get_seek_filter(self, cursor):
+        """
+        (a, b) < (x, y) is written as a < x OR (a = x AND b < y), which works for mixed directions
+        """
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            field_name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal_lookups = {previous.lstrip('-'): cursor[i] for i, previous in enumerate(self.ordering[:index])}
+            conditions.append(Q(**equal_lookups, **{f'{field_name}__{lookup}': cursor[index]}))
+        return reduce(lambda left, right: left | right, conditions)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last_item = self.page[-1]
+        cursor = [getattr(last_item, field.lstrip('-')) for field in self.ordering]
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(cursor))
+
+    def get_previous_link(self):
+        return None
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(cursor, list) or len(cursor) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, cursor):
+        values = [value.isoformat() if isinstance(value, datetime) else str(value) for value in cursor]
+        return urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
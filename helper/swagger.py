@@ -1,4 +1,17 @@
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
 from drf_yasg.inspectors import SwaggerAutoSchema
+from drf_yasg.renderers import _SpecRenderer
+from drf_yasg.views import get_schema_view
+from rest_framework.request import Request
+
+from .drf import SparseFieldsetsMixin
 
 
 class CompoundTagsSchema(SwaggerAutoSchema):
@@ -6,3 +19,81 @@ class CompoundTagsSchema(SwaggerAutoSchema):
         if operation_keys is None:
             return []
         return [' > '.join(operation_keys[:-1])]
+
+    def get_query_parameters(self):
+        parameters = super().get_query_parameters()
+        if isinstance(self.view, SparseFieldsetsMixin) and self.method == 'GET':
+            parameters += [
+                openapi.Parameter(
+                    'fields', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Comma separated fields to return"
+                ),
+                openapi.Parameter(
+                    'omit', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Comma separated fields to leave out"
+                ),
+            ]
+        return parameters
+
+
+class CachedSchemaGenerator(OpenAPISchemaGenerator):
+    """
+    The public schema is the same for every user, so it is generated once and its encodings are kept in the cache
+    with their ETags. `url` is empty by default so the host of the request which builds it is not written into it
+    """
+    CACHE_KEY = 'swagger:schema:{version}:{codec}'
+    CODECS = {'json': OpenAPICodecJson, 'yaml': OpenAPICodecYaml}
+
+    def __init__(self, info, version='', url='', patterns=None, urlconf=None):
+        super().__init__(info, version, url, patterns, urlconf)
+
+    def get_document(self, codec):
+        """
+        Returns the ETag and the encoded schema, the schema is generated when the cache has none
+        """
+        document = cache.get(self.CACHE_KEY.format(version=self.version, codec=codec))
+        if document is None:
+            document = self.build(codecs=(codec,))[codec]
+        return document
+
+    def build(self, codecs=tuple(CODECS)):
+        """
+        Generate the schema and store its encodings in the cache, `build_api_schema` runs it on deploy
+        """
+        # views read the request while they are introspected, an empty one is enough as the schema is public
+        schema = self.get_schema(request=Request(HttpRequest()), public=True)
+        documents = {}
+        for codec in codecs:
+            content = self.CODECS[codec](validators=[]).encode(schema)
+            documents[codec] = (f'"{hashlib.sha256(content).hexdigest()}"', content)
+        cache.set_many(
+            {self.CACHE_KEY.format(version=self.version, codec=codec): document for codec, document in documents.items()},
+            timeout=None,
+        )
+        return documents
+
+
+def get_cached_schema_view(info, **kwargs):
+    """
+    get_schema_view of drf_yasg whose schema documents are read from CachedSchemaGenerator and support
+    If-None-Match. UI pages are rendered as before, they introspect no views and load the schema with another request
+    """
+    schema_view = get_schema_view(info, public=True, generator_class=CachedSchemaGenerator, **kwargs)
+
+    class CachedSchemaView(schema_view):
+        def get(self, request, version='', format=None):
+            renderer = request.accepted_renderer
+            if not isinstance(renderer, _SpecRenderer):
+                return super().get(request, version, format)
+            codec = 'yaml' if issubclass(renderer.codec_class, OpenAPICodecYaml) else 'json'
+            etag, content = self.get_generator(request.version or version or '').get_document(codec)
+            response = get_conditional_response(request, etag=etag) or HttpResponse(
+                content, content_type=f'{renderer.media_type}; charset={renderer.charset}'
+            )
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)  # clients revalidate with the ETag
+            return response
+
+        @classmethod
+        def get_generator(cls, version=''):
+            return cls.generator_class(info, version)
+
+    return CachedSchemaView
@@ -5,3 +5,11 @@ def generate_list_schema_schema(object_schema):
         'count': {'type': 'integer', 'required': True},
         'results': {'type': 'list', 'schema': {'type': 'dict', 'schema': object_schema}}
     }
+
+
+def generate_keyset_list_schema_schema(object_schema):
+    return {
+        'next': {'type': 'string', 'required': True, 'nullable': True},
+        'previous': {'type': 'string', 'required': True, 'nullable': True},
+        'results': {'type': 'list', 'schema': {'type': 'dict', 'schema': object_schema}}
+    }
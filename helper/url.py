@@ -0,0 +1,25 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+DEFAULT_PORTS = (80, 443)
+TRACKING_QUERY_PARAM_PREFIXES = ('utm_',)
+
+
+def canonicalize_url(url) -> str:
+    """
+    Key to compare URLs that point to the same resource, it is not a URL to fetch.
+    Scheme, default port, fragment, trailing slash, case of the host and tracking query params are dropped,
+    e.g. `HTTP://Example.com:80/feed/?utm_source=x` and `https://example.com/feed` give `example.com/feed`
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port not in DEFAULT_PORTS:
+        host = f'{host}:{port}'
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_QUERY_PARAM_PREFIXES)
+    ))
+    return host + parts.path.rstrip('/') + (f'?{query}' if query else '')
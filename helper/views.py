@@ -0,0 +1,15 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from helper.db import get_connection_stats
+
+
+class DatabaseStatsView(APIView):
+    """
+    Connection statistics of the process which serves the request and of the database server, for admins
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_connection_stats())
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rss_reader.settings')
 
 application = get_asgi_application()
+
+if settings.DEBUG:
+    # static files of the admin and swagger, like runserver serves them in development
+    application = ASGIStaticFilesHandler(application)
@@ -1,9 +1,17 @@
 import os
 
 from celery import Celery
+from celery.signals import task_prerun
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rss_reader.settings')
 
 app = Celery('rss_reader')
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+
+@task_prerun.connect
+def check_database_connections(**kwargs):
+    # persistent connections of the worker are kept between tasks for CONN_MAX_AGE
+    from helper.db import close_unusable_connections
+    close_unusable_connections()
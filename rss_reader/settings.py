@@ -48,8 +48,21 @@ MY_APPS = [
 ]
 INSTALLED_APPS = DJANGO_APP + MY_APPS
 
+# Celery workers and beat run with DJANGO_PROCESS_PROFILE=worker, they leave out apps only the API uses to start faster
+PROCESS_PROFILE = os.environ.get('DJANGO_PROCESS_PROFILE', 'web')
+API_ONLY_APPS = (
+    'django.contrib.admin',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'drf_yasg',
+    'rest_framework_simplejwt',
+    'django_filters',
+)
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'helper.db.DatabaseHealthCheckMiddleware',
+    'helper.db.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,6 +73,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'rss_reader.urls'
 
+if PROCESS_PROFILE == 'worker':
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in API_ONLY_APPS]
+    ROOT_URLCONF = 'rss_reader.worker_urls'  # celery runs the system checks, which import the URLconf
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -88,7 +105,33 @@ DATABASES = {
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': os.environ.get('POSTGRES_HOST'),
-        'PORT': 5432,
+        'PORT': int(os.environ.get('POSTGRES_PORT', 5432)),
+        # connections are kept this many seconds by web and celery processes, 0 opens one per request or task
+        'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),
+        # set when HOST is a pooler in transaction mode (e.g. pgbouncer), server side cursors need a session
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_POOLER_TRANSACTION_MODE', 'false').lower() == 'true',
+    }
+}
+# persistent connections are checked before a request or a task reuses them
+DATABASE_HEALTH_CHECKS = os.environ.get('POSTGRES_CONN_HEALTH_CHECKS', 'true').lower() == 'true'
+DATABASE_HEALTH_CHECK_INTERVAL = int(os.environ.get('POSTGRES_CONN_HEALTH_CHECK_INTERVAL', 30))  # second
+
+# Read replicas of the database, comma separated hosts. Safe API requests read from them, see helper.db
+DATABASE_REPLICAS = []
+for index, replica_host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': replica_host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{index}')
+DATABASE_ROUTERS = ['helper.db.ReplicaRouter']
+# a client reads from the primary for this long after it changed data
+REPLICA_STICKINESS_SECONDS = int(os.environ.get('REPLICA_STICKINESS_SECONDS', 10))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': "redis://" + os.environ.get("REDIS_LOCATION"),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
     }
 }
 
@@ -159,7 +202,35 @@ CELERY_RESULT_BACKEND = "redis://" + os.environ.get("REDIS_LOCATION")
 
 CELERY_BEAT_SCHEDULE = {
     'update-rss-feeds': {
-        'task': 'apps.rss.tasks.update_feeds',
+        'task': 'apps.rss.tasks.dispatch_feeds',  # feeds are refreshed on feeds-high, feeds-default and feeds-low queues
         'schedule': os.environ.get("UPDATE_RSS_FEED_PERIOD", 1800)  # second
     },
+    'renew-websub-subscriptions': {
+        'task': 'apps.rss.tasks.renew_websub_subscriptions',
+        'schedule': os.environ.get("RENEW_WEBSUB_PERIOD", 3600)  # second
+    },
+    'archive-old-entries': {
+        'task': 'apps.rss.tasks.archive_entries',
+        'schedule': os.environ.get("ARCHIVE_ENTRIES_PERIOD", 86400)  # second
+    },
 }
+
+TIMELINE_CACHE_TIMEOUT = int(os.environ.get('TIMELINE_CACHE_TIMEOUT', 300))  # second
+
+# Failing feeds are retried with exponential backoff up to this many hours, hosts whose feeds fail one after another
+# are not fetched for a cooldown
+FEED_BACKOFF_MAX_HOURS = int(os.environ.get('FEED_BACKOFF_MAX_HOURS', 24))
+HOST_CIRCUIT_BREAKER_THRESHOLD = int(os.environ.get('HOST_CIRCUIT_BREAKER_THRESHOLD', 5))
+HOST_CIRCUIT_BREAKER_COOLDOWN = int(os.environ.get('HOST_CIRCUIT_BREAKER_COOLDOWN', 1800))  # second
+
+# Processes a celery worker parses downloaded feeds in, 0 fetches and parses feeds one by one. The worker must be able
+# to start child processes, e.g. `celery worker -P threads`, children of the prefork pool can not
+RSS_PARSE_POOL_SIZE = int(os.environ.get('RSS_PARSE_POOL_SIZE', 0))
+
+# Entries older than this many days are moved to the archive table, unless the feed sets its own retention
+ENTRY_RETENTION_DAYS = int(os.environ.get('ENTRY_RETENTION_DAYS', 365))
+
+# WebSub (PubSubHubbub), push subscriptions are disabled when the public callback URL is not set
+WEBSUB_CALLBACK_BASE_URL = os.environ.get('WEBSUB_CALLBACK_BASE_URL')
+WEBSUB_LEASE_SECONDS = int(os.environ.get('WEBSUB_LEASE_SECONDS', 864000))
+WEBSUB_QUIET_HOURS = int(os.environ.get('WEBSUB_QUIET_HOURS', 24))  # polling resumes after this much silence
@@ -16,10 +16,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include, re_path
 from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
 from rest_framework.permissions import IsAuthenticated
 
-schema_view = get_schema_view(
+from helper.swagger import get_cached_schema_view
+from helper.views import DatabaseStatsView
+
+# the schema is generated once and served from the cache, `python manage.py build_api_schema` rebuilds it
+schema_view = get_cached_schema_view(
     openapi.Info(
         title="RSS Reader",
         default_version='v1',
@@ -28,7 +31,6 @@ schema_view = get_schema_view(
         contact=openapi.Contact(email="rasoul.rostami.dev@gmail.com"),
         license=openapi.License(name="BSD License"),
     ),
-    public=True,
     permission_classes=(IsAuthenticated,),
 )
 
@@ -39,6 +41,7 @@ urlpatterns = [
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 
     path('admin/', admin.site.urls),
+    path('api/v1/admin/db-stats/', DatabaseStatsView.as_view(), name='db-stats'),
     path('api/v1/account/', include('apps.account.urls', namespace='account')),
     path('api/v1/rss/', include('apps.rss.urls', namespace='rss')),
 ]
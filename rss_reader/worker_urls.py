@@ -0,0 +1,21 @@
+"""
+URLconf of the worker profile, it has only the routes workers reverse (e.g. WebSub callbacks) so workers do not
+import the API. Views are imported when they are called, which never happens in a worker
+"""
+from django.urls import path, include
+from django.utils.module_loading import import_string
+
+
+def lazy_view(view_path):
+    def view(request, *args, **kwargs):
+        return import_string(view_path).as_view()(request, *args, **kwargs)
+    return view
+
+
+rss_urls = [
+    path('websub/<uuid:pk>/', lazy_view('apps.rss.views.WebSubCallbackView'), name='websub-callback'),
+]
+
+urlpatterns = [
+    path('api/v1/rss/', include((rss_urls, 'rss'), namespace='rss')),
+]